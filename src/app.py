@@ -1,11 +1,22 @@
 from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from routers import auth, users, organizations, relief, foundations, volunteers, inkind, monetary, headlines, reports
+import os
+import asyncio
+import logging
+from routers import auth, users, organizations, relief, foundations, volunteers, inkind, monetary, headlines, reports, metrics
 from util.scheduler.schedule import sched
+from util.pagination import NEXT_CURSOR_HEADER
+from services.storage.backends import get_storage_backend, local_storage_mount
+from services.email.email_handler import close_http_client
+from services.email.outbox import outbox_worker
+from services.email.template_registry import email_templates
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # cache_opts = {
 #     'cache.type': 'file',
 #     'cache.data_dir' : '/tmp/cache/data',
@@ -28,6 +39,7 @@ api_app.include_router(inkind.router)
 api_app.include_router(monetary.router)
 api_app.include_router(headlines.router)
 api_app.include_router(reports.router)
+api_app.include_router(metrics.router)
 
 app = FastAPI(title="main app")
 
@@ -36,9 +48,34 @@ app.add_middleware(
 	allow_origins=["*"], # Allows all origins
 	allow_credentials=True,
 	allow_methods=["*"], # Allows all methods
-	allow_headers=["*"] # Allows all headers
+	allow_headers=["*"], # Allows all headers
+	expose_headers=[NEXT_CURSOR_HEADER] # lets clients read the cursor of the next page
 )
 
 app.mount("/api", api_app)
 
+# files of the local storage backend are served by the app itself
+local_storage = local_storage_mount()
+if local_storage is not None:
+    app.mount(local_storage[0], StaticFiles(directory=local_storage[1]), name="files")
+
+@app.on_event("startup")
+async def startup_event():
+    email_templates.compile_all()
+
+    # an unreachable store is retried on first use rather than failing startup
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, get_storage_backend().prepare)
+    except Exception:
+        logger.exception("Error preparing the file store.")
+
+    # EMAIL_OUTBOX_WORKER=false leaves sending to other processes
+    if os.environ.get("EMAIL_OUTBOX_WORKER", "true").lower() == "true":
+        outbox_worker.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await outbox_worker.stop()
+    await close_http_client()
+
 sched.start()
\ No newline at end of file
@@ -6,8 +6,11 @@ from datetime import datetime
 from pydantic import ValidationError
 import os
 # user generated
-from services.db.database import Session
+from services.db.database import Session, AsyncSession
 from services.db.models import User
+from services.payment.payment_handler import PaymentHandler
+from services.reports.reports_handler import ReportsHandler
+from services.counters.counter_handler import CounterHandler
 # from services.storage.cache_handler import CacheHandler
 from services.email.email_handler import EmailHandler
 from services.email.relief_email_handler import ReliefEmailHandler
@@ -16,12 +19,30 @@ from services.email.code_email_handler import CodeEmailHandler
 from services.log.log_handler import LoggingService
 from services.storage.file_handler import FileHandler
 from models.auth_details import AuthDetails
+from util.auth.principal_cache import principal_cache
+from sqlalchemy import select
 import jwt
 
 # dependencies go here
 
-async def get_db_session():
-    return Session()
+def get_db_session():
+    db = Session()
+    try:
+        yield db
+    except Exception:
+        # discard pending changes so the connection returns clean to the pool
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def get_async_db_session():
+    async with AsyncSession() as db:
+        try:
+            yield db
+        except Exception:
+            await db.rollback()
+            raise
 
 # async def get_cache_handler():
 #     return CacheHandler()
@@ -44,6 +65,15 @@ def get_logger():
 def get_file_handler():
     return FileHandler()
 
+def get_payment_handler(db: Session = Depends(get_db_session)):
+    return PaymentHandler(db)
+
+def get_reports_handler(db: Session = Depends(get_db_session)):
+    return ReportsHandler(db)
+
+def get_counter_handler(db: Session = Depends(get_db_session)):
+    return CounterHandler(db)
+
 reuseable_oauth = OAuth2PasswordBearer(
         tokenUrl="auth/login",
         scheme_name="JWT"
@@ -69,14 +99,30 @@ async def get_current_user(token: str = Depends(reuseable_oauth)) -> AuthDetails
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    db = await get_db_session()
-    
-    user:User = db.query(User).filter(User.username==payload['sub']).first()
-    
-    if user is None:
+    # the level in the token may be stale, so the current one is taken from the principal cache
+    user_id = payload.get('uid')
+    version = payload.get('ver') or 0
+    if user_id is not None:
+        # a token newer than the cached user means the cache is behind
+        principal = await principal_cache.get(user_id, version)
+    else:
+        # tokens issued before user ids were added to them
+        async with AsyncSession() as db:
+            user = (await db.execute(select(User.id, User.username, User.level, User.token_version).filter(User.username == payload['sub'], User.is_deleted == False))).first()
+        user_id, principal = (None, None) if user is None else (user.id, (user.username, user.level, user.token_version))
+
+    if principal is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Could not find user",
         )
-    
-    return AuthDetails(user.id, user.username, user.level)
\ No newline at end of file
+
+    username, level, token_version = principal
+    if version < token_version:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return AuthDetails(user_id, username, level)
\ No newline at end of file
@@ -1,14 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Response
+from typing import Annotated
+from fastapi import APIRouter, Depends, HTTPException, status, Response, Request
 from fastapi.security import OAuth2PasswordRequestForm
+from dependencies import get_db_session
 from services.db.database import Session
 from services.db.models import User, VerificationCode
 from services.email.code_email_handler import CodeEmailHandler
-from util.auth.jwt_util import (
-    get_hashed_password,
-    verify_password,    
-    create_access_token,
-    create_refresh_token
-)
+from util.auth.jwt_util import create_access_token
+from util.auth.password_hasher import hash_password, check_password, needs_rehash
+from util.auth.login_throttle import ip_throttle, username_throttle, client_ip
+from util.auth.principal_cache import principal_cache
+from util.auth.refresh_tokens import refresh_tokens, InvalidRefreshToken
 from util.code_generator import generate_code
 from pydantic import BaseModel
 from datetime import datetime, timedelta
@@ -29,8 +30,11 @@ router = APIRouter(
 class ForgotPasswordDTO(BaseModel):
     email:str
 
+class RefreshTokenDTO(BaseModel):
+    refresh_token:str
+
 code_email_handler = CodeEmailHandler()
-db = Session()
+DB = Annotated[Session, Depends(get_db_session)]
 
 
 # user levels
@@ -41,32 +45,90 @@ db = Session()
 # 4 - Admin/Moderator
 
 @router.post('/login', summary="Create access and refresh tokens for user")
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login(db: DB, request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
     """
     Signs user in. Returns JWT token.
     """
-    user:User = db.query(User).filter(User.username==form_data.username).first()
-    if user is None:
+    ip = client_ip(request)
+    username = form_data.username.lower()
+
+    # throttled before any hashing so a flood of guesses costs no CPU
+    retry_after = max(ip_throttle.retry_after(ip), username_throttle.retry_after(username))
+    if retry_after > 0:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Incorrect username or password"
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many failed login attempts. Try again later.",
+            headers={"Retry-After" : str(int(retry_after) + 1)}
         )
 
-    hashed_pass = user.password
-    if not verify_password(form_data.password, hashed_pass):
+    user:User = db.query(User).filter(User.username==form_data.username).first()
+    if user is None or not await check_password(form_data.password, user.password):
+        ip_throttle.record_failure(ip)
+        username_throttle.record_failure(username)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Incorrect username or password"
         )
-    
+
+    username_throttle.reset(username)
+
+    # upgrade hashes made with an older cost factor while the password is at hand
+    if needs_rehash(user.password):
+        user.password = await hash_password(form_data.password)
+
+    refresh_token = refresh_tokens.issue(db, user.id, user.username, user.level)
+    db.commit()
+
     return {
-        "access_token": create_access_token(user.username, user.level),
-        "refresh_token": create_refresh_token(user.username, user.level),
+        "access_token": create_access_token(user.username, user.level, user_id=user.id, version=user.token_version),
+        "refresh_token": refresh_token,
         "user_id" : user.id
     }
 
+@router.post('/refresh', summary="Exchange a refresh token for new access and refresh tokens")
+async def refresh(db: DB, body: RefreshTokenDTO):
+    """
+    Rotates refresh token. Returns new JWT token and refresh token; the given refresh token can no longer be used.
+    """
+    try:
+        user_id, family = refresh_tokens.rotate(db, body.refresh_token)
+    except InvalidRefreshToken as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e),
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
+    # the token may outlive the user or carry a stale level
+    principal = await principal_cache.get(user_id)
+    if principal is None:
+        refresh_tokens.revoke_family(db, family)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not find user",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
+    username, level, token_version = principal
+    refresh_token = refresh_tokens.issue(db, user_id, username, level, family)
+    db.commit()
+
+    return {
+        "access_token": create_access_token(username, level, user_id=user_id, version=token_version),
+        "refresh_token": refresh_token,
+        "user_id" : user_id
+    }
+
+@router.post('/logout', summary="Revoke refresh token")
+async def logout(db: DB, body: RefreshTokenDTO, response: Response):
+    """
+    Signs user out. Revokes the refresh token and every token rotated with it.
+    """
+    refresh_tokens.revoke(db, body.refresh_token)
+    response.status_code = status.HTTP_204_NO_CONTENT
+
 @router.post("/forgot-password")
-async def forgot_password(email: ForgotPasswordDTO):
+async def forgot_password(db: DB, email: ForgotPasswordDTO):
     """
     Requests for verification code for password reset
     """
@@ -83,10 +145,11 @@ async def forgot_password(email: ForgotPasswordDTO):
     vcode_req = VerificationCode(code=code,reason="PASSWORD-RESET",user_id=user.id,expired_at=datetime.utcnow() + timedelta(minutes=30))
     print(vcode_req.reason)
     db.add(vcode_req)
-    db.commit()
 
-    # send email
-    resp = await code_email_handler.send_password_reset_code(email.email, f'{user.first_name} {user.last_name}', code)
+    # send email, queued in the same transaction as the code
+    await code_email_handler.send_password_reset_code(email.email, f'{user.first_name} {user.last_name}', code, db=db)
+
+    db.commit()
 
     return 'Success'
 
@@ -96,7 +159,7 @@ class VerifyCodeModel(BaseModel):
 
 # verify code
 @router.get("/verify-code", summary="Checks if entered code is valid. Returns user id (securely store then use in /reset-password).")
-async def verify_code(email:str, code:str, response:Response):
+async def verify_code(db: DB, email:str, code:str, response:Response):
     """
     Verifies code
     """
@@ -118,7 +181,7 @@ class PasswordResetModel(BaseModel):
     confirm_password: str
 
 @router.patch("/reset-password", summary="Resets user's password.")
-async def reset_password(body:PasswordResetModel, response:Response):
+async def reset_password(db: DB, body:PasswordResetModel, response:Response):
     """
     Resets password of user
     """
@@ -139,10 +202,15 @@ async def reset_password(body:PasswordResetModel, response:Response):
         )
 
     user:User = db.query(User).filter(User.id == body.id).first()
-    user.password = get_hashed_password(body.password)
+    user.password = await hash_password(body.password)
     user.updated_at = datetime.now()
     db.delete(code)
+
+    # sessions started with the old password end with it
+    refresh_tokens.revoke_user(db, user.id)
+    user.token_version = User.token_version + 1
     db.commit()
+    principal_cache.invalidate(user.id)
     response.status_code = status.HTTP_202_ACCEPTED
     return {} # code should be sent again to allow change password functionality
 
@@ -162,7 +230,7 @@ async def login_google():
     }
 
 @router.get("/auth/google")
-def auth_google(code: str, prompt:str):
+def auth_google(db: DB, code: str, prompt:str):
     """
     Authenticates user account
     """
@@ -200,5 +268,5 @@ def auth_google(code: str, prompt:str):
     # generate token from details
     return {
         "userInfo" : user_info,
-        "token" : create_access_token(user.username, user.level)
+        "token" : create_access_token(user.username, user.level, user_id=user.id, version=user.token_version)
     }
@@ -1,6 +1,6 @@
 from typing import Annotated, List
 from fastapi import APIRouter, Depends, HTTPException, status, Response, Body, Form
-from dependencies import get_current_user
+from dependencies import get_current_user, get_db_session
 from services.db.database import Session
 from services.db.models import Organization, SponsorshipRequest, User
 from services.email.organization_email_handler import OrganizationEmailHandler
@@ -8,6 +8,7 @@ from services.email.foundation_email_handler import FoundationEmailHandler
 from services.storage.file_handler import FileHandler
 from models.auth_details import AuthDetails
 from util.auth.auth_tool import authorize
+from util.pagination import paginate, set_next_cursor
 from pydantic import BaseModel
 from datetime import datetime
 from sqlalchemy import and_
@@ -18,27 +19,30 @@ router = APIRouter(
     dependencies=[]
 )
 
-db = Session()
+DB = Annotated[Session, Depends(get_db_session)]
 foundation_email_handler = FoundationEmailHandler()
 file_handler = FileHandler()
 
 # NOTE: foundations are organizations with tier level 2
 
 @router.get("/")
-async def retrieve_foundations(p: int = 1, c: int = 10):
+async def retrieve_foundations(db: DB, res: Response, p: int = 1, c: int = 10, cursor: str = None):
     """
     Retrieve foundations.
     """
 
     # Get list of active organizations from database
-    orgs: List[Organization] = db.query(Organization).filter(and_(Organization.is_active == True, Organization.tier == 2)).limit(c).offset((p-1)*c).all()
+    orgs: List[Organization] = paginate(db.query(Organization).filter(and_(Organization.is_active == True, Organization.tier == 2)), Organization, p, c, cursor).all()
+    set_next_cursor(res, orgs, c)
 
     # Initialize empty list to store retrieved data
     to_return = []
 
+    profile_links = await file_handler.get_org_profiles([org.id for org in orgs], 'thumbnail')
+
     # Extract necessary data and generate profile links for each organization
     for org in orgs:
-        profile_link = await file_handler.get_org_profile(org.id)
+        profile_link = profile_links[org.id]
         to_return.append({
             "id": org.id,
             "owner_id": org.owner_id,
@@ -52,7 +56,7 @@ async def retrieve_foundations(p: int = 1, c: int = 10):
     return to_return
 
 @router.get("/{id}")
-async def retrieve_foundation(id:int):
+async def retrieve_foundation(db: DB, id:int):
     """
     Retrieve foundation with `id`
     """
@@ -92,7 +96,7 @@ async def retrieve_foundation(id:int):
 #     return sponsored_orgs
 
 @router.get("/{foundation_id}/sponsored/users")
-def retrieve_sponsored_users(foundation_id:int, p: int = 1, c: int = 10):
+def retrieve_sponsored_users(db: DB, foundation_id:int, p: int = 1, c: int = 10):
     """
     Retrieve sponsored users of a foundation
     """
@@ -100,7 +104,7 @@ def retrieve_sponsored_users(foundation_id:int, p: int = 1, c: int = 10):
     return sponsored_users
 
 @router.get("/{id}/sponsored/requests")
-def retrieve_sponsorship_request(id:int, res:Response, f:str = None, user: AuthDetails = Depends(get_current_user)):
+def retrieve_sponsorship_request(db: DB, id:int, res:Response, f:str = None, user: AuthDetails = Depends(get_current_user)):
     """
     Retrieve sponsorship request
     """
@@ -137,7 +141,7 @@ class sponsorshipRequestDTO(BaseModel):
     action: str
 
 @router.patch("/{id}/user")
-async def resolve_user_sponsorship_request(id:int, body:sponsorshipRequestDTO, res:Response, user: AuthDetails = Depends(get_current_user)):
+async def resolve_user_sponsorship_request(db: DB, id:int, body:sponsorshipRequestDTO, res:Response, user: AuthDetails = Depends(get_current_user)):
     """
     resolves user sponsorship request. Updates user's sponsor id on success.
     """
@@ -161,20 +165,20 @@ async def resolve_user_sponsorship_request(id:int, body:sponsorshipRequestDTO, r
             sponsorship_request.status = 'APPROVED'
             sponsorship_request.updated_at = datetime.now()
 
-            db.commit()
-
             foundation_name = db.query(Organization.name).filter(Organization.id == sponsorship_request.foundation_id).first()
 
-            foundation_email_handler.send_upgrade_approval_notice(_user.first_name, _user.email, foundation_name)
+            await foundation_email_handler.send_upgrade_approval_notice(_user.first_name, _user.email, foundation_name, db=db)
+
+            db.commit()
         case 'reject':
             sponsorship_request.status = 'REJECTED'
             sponsorship_request.updated_at = datetime.now()
-            
-            db.commit()
 
             foundation_name = db.query(Organization.name).filter(Organization.id == sponsorship_request.foundation_id).first()
-            
-            foundation_email_handler.send_upgrade_rejection_notice(_user.first_name, _user.email, foundation_name)
+
+            await foundation_email_handler.send_upgrade_rejection_notice(_user.first_name, _user.email, foundation_name, db=db)
+
+            db.commit()
             return {'detail' : 'Rejected sponsorship request'}
         case _:
             res.status_code = 406
@@ -1,11 +1,12 @@
 from typing import Annotated
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Response
 
-from dependencies import get_db_session, get_logger
-from services.db.database import Session
+from dependencies import get_db_session, get_async_db_session, get_logger
+from services.db.database import Session, AsyncSession
 from services.headlines.recent import fetch
 from services.generated.relief_template import generated_relief
 from services.generated.use_relief import use_generated_relief
+from util.pagination import NEXT_CURSOR_HEADER
 
 router = APIRouter(
     prefix="/headlines",
@@ -14,10 +15,16 @@ router = APIRouter(
 )
 
 DB = Annotated[Session, Depends(get_db_session)]
+AsyncDB = Annotated[AsyncSession, Depends(get_async_db_session)]
 
 @router.get("/recent-disaster")
-async def retrieve_disaster_headlines(db: DB, p: int = 1, c: int = 10):
-    return fetch(db, p, c)
+async def retrieve_disaster_headlines(db: AsyncDB, res: Response, p: int = 1, c: int = 10, cursor: str = None):
+    headlines, next_cursor = await fetch(db, p, c, cursor)
+
+    if next_cursor is not None:
+        res.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+    return headlines
 
 @router.get("/generated-relief-effort")
 async def retrieve_generated_reliefs(db: DB, p: int = 1, c: int = 10):
@@ -1,12 +1,14 @@
 from typing import Annotated, List
 from fastapi import APIRouter, Depends, HTTPException, status, Response
 from pydantic import BaseModel
-from dependencies import get_current_user
+from dependencies import get_current_user, get_db_session, get_counter_handler
 from services.db.database import Session
-from services.db.models import Organization, InkindDonation, InkindDonationRequirement, ReliefEffort
+from services.db.models import Organization, InkindDonation, InkindDonationRequirement, ReliefEffort, RequirementCounter
+from services.counters.counter_handler import CounterHandler
 from sqlalchemy import and_
 from models.auth_details import AuthDetails
 from util.auth.auth_tool import authorize, is_authorized
+from util.pagination import paginate, set_next_cursor
 from datetime import date, datetime
 
 router = APIRouter(
@@ -15,7 +17,8 @@ router = APIRouter(
     dependencies=[]
 )
 
-db = Session()
+DB = Annotated[Session, Depends(get_db_session)]
+Counters = Annotated[CounterHandler, Depends(get_counter_handler)]
 
 class InKind(BaseModel):
     name: str
@@ -27,7 +30,7 @@ class Pledge(BaseModel):
     amount: int
 
 @router.get("/donations/{relief_id}")
-async def get_inkind_donations(relief_id: int, res: Response, p: int = 1, c: int = 10, status:str = "all", user:AuthDetails = Depends(get_current_user)): 
+async def get_inkind_donations(db: DB, relief_id: int, res: Response, p: int = 1, c: int = 10, cursor: str = None, status:str = "all", user:AuthDetails = Depends(get_current_user)): 
     """
     Get list of inkind donations for relief `relief_id`
     """
@@ -45,7 +48,7 @@ async def get_inkind_donations(relief_id: int, res: Response, p: int = 1, c: int
         )
 
     # check authorization
-    if is_authorized(reliefEffort.owner_id, reliefEffort.owner_type, user, db) == False:
+    if is_authorized(reliefEffort.owner_id, reliefEffort.owner_type, user) == False:
         res.status_code = 403
         return {'detail' : 'Unauthorized access to inkind donation list'}
 
@@ -56,15 +59,16 @@ async def get_inkind_donations(relief_id: int, res: Response, p: int = 1, c: int
     status = status.upper()
     
     # filter base on status
-    if status == 'ALL':
-        donations = db.query(InkindDonation).filter(retrieve_donation_query).limit(c).offset((p-1)*c).all()
-    else:
-        donations = db.query(InkindDonation).filter(and_(retrieve_donation_query, InkindDonation.status == status)).limit(c).offset((p-1)*c).all()
+    if status != 'ALL':
+        retrieve_donation_query = and_(retrieve_donation_query, InkindDonation.status == status)
+
+    donations = paginate(db.query(InkindDonation).filter(retrieve_donation_query), InkindDonation, p, c, cursor).all()
+    set_next_cursor(res, donations, c)
 
     return donations
 
 @router.get("/requirements/{inkind_requirement_id}")
-async def get_inkind_requirement(inkind_requirement_id: int, res: Response):
+async def get_inkind_requirement(db: DB, inkind_requirement_id: int, res: Response):
     """
     get specifics of an inkind donation requirement
     """
@@ -78,13 +82,14 @@ async def get_inkind_requirement(inkind_requirement_id: int, res: Response):
         )
     
     # get count of how many items of `inkind_requirement` are needed currently
-    remaining = db.query(InkindDonation).filter(and_(InkindDonation.id == inkind_requirement_id, InkindDonation.status == 'DELIVERED')).all()
+    counter:RequirementCounter = db.query(RequirementCounter).filter(and_(RequirementCounter.requirement_type == 'INKIND', RequirementCounter.requirement_id == inkind_requirement_id)).first()
+    delivered = counter.fulfilled if counter is not None else 0
 
     return {
         "name": inkind_requirement.name,
         "description": inkind_requirement.description,
         "count": inkind_requirement.count,
-        "remaining" : len(remaining)
+        "remaining" : max(inkind_requirement.count - delivered, 0)
     }
 
 class PledgeDTO(BaseModel):
@@ -92,7 +97,7 @@ class PledgeDTO(BaseModel):
     expiry_date: date
 
 @router.post("/donations/{inkind_requirement_id}")
-async def pledge_donation(inkind_requirement_id:int, body:PledgeDTO, user: AuthDetails = Depends(get_current_user)):
+async def pledge_donation(db: DB, inkind_requirement_id:int, body:PledgeDTO, user: AuthDetails = Depends(get_current_user)):
     """
     User pledges their donation of goods.
     """
@@ -130,7 +135,7 @@ async def pledge_donation(inkind_requirement_id:int, body:PledgeDTO, user: AuthD
     return {'detail' : 'Successfully added pledged donation.'}
 
 @router.post("/donations/{inkind_requirement_id}/instant")
-async def create_instant_donation(inkind_requirement_id:int, body:PledgeDTO, res:Response, user: AuthDetails = Depends(get_current_user)):
+async def create_instant_donation(db: DB, counters: Counters, inkind_requirement_id:int, body:PledgeDTO, res:Response, user: AuthDetails = Depends(get_current_user)):
     """
     Create instant donation. Marked as `DELIVERED` automatically.
     """
@@ -169,15 +174,14 @@ async def create_instant_donation(inkind_requirement_id:int, body:PledgeDTO, res
     donation.status = 'DELIVERED'
     donation.expiry = body.expiry_date
 
-    inkind_requirement.count += 1
-
     db.add(donation)
+    counters.record_inkind(inkind_requirement.id, inkind_requirement.relief_id, donation.quantity)
     db.commit()
 
     return {'detail' : 'Successfully added instant donation.'}
 
 @router.patch("/donations/{donation_id}/delivered")
-async def mark_donation_as_delivered(res: Response, donation_id:int, user: AuthDetails = Depends(get_current_user)):
+async def mark_donation_as_delivered(db: DB, counters: Counters, res: Response, donation_id:int, user: AuthDetails = Depends(get_current_user)):
     """
     Mark pledged donation as delivered
     """
@@ -185,7 +189,8 @@ async def mark_donation_as_delivered(res: Response, donation_id:int, user: AuthD
     # check for authorization
     authorize(user, 2, 3)
 
-    inkind:InkindDonation = db.query(InkindDonation).filter(and_(InkindDonation.id == donation_id, InkindDonation.is_deleted == False)).first()
+    # locked until commit, so concurrent requests count the status change once
+    inkind:InkindDonation = db.query(InkindDonation).filter(and_(InkindDonation.id == donation_id, InkindDonation.is_deleted == False)).with_for_update().first()
     
     # check if inkind donation was previously pledged
     if inkind is None:
@@ -201,13 +206,13 @@ async def mark_donation_as_delivered(res: Response, donation_id:int, user: AuthD
         res.status_code = 403
         return {'detail' : 'Unauthorized to mark donation as delivered'}
     
+    # only count the donation the first time it is delivered
+    if inkind.status != "DELIVERED":
+        counters.record_inkind(inkind.inkind_requirement_id, inkind.relief_id, inkind.quantity)
+
     inkind.status = "DELIVERED"
     inkind.updated_at = datetime.now()
 
-    inkind_requirement:InkindDonationRequirement = db.query(InkindDonationRequirement).filter(InkindDonationRequirement.id == inkind.inkind_requirement_id).first()
-
-    inkind_requirement.count += 1
-
     db.commit()
 
     # send notif to user
@@ -215,7 +220,7 @@ async def mark_donation_as_delivered(res: Response, donation_id:int, user: AuthD
     return {'detail' : 'Successfully marked donation as delivered'}
 
 @router.patch("/donations/{donation_id}/cancelled")
-async def mark_donation_as_canceled(res: Response, donation_id:int, user: AuthDetails = Depends(get_current_user)):
+async def mark_donation_as_canceled(db: DB, counters: Counters, res: Response, donation_id:int, user: AuthDetails = Depends(get_current_user)):
     """
     Mark previously pledged donation as cancelled
     """
@@ -223,7 +228,8 @@ async def mark_donation_as_canceled(res: Response, donation_id:int, user: AuthDe
     # check for authorization
     authorize(user, 2, 3)
 
-    inkind:InkindDonation = db.query(InkindDonation).filter(and_(InkindDonation.id == donation_id, InkindDonation.is_deleted == False)).first()
+    # locked until commit, so concurrent requests count the status change once
+    inkind:InkindDonation = db.query(InkindDonation).filter(and_(InkindDonation.id == donation_id, InkindDonation.is_deleted == False)).with_for_update().first()
 
     # check if inkind donation was previously pledged    
     if inkind is None:
@@ -239,6 +245,10 @@ async def mark_donation_as_canceled(res: Response, donation_id:int, user: AuthDe
         res.status_code = 403
         return {'detail' : 'Unauthorized to mark donation as cancelled'}
     
+    # take back the items if the donation was already counted as delivered
+    if inkind.status == "DELIVERED":
+        counters.record_inkind(inkind.inkind_requirement_id, inkind.relief_id, -inkind.quantity)
+
     inkind.status = "CANCELLED"   
     inkind.updated_at = datetime.now()
 
@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Depends
+from dependencies import get_current_user
+from services.db.database import get_pool_status
+from models.auth_details import AuthDetails
+from util.auth.auth_tool import authorize
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["metrics"],
+    dependencies=[]
+)
+
+@router.get("/db-pool")
+def retrieve_db_pool_metrics(user: AuthDetails = Depends(get_current_user)):
+    """
+    Retrieves database connection pool metrics. Requires admin access.
+    """
+
+    # check for authorization
+    authorize(user, 4, 4)
+
+    return get_pool_status()
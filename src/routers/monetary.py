@@ -1,11 +1,13 @@
 from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, Body
-from dependencies import get_current_user
+from dependencies import get_current_user, get_db_session, get_payment_handler, get_counter_handler
 from services.db.database import Session
 from services.db.models import ReliefEffort, Organization, ReceivedMoney, UsedMoney, ReliefPaymentKey, User
 from services.payment.payment_handler import PaymentHandler;
+from services.counters.counter_handler import CounterHandler
 from models.auth_details import AuthDetails
 from util.auth.auth_tool import authorize, is_authorized, is_user_organizer
+from util.pagination import paginate, set_next_cursor
 from sqlalchemy import and_
 from pydantic import BaseModel
 import os
@@ -19,8 +21,9 @@ router = APIRouter(
     tags=["monetary"]
 )
 
-db = Session()
-payment_handler = PaymentHandler(os.environ.get("ENCRYPTION"))
+DB = Annotated[Session, Depends(get_db_session)]
+PaymentService = Annotated[PaymentHandler, Depends(get_payment_handler)]
+Counters = Annotated[CounterHandler, Depends(get_counter_handler)]
 
 class RecievedMoneyDTO(BaseModel):
        amount: float
@@ -28,7 +31,7 @@ class RecievedMoneyDTO(BaseModel):
        reference_no: str
 
 @router.post("/{relief_id}/offline_payment")
-def mark_offline_payment(relief_id:int, res:Response, body:RecievedMoneyDTO, user:AuthDetails = Depends(get_current_user)):
+def mark_offline_payment(db: DB, counters: Counters, relief_id:int, res:Response, body:RecievedMoneyDTO, user:AuthDetails = Depends(get_current_user)):
        """
        Mark payment as offline transaction
        """
@@ -68,13 +71,14 @@ def mark_offline_payment(relief_id:int, res:Response, body:RecievedMoneyDTO, use
        received_money.reference_no = body.reference_no
 
        db.add(received_money)
+       counters.record_money(relief_id, body.amount)
 
        db.commit()
 
        return {"details": "Offline payment created"}
 
 @router.get("/{relief_id}/donations")
-def get_donations(relief_id:int, res:Response, p: int = 1, c: int = 10, user:AuthDetails = Depends(get_current_user)):
+def get_donations(db: DB, relief_id:int, res:Response, p: int = 1, c: int = 10, cursor: str = None, user:AuthDetails = Depends(get_current_user)):
        """
        Retrieve donations from relief `relief_id`
        """
@@ -98,12 +102,13 @@ def get_donations(relief_id:int, res:Response, p: int = 1, c: int = 10, user:Aut
        #               detail="Unauthorized to view donations."
        #        )
        
-       donations:ReceivedMoney = db.query(ReceivedMoney).filter(and_(ReceivedMoney.relief_id == relief_id, ReceivedMoney.is_deleted == False)).limit(c).offset((p-1)*c).all()
+       donations:ReceivedMoney = paginate(db.query(ReceivedMoney).filter(and_(ReceivedMoney.relief_id == relief_id, ReceivedMoney.is_deleted == False)), ReceivedMoney, p, c, cursor).all()
+       set_next_cursor(res, donations, c)
 
        return donations
 
 @router.get("/{relief_id}/donations/{monetary_donation_id}")
-def get_monetary_details(relief_id:int, monetary_donation_id:int, res:Response, user:AuthDetails = Depends(get_current_user)):
+def get_monetary_details(db: DB, relief_id:int, monetary_donation_id:int, res:Response, user:AuthDetails = Depends(get_current_user)):
        """
        Retrieve monetary donation details
        """
@@ -138,7 +143,7 @@ def get_monetary_details(relief_id:int, monetary_donation_id:int, res:Response,
        return received_money       
 
 @router.get("/{relief_id}/expenses")
-def get_expense_records (relief_id:int, res:Response, p: int = 1, c: int = 10, user:AuthDetails = Depends(get_current_user)):
+def get_expense_records (db: DB, relief_id:int, res:Response, p: int = 1, c: int = 10, cursor: str = None, user:AuthDetails = Depends(get_current_user)):
        # check authorization
        authorize(user, 2, 4)
 
@@ -157,12 +162,13 @@ def get_expense_records (relief_id:int, res:Response, p: int = 1, c: int = 10, u
                      detail="Unauthorized to view donations."
               )
 
-       used_money:UsedMoney = db.query(UsedMoney).filter(and_(UsedMoney.relief_id == relief_id, UsedMoney.is_deleted == False)).limit(c).offset((p-1)*c).all()
+       used_money:UsedMoney = paginate(db.query(UsedMoney).filter(and_(UsedMoney.relief_id == relief_id, UsedMoney.is_deleted == False)), UsedMoney, p, c, cursor).all()
+       set_next_cursor(res, used_money, c)
 
        return used_money
 
 @router.get("/{relief_id}/expenses/{expense_id}")
-def get_expense_record (relief_id:int, expense_id:int, res:Response, user:AuthDetails = Depends(get_current_user)):
+def get_expense_record (db: DB, relief_id:int, expense_id:int, res:Response, user:AuthDetails = Depends(get_current_user)):
        # check authorization
        authorize(user, 2, 4)
 
@@ -197,7 +203,7 @@ class UsedMoneyDTO(BaseModel):
        reference_no: str
 
 @router.post("/{relief_id}/expenses")
-def create_expense_record (relief_id:int, res:Response, body:UsedMoneyDTO, user:AuthDetails = Depends(get_current_user)):
+def create_expense_record (db: DB, relief_id:int, res:Response, body:UsedMoneyDTO, user:AuthDetails = Depends(get_current_user)):
        """
        Create expense record
        """
@@ -244,7 +250,7 @@ class MayaKeyDTO(BaseModel):
       skey:str
 
 @router.post("/register/maya/{owner_type}/{owner_id}")
-async def register_maya_receiver(owner_type:str, owner_id:int, body:MayaKeyDTO, res:Response, user:AuthDetails = Depends(get_current_user)):
+async def register_maya_receiver(db: DB, payment_handler: PaymentService, owner_type:str, owner_id:int, body:MayaKeyDTO, res:Response, user:AuthDetails = Depends(get_current_user)):
        """
        Register Maya Account keys for automated payment records
        """
@@ -266,7 +272,7 @@ async def register_maya_receiver(owner_type:str, owner_id:int, body:MayaKeyDTO,
        return {'detail' : 'Successfully saved a maya receiver'}
 
 @router.post("/maya")
-async def create_maya_checkout(relief_id:int, amount:float, res:Response):
+async def create_maya_checkout(payment_handler: PaymentService, relief_id:int, amount:float, res:Response):
        """
        Create instance of Maya checkout depending on relief `relief id`.
        """
@@ -287,20 +293,20 @@ async def create_maya_checkout(relief_id:int, amount:float, res:Response):
        return resu[0]['redirectUrl']
 
 @router.get("/maya/redirect")
-async def record_payment(status:str, rrn:str, relief_id:int, req:Request, res:Response, donor_id:int = 0):
+async def record_payment(db: DB, payment_handler: PaymentService, status:str, rrn:str, relief_id:int, req:Request, res:Response, donor_id:int = 0):
        """
        Record payment from Maya. Accessed by Maya redirect/webhook.
        """
        
        # add condition that this endpoint only accepts traffic from Maya
 
-       relief:ReliefEffort = db_handler.query(ReliefEffort).filter(and_(ReliefEffort.id == relief_id, ReliefEffort.is_active == True)).first()
+       relief:ReliefEffort = db.query(ReliefEffort).filter(and_(ReliefEffort.id == relief_id, ReliefEffort.is_active == True)).first()
 
        # check if relief effort is non-existent
        if relief is None:
              return {'detail' : 'Non-existent relief effort.'}
        
-       user:User = db_handler.query(User).filter(and_(User.id == donor_id, User.is_deleted == False)).first()
+       user:User = db.query(User).filter(and_(User.id == donor_id, User.is_deleted == False)).first()
 
        # check if user is non-existent
        if user is None:
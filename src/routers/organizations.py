@@ -1,15 +1,17 @@
 from typing import Annotated, List
 from fastapi import APIRouter, Depends, Form, UploadFile, HTTPException, status, Response
-from dependencies import get_current_user
-from services.db.database import Session
+from dependencies import get_current_user, get_db_session, get_async_db_session
+from services.db.database import Session, AsyncSession
 from services.db.models import Organization, User, Address, SponsorshipRequest
 from services.storage.file_handler import FileHandler
 from services.email.organization_email_handler import OrganizationEmailHandler
 from models.auth_details import AuthDetails
 from util.auth.auth_tool import authorize, is_user_organizer
+from util.auth.principal_cache import principal_cache
+from util.pagination import paginate, set_next_cursor
 from pydantic import BaseModel
 from datetime import datetime
-from sqlalchemy import and_
+from sqlalchemy import and_, select
 import json
 from types import SimpleNamespace
 from dataclasses import dataclass
@@ -20,7 +22,8 @@ router = APIRouter(
     dependencies=[]
 )
 
-db = Session()
+DB = Annotated[Session, Depends(get_db_session)]
+AsyncDB = Annotated[AsyncSession, Depends(get_async_db_session)]
 file_handler = FileHandler()
 org_emailer = OrganizationEmailHandler()
 
@@ -38,19 +41,22 @@ class OrganizationAddressDTO(BaseModel):
     coordinates:str
 
 @router.get("/")
-async def retrieve_organizations(p: int = 1, c: int = 10):
+async def retrieve_organizations(db: AsyncDB, res: Response, p: int = 1, c: int = 10, cursor: str = None):
     """
     Retrieves a paginated list of active organizations.
     """
     # Get list of active organizations from database
-    orgs: List[Organization] = db.query(Organization).filter(and_(Organization.is_active == True)).limit(c).offset((p-1)*c).all()
+    orgs: List[Organization] = (await db.execute(paginate(select(Organization).filter(and_(Organization.is_active == True)), Organization, p, c, cursor))).scalars().all()
+    set_next_cursor(res, orgs, c)
 
     # Initialize empty list to store retrieved data
     to_return = []
 
+    profile_links = await file_handler.get_org_profiles([org.id for org in orgs], 'thumbnail')
+
     # Extract necessary data and generate profile links for each organization
     for org in orgs:
-        profile_link = await file_handler.get_org_profile(org.id)
+        profile_link = profile_links[org.id]
         to_return.append({
             "id": org.id,
             "owner_id": org.owner_id,
@@ -65,7 +71,7 @@ async def retrieve_organizations(p: int = 1, c: int = 10):
 
 
 @router.get("/{organization_id}")
-async def retrieve_organization(organization_id: int, res: Response):
+async def retrieve_organization(db: DB, organization_id: int, res: Response):
     """
     Retrieves details of an organization with the specified `organization_id`.
     """
@@ -106,7 +112,7 @@ class CreateOrganizationDTO(BaseModel):
     coordinates:str = Form()
 
 @router.post("/")
-async def create_organization(res:Response, body:CreateOrganizationDTO, user: AuthDetails = Depends(get_current_user)):
+async def create_organization(db: DB, res:Response, body:CreateOrganizationDTO, user: AuthDetails = Depends(get_current_user)):
     """
     Creates a new organization, uploads its profile picture, and sends a notification email.
     """
@@ -147,20 +153,21 @@ async def create_organization(res:Response, body:CreateOrganizationDTO, user: Au
     newAddress.coordinates = body.coordinates
 
     db.add(newAddress)
-    db.commit()
 
     # get user info (for email)
     user:User = db.query(User).filter(User.id == user.user_id).first()
 
-    # email user that an organization was creatd.
-    await org_emailer.send_organization_creation_notice(user.email, user.first_name, org.name)
+    # email user that an organization was creatd, in the same transaction as its address
+    await org_emailer.send_organization_creation_notice(user.email, user.first_name, org.name, db=db)
+
+    db.commit()
 
     return {"details": "Organization created.", "data": {
         "organization_id" : org.id
     }}
 
 @router.patch("/{id}/address")
-def edit_organization_address(id:int, body:OrganizationAddressDTO, res:Response, user: AuthDetails = Depends(get_current_user)):
+def edit_organization_address(db: DB, id:int, body:OrganizationAddressDTO, res:Response, user: AuthDetails = Depends(get_current_user)):
     """
     Edits the address of an organization.
     """
@@ -197,7 +204,7 @@ def edit_organization_address(id:int, body:OrganizationAddressDTO, res:Response,
     return {"detail":"Organization success successfully updated."}
 
 @router.post("/{organization_id}/profile")
-async def save_organization_profile(organization_id: int, image: UploadFile, res: Response, user: AuthDetails = Depends(get_current_user)):
+async def save_organization_profile(db: DB, organization_id: int, image: UploadFile, res: Response, user: AuthDetails = Depends(get_current_user)):
     """
     Saves a profile picture for an organization.
     """
@@ -231,7 +238,7 @@ async def save_organization_profile(organization_id: int, image: UploadFile, res
     }
 
 @router.get("/{id}/profile")
-def retrieve_organization_profile(id:int, res: Response):
+def retrieve_organization_profile(db: DB, id:int, res: Response):
     """
     Retrieves the profile picture link for an organization.
     """
@@ -247,7 +254,7 @@ def retrieve_organization_profile(id:int, res: Response):
     return profile_link
 
 @router.get("/applications")
-def retrieve_organization_applications(res:Response, p: int = 1, c: int = 10, user: AuthDetails = Depends(get_current_user)):
+def retrieve_organization_applications(db: DB, res:Response, p: int = 1, c: int = 10, user: AuthDetails = Depends(get_current_user)):
     """
     Retrieves a paginated list of applications from organizations requesting tier upgrade.
     """
@@ -274,7 +281,7 @@ def retrieve_organization_applications(res:Response, p: int = 1, c: int = 10, us
     return to_return
 
 @router.patch("/{org_id}/{action}")
-async def resolve_organization_application(org_id:int, action:str, res:Response, user: AuthDetails = Depends(get_current_user)):
+async def resolve_organization_application(db: DB, org_id:int, action:str, res:Response, user: AuthDetails = Depends(get_current_user)):
     """
     Resolves organization application of `org_id` 
     """
@@ -294,14 +301,15 @@ async def resolve_organization_application(org_id:int, action:str, res:Response,
             org.is_active = True
             if owner.level < 3:
                 owner.level = 3 # signifies an organization owner
+                owner.token_version = User.token_version + 1
 
             # send email notification
-            await org_emailer.send_approved_notification(owner.email, owner.first_name, org.name)
+            await org_emailer.send_approved_notification(owner.email, owner.first_name, org.name, db=db)
         case 'reject':
             org.is_deleted = True
 
             # send email notification
-            await org_emailer.send_rejected_notification(owner.email, owner.first_name, org.name)
+            await org_emailer.send_rejected_notification(owner.email, owner.first_name, org.name, db=db)
         case _:
             res.status_code = 400
             return {'detail' : 'Invalid action'}
@@ -309,11 +317,12 @@ async def resolve_organization_application(org_id:int, action:str, res:Response,
     org.updated_at = datetime.now()
 
     db.commit()
+    principal_cache.invalidate(owner.id)
 
     return {'detail' : f'Successfully resolved organization with status: {action}'}
 
 @router.delete("/{id}")
-async def deleteOrganization(id:int, res: Response, user: AuthDetails = Depends(get_current_user)):
+async def deleteOrganization(db: DB, id:int, res: Response, user: AuthDetails = Depends(get_current_user)):
     """
     Deletes an organization.
     """
@@ -335,12 +344,12 @@ async def deleteOrganization(id:int, res: Response, user: AuthDetails = Depends(
     # soft delete the organization
     org.is_deleted = True
 
-    db.commit()
-
     user:User = db.query(User).filter(User.id == user.user_id).first()
 
-    # send email to owner.
-    await org_emailer.send_deletion_notice(user.email,user.first_name, org.name)
+    # send email to owner, in the same transaction as the deletion
+    await org_emailer.send_deletion_notice(user.email,user.first_name, org.name, db=db)
+
+    db.commit()
 
     return {"detail": "Organization deleted"}
 
@@ -350,7 +359,7 @@ class SponsorshipRequestDTO(BaseModel):
     foundation_id: int
 
 @router.post("/sponsor")
-def apply_for_sponsorship(body: SponsorshipRequestDTO, res: Response, user: AuthDetails = Depends(get_current_user)):
+def apply_for_sponsorship(db: DB, body: SponsorshipRequestDTO, res: Response, user: AuthDetails = Depends(get_current_user)):
     """
     Creates a sponsorship request for an organization to a foundation.
     """
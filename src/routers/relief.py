@@ -1,16 +1,18 @@
 from typing import Annotated
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status, Response, Form, Query
-from dependencies import get_current_user
-from services.db.database import Session, engine
-from services.db.models import Organization, User, Address, ReliefEffort, ReliefBookmark, ReliefComment, InkindDonationRequirement, InkindDonation, VolunteerRequirement, ReliefUpdate, ReceivedMoney
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status, Response, Form, Query, BackgroundTasks
+from dependencies import get_current_user, get_db_session, get_async_db_session
+from services.db.database import Session, AsyncSession, engine
+from services.db.models import Organization, User, Address, ReliefEffort, ReliefBookmark, ReliefComment, InkindDonationRequirement, InkindDonation, VolunteerRequirement, ReliefUpdate, ReceivedMoney, Volunteer
+from services.search.relief_search import build_tsquery, full_text_search, search_config
 from services.storage.file_handler import FileHandler
 from services.email.relief_email_handler import ReliefEmailHandler
 from models.auth_details import AuthDetails
 from util.auth.auth_tool import authorize, is_user_organizer, is_authorized
 from util.files.image_validator import is_image_valid
+from util.files.direct_upload import IssueUploadsDTO, ConfirmUploadsDTO, upload_error_response
 from pydantic import BaseModel
 from datetime import datetime, date
-from sqlalchemy import and_, or_, text
+from sqlalchemy import and_, or_, text, select, case, union
 from typing import List, Optional, Literal
 from pydantic import Json, Field
 import json
@@ -24,7 +26,8 @@ router = APIRouter(
     dependencies=[]
 )
 
-db = Session()
+DB = Annotated[Session, Depends(get_db_session)]
+AsyncDB = Annotated[AsyncSession, Depends(get_async_db_session)]
 file_handler = FileHandler()
 relief_email_handler = ReliefEmailHandler()
 
@@ -36,116 +39,102 @@ class ReliefEffortRetrievalDTO(BaseModel):
 
 valid_needs = ['monetary', 'inkind', 'volunteer']
 
-def get_relief_effort_info(location:str, keyword:str = None, category:str = None, needs:List = []):
+async def get_relief_effort_info(db:AsyncSession, location:str = "", keyword:str = None, category:str = None, needs:List = [], p:int = 1, c:int = 10):
 
-    keyword_query = "%"
-    if keyword != None:
-        keyword_query = f"%%{keyword}%%"
+    # only active, approved relief efforts are listed
+    filters = [ReliefEffort.is_active == True, ReliefEffort.is_deleted == False]
 
-    if category == "" or category == None:
-        category = '%'
+    if category not in ("", None) and category.lower() != "all":
+        filters.append(ReliefEffort.disaster_type == category)
 
-    monetary_query = False  
-    inkind_query = False
-    volunteer_query = True
-    print(needs)
-    if 'monetary' in needs:
-        print(1)
-        monetary_query = True
-    
-    if 'inkind' in needs:
-        print(2)
-        inkind_query = True
-    
-    if 'volunteer' in needs:
-        print(3)
-        inkind_query = True
+    # expects location as `city, region`
+    splitted_loc = location.split(', ') if location else []
+    if len(splitted_loc) == 2:
+        filters.append(and_(Address.city == splitted_loc[0], Address.region == splitted_loc[1]))
 
-    to_return = []
+    # keep relief efforts accepting any of the requested needs
+    accepting = {
+        'monetary' : ReliefEffort.is_accepting_money,
+        'inkind' : ReliefEffort.is_accepting_inkind,
+        'volunteer' : ReliefEffort.is_accepting_volunteers
+    }
+    requested_needs = [accepting[need] == True for need in needs if need in accepting]
+    if len(requested_needs) > 0:
+        filters.append(or_(*requested_needs))
+
+    organizer = case(
+        (ReliefEffort.owner_type == 'USER', select(User.username).where(User.id == ReliefEffort.owner_id).scalar_subquery()),
+        (ReliefEffort.owner_type == 'ORGANIZATION', select(Organization.name).where(Organization.id == ReliefEffort.owner_id).scalar_subquery())
+    )
+
+    query = select(
+                ReliefEffort.id,
+                ReliefEffort.name,
+                ReliefEffort.description,
+                Address.city,
+                Address.region,
+                organizer.label('organizer')
+            ).join(Address, and_(Address.owner_type == 'RELIEF', Address.owner_id == ReliefEffort.id)).where(and_(*filters))
+
+    tsquery = build_tsquery(keyword)
+    if tsquery is None:
+        query = query.order_by(ReliefEffort.created_at.desc(), ReliefEffort.id.desc())
+    else:
+        # rank by relevance when searching by keyword
+        match, rank = full_text_search(tsquery, await search_config(db, tsquery))
+        query = query.where(match).order_by(rank.desc(), ReliefEffort.id)
 
-    splitted_loc = location.split(', ')
-    if len(splitted_loc) != 2: splitted_loc = (None, None) 
+    rs = (await db.execute(query.limit(c).offset((p-1)*c))).all()
+
+    to_return = []
 
-    with engine.connect() as con:
-            rs = con.execute(f"SELECT \
-                                re.id, \
-                                re.name, \
-                                re.description, \
-                                a.city, \
-                                a.region, \
-                                CASE \
-                                    WHEN re.owner_type = 'USER' THEN (SELECT u.username FROM users u WHERE re.owner_id = u.id) \
-                                    WHEN re.owner_type = 'ORGANIZATION' THEN (SELECT o.name FROM organizations o WHERE re.owner_id = o.id) \
-                                END AS organizer \
-                                FROM relief_efforts re \
-                                RIGHT JOIN addresses a \
-                                ON a.owner_id = re.id AND a.owner_type = 'RELIEF' \
-                                WHERE \
-                                    re.is_accepting_money = {monetary_query} \
-                                    AND re.is_accepting_inkind = {inkind_query} \
-                                    AND re.is_accepting_volunteers = {volunteer_query} \
-                                    AND re.name LIKE '{keyword_query}' \
-                                ")
-        
     for row in rs:
-            # append image here
-            to_return.append({
-                'relief_id' : row[0],
-                'name' : row[1],
-                'description' : row[2],
-                'organizer' : row[5],
-                'city' : row[3],
-                'region' : row[4]
-            })
+        to_return.append({
+            'relief_id' : row[0],
+            'name' : row[1],
+            'description' : row[2],
+            'organizer' : row[5],
+            'city' : row[3],
+            'region' : row[4]
+        })
 
     return to_return
 
 @router.get("/")
-async def retrieve_relief_efforts(keyword:str = "", category:str = "", location:str = "", needs:Annotated[list[str] | None, Query()] = ['monetary', 'inkind', 'volunteerx         '], p: int = 1, c: int = 10):
+async def retrieve_relief_efforts(db: AsyncDB, keyword:str = "", category:str = "", location:str = "", needs:Annotated[list[str] | None, Query()] = ['monetary', 'inkind', 'volunteer'], p: int = 1, c: int = 10):
     """
     Retrieves relief efforts. Paginated by count `c` and page `p`. Note: to submit multiple needs, do so by adding multiple `needs` query parameters.
     """
 
-    # query used for address
-    address_query = None
-    splitted_loc = location.split(', ')
-    if len(splitted_loc) != 2: splitted_loc = None
-    
-    # query used for getting user info 
-    detail_query = and_(ReliefEffort.is_active == True, ReliefEffort.disaster_type.contains(category), ReliefEffort.name.contains(keyword))
-    
-    to_return = get_relief_effort_info(keyword=keyword,
+    to_return = await get_relief_effort_info(db,
+                                       keyword=keyword,
                                        category=category,
                                        location=location,
-                                       needs=needs )
-    # check result location
+                                       needs=needs or [],
+                                       p=p,
+                                       c=c)
 
-    if splitted_loc is None:
-        return to_return
-    
-    filtered_by_loc = []
-    print(splitted_loc)
-    for relief in to_return:
-        if relief['city'] == splitted_loc[0] and relief['region'] == splitted_loc[1]:
-            image = await file_handler.retrieve_files(relief['relief_id'], 'relief-efforts/main')
-            if image[1] == True:
-                relief['images'] = image[0]
-            filtered_by_loc.append(relief)
-    
-    return filtered_by_loc
+    images = await file_handler.retrieve_files_batch([relief['relief_id'] for relief in to_return], 'relief-efforts/main', 'thumbnail')
+
+    if images[1] == True:
+        for relief in to_return:
+            relief['images'] = images[0][relief['relief_id']]
+
+    return to_return
 
 def get_inkind_requirements_total(relief_id:int):
     inkind_requirements = []
 
     with engine.connect() as con:
-        rs = con.execute(f"SELECT \
+        rs = con.execute(text("SELECT \
                             idr.name,\
                             idr.description,\
                             idr.count AS target,\
-                            idr.count - (SELECT COUNT(*) FROM inkind_donations id WHERE id.inkind_requirement_id = idr.id AND id.status = 'DELIVERED') AS count\
-                                \
+                            idr.count - COALESCE(rc.fulfilled, 0) AS count\
                             FROM inkind_donation_requirements idr\
-                            WHERE idr.relief_id = {relief_id}")
+                            LEFT JOIN requirement_counters rc\
+                            ON rc.requirement_type = 'INKIND' AND rc.requirement_id = idr.id\
+                            WHERE idr.relief_id = :relief_id"), {'relief_id' : relief_id})
 
         for row in rs:
             inkind_requirements.append({
@@ -181,13 +170,15 @@ def get_volunteer_requirements_total(relief_id:int):
     volunteer_requirements = []
 
     with engine.connect() as con:
-        rs = con.execute(f"SELECT \
+        rs = con.execute(text("SELECT \
                             vdr.name,\
                             vdr.description,\
                             vdr.count AS target,\
-                            vdr.count - (SELECT COUNT(*) FROM volunteers vd WHERE vd.volunteer_requirement_id = vdr.id AND vd.status = 'ACCEPTED') AS count\
+                            vdr.count - COALESCE(rc.fulfilled, 0) AS count\
                             FROM volunteer_requirements vdr\
-                            WHERE vdr.relief_id = {relief_id}")
+                            LEFT JOIN requirement_counters rc\
+                            ON rc.requirement_type = 'VOLUNTEER' AND rc.requirement_id = vdr.id\
+                            WHERE vdr.relief_id = :relief_id"), {'relief_id' : relief_id})
         for row in rs:
             volunteer_requirements.append({
                 'name' : row[0],
@@ -198,88 +189,62 @@ def get_volunteer_requirements_total(relief_id:int):
 
     return volunteer_requirements
 
-def get_comments_list(relief_id:int):
-
-    comments_list = []
-
-    with engine.connect() as con:
-        rs = con.execute(f"SELECT \
-                            cmt.user_id, \
-                            cmt.message, \
-                            cmt.created_at \
-                            FROM relief_comments cmt \
-                            WHERE cmt.relief_id = {relief_id} AND is_deleted = false")
-        
-        for row in rs:
-            comments_list.append({
-                'user_id' : row[0],
-                'message' : row[1],
-                'created_at' : row[2]
-            })
-
-        return comments_list
-
-def get_updates_list(relief_id:int):
-
-    updates_list = []
-
-    with engine.connect() as con:
-        rs = con.execute(f"SELECT \
-                            upd.title, \
-                            upd.description, \
-                            upd.media_dir, \
-                            upd.type, \
-                            upd.created_at \
-                            FROM relief_updates upd \
-                            WHERE upd.relief_id = {relief_id} AND is_deleted = false")
-        
-        for row in rs:
-            updates_list.append({
-                'title' : row[0],
-                'description' : row[1],
-                'media_dir' : row[2],
-                'type' : row[3],
-                'created_at' : row[4]
-            })
-
-        return updates_list
-
-def get_organizer_contact_info(owner_id:int, owner_type:str):
-    if owner_type == 'USER':
-        user:User = db.query(User).filter(and_(User.id == owner_id)).first()
-        # check if user exists
-        if user is None:
-            return None
-        
-        return {
-            "email" : user.email,
-            "mobile" : user.mobile,
-            "foundation_id" : user.sponsor_id
-        }
-    elif owner_type == 'ORGANIZATION':
-        organization:Organization = db.query(Organization).filter(and_(Organization.id == owner_id, Organization.is_deleted == False)).first()
-
-        # check if organization exists
-        user:User = db.query(User).filter(and_(User.id == owner_id)).first()
-        
-        return {
-            "email" : user.email,
-            "mobile" : user.mobile
-        }
-
-    else:
-        return None
+# aggregates everything the relief detail page needs into a single row
+RELIEF_DETAIL_QUERY = text("""
+    SELECT
+        to_jsonb(re) AS profile,
+        CASE
+            WHEN re.owner_type = 'USER' THEN jsonb_build_object('email', u.email, 'mobile', u.mobile, 'foundation_id', u.sponsor_id)
+            WHEN re.owner_type = 'ORGANIZATION' THEN jsonb_build_object('email', u.email, 'mobile', u.mobile)
+        END AS contact_info,
+        (SELECT COALESCE(jsonb_agg(to_jsonb(a) ORDER BY a.id), '[]'::jsonb)
+            FROM addresses a
+            WHERE a.owner_id = re.id AND a.owner_type = 'RELIEF') AS address,
+        (SELECT COALESCE(jsonb_agg(to_jsonb(idr) || jsonb_build_object('fulfilled', COALESCE(rc.fulfilled, 0)) ORDER BY idr.id), '[]'::jsonb)
+            FROM inkind_donation_requirements idr
+            LEFT JOIN requirement_counters rc
+                ON rc.requirement_type = 'INKIND' AND rc.requirement_id = idr.id
+            WHERE idr.relief_id = re.id AND idr.is_deleted = false) AS inkind_requirements,
+        (SELECT COALESCE(jsonb_agg(to_jsonb(vr) || jsonb_build_object('fulfilled', COALESCE(rc.fulfilled, 0)) ORDER BY vr.id), '[]'::jsonb)
+            FROM volunteer_requirements vr
+            LEFT JOIN requirement_counters rc
+                ON rc.requirement_type = 'VOLUNTEER' AND rc.requirement_id = vr.id
+            WHERE vr.relief_id = re.id AND vr.is_deleted = false) AS volunteer_requirements,
+        COALESCE(cnt.money_raised, 0) AS total_donation,
+        (SELECT COALESCE(jsonb_agg(jsonb_build_object(
+                    'user_id', cmt.user_id,
+                    'message', cmt.message,
+                    'created_at', cmt.created_at) ORDER BY cmt.created_at), '[]'::jsonb)
+            FROM relief_comments cmt
+            WHERE cmt.relief_id = re.id AND cmt.is_deleted = false) AS comment_list,
+        (SELECT COALESCE(jsonb_agg(jsonb_build_object(
+                    'title', upd.title,
+                    'description', upd.description,
+                    'media_dir', upd.media_dir,
+                    'type', upd.type,
+                    'created_at', upd.created_at) ORDER BY upd.created_at), '[]'::jsonb)
+            FROM relief_updates upd
+            WHERE upd.relief_id = re.id AND upd.is_deleted = false) AS update_list
+    FROM relief_efforts re
+    LEFT JOIN organizations o
+        ON re.owner_type = 'ORGANIZATION' AND o.id = re.owner_id AND o.is_deleted = false
+    LEFT JOIN users u
+        ON u.id = CASE WHEN re.owner_type = 'USER' THEN re.owner_id ELSE o.owner_id END
+    LEFT JOIN relief_counters cnt
+        ON cnt.relief_id = re.id
+    WHERE re.id = :relief_id
+""")
 
 def get_current_inkind_donations(relief_effort_id:int):
     
     return
 
 @router.get("/{relief_effort_id}")
-async def retrieve_relief_effort(relief_effort_id:int):
+async def retrieve_relief_effort(db: AsyncDB, relief_effort_id:int):
     """
     Returns relief effort identified by `relief_effort_id`
     """
-    relief:ReliefEffort = db.query(ReliefEffort).filter(ReliefEffort.id == relief_effort_id).first()
+    relief = (await db.execute(RELIEF_DETAIL_QUERY, {'relief_id' : relief_effort_id})).mappings().first()
 
     # checks if relief effort exists
     if relief is None:
@@ -289,29 +254,8 @@ async def retrieve_relief_effort(relief_effort_id:int):
         )
 
     resu = await file_handler.retrieve_files(relief_effort_id, f'relief-efforts/main')
-    
-    # contact_info = get_organizer_contact_info(relief.owner_id, relief.owner_type)
-    contact_info = get_organizer_contact_info(relief.owner_id, relief.owner_type)
-
-    address = db.query(Address).filter(and_(Address.owner_id == relief_effort_id, Address.owner_type == 'RELIEF')).all()
-    inkind_requirements =  db.query(InkindDonationRequirement).filter(and_(InkindDonationRequirement.relief_id == relief.id, InkindDonationRequirement.is_deleted == False)).all()
-    volunteer_requirements = db.query(VolunteerRequirement).filter(and_(VolunteerRequirement.relief_id == relief.id, InkindDonationRequirement.is_deleted == False)).all()
-    monetary_donations:List[ReceivedMoney] = db.query(ReceivedMoney).filter(ReceivedMoney.relief_id == relief.id).all()
-
-    total_donation = 0
-    for m in monetary_donations:
-        total_donation += m.amount
-
-    to_return = {
-            'profile' : relief,
-            "contact_info" : contact_info,
-            "address" : address,
-            "inkind_requirements" : inkind_requirements,
-            "volunteer_requirements" : volunteer_requirements,
-            "total_donation" : total_donation,
-            'comment_list' : get_comments_list(relief.id),
-            'update_list' : get_updates_list(relief.id)
-    }
+
+    to_return = dict(relief)
 
     # retrieve monetary progress
     if resu[1] == True:
@@ -359,7 +303,7 @@ class CreateReliefEffortDTO(BaseModel):
     sponsor_message: str  = None
 
 @router.post("/as-user")
-async def create_relief_effort_as_individual(res: Response, body: CreateReliefEffortDTO, user: AuthDetails = Depends(get_current_user)):
+async def create_relief_effort_as_individual(db: DB, res: Response, body: CreateReliefEffortDTO, user: AuthDetails = Depends(get_current_user)):
     """
     Creates relief effort as a user.
     """
@@ -460,7 +404,7 @@ async def create_relief_effort_as_individual(res: Response, body: CreateReliefEf
             }}
 
 @router.post("/as-organization/{organization_id}")
-async def create_relief_effort_as_organization(res: Response, organization_id: int, body: CreateReliefEffortDTO, user: AuthDetails = Depends(get_current_user)):
+async def create_relief_effort_as_organization(db: DB, res: Response, organization_id: int, body: CreateReliefEffortDTO, user: AuthDetails = Depends(get_current_user)):
     """
     Create relief effort as an organization.
     """
@@ -565,7 +509,7 @@ async def create_relief_effort_as_organization(res: Response, organization_id: i
             }}
 
 @router.post("/{relief_id}/images")
-async def upload_relief_images(relief_id:int, res:Response, images:List[UploadFile] = File(...), user:AuthDetails = Depends(get_current_user)):
+async def upload_relief_images(db: DB, relief_id:int, res:Response, images:List[UploadFile] = File(...), user:AuthDetails = Depends(get_current_user)):
     # check if images are valid
     for image in images:
         if is_image_valid(image) == False:
@@ -594,8 +538,59 @@ async def upload_relief_images(relief_id:int, res:Response, images:List[UploadFi
     
     return {'detail' : 'Images uploaded.'}
 
+@router.post("/{relief_id}/images/uploads")
+async def issue_relief_image_uploads(db: DB, relief_id:int, res:Response, body:IssueUploadsDTO, user:AuthDetails = Depends(get_current_user)):
+    """
+    Issues direct uploads of relief images to storage. Finish with `POST /{relief_id}/images/uploads/confirm`.
+    """
+    relief_effort:ReliefEffort = db.query(ReliefEffort).filter(and_(ReliefEffort.id == relief_id, ReliefEffort.is_deleted == False)).first()
+
+    # check if relief effort exists
+    if relief_effort is None:
+        res.status_code = 404
+        return {'detail' : 'Relief effort not found.'}
+    
+    # check if user can act on behalf of relief effort
+    if is_authorized(relief_effort.owner_id, relief_effort.owner_type, user) == False:
+        res.status_code = 403
+        return {'detail': 'Not authorized to affect on behalf of relief effort.'}
+
+    resu = await file_handler.issue_uploads(body.filenames, relief_id, 'relief-efforts/main')
+
+    if resu[1] == False:
+        return upload_error_response(res, resu[0])
+
+    return {'detail' : 'Uploads issued.', 'data' : resu[0]}
+
+@router.post("/{relief_id}/images/uploads/confirm")
+async def confirm_relief_image_uploads(db: DB, relief_id:int, res:Response, body:ConfirmUploadsDTO, background_tasks:BackgroundTasks, user:AuthDetails = Depends(get_current_user)):
+    """
+    Records relief images uploaded directly to storage.
+    """
+    relief_effort:ReliefEffort = db.query(ReliefEffort).filter(and_(ReliefEffort.id == relief_id, ReliefEffort.is_deleted == False)).first()
+
+    # check if relief effort exists
+    if relief_effort is None:
+        res.status_code = 404
+        return {'detail' : 'Relief effort not found.'}
+    
+    # check if user can act on behalf of relief effort
+    if is_authorized(relief_effort.owner_id, relief_effort.owner_type, user) == False:
+        res.status_code = 403
+        return {'detail': 'Not authorized to affect on behalf of relief effort.'}
+
+    resu = await file_handler.confirm_uploads(body.public_ids, relief_id, 'relief-efforts/main')
+
+    if resu[1] == False:
+        return upload_error_response(res, resu[0])
+
+    # variants are generated once the response is sent
+    background_tasks.add_task(file_handler.process_uploads, body.public_ids)
+
+    return {'detail' : 'Images uploaded.'}
+
 @router.patch("/{id}/approve")
-async def approveReliefEffort(id:int, res: Response, user: AuthDetails = Depends(get_current_user)):
+async def approveReliefEffort(db: DB, id:int, res: Response, user: AuthDetails = Depends(get_current_user)):
     """
     Approves a relief effort.
     """
@@ -632,7 +627,7 @@ async def approveReliefEffort(id:int, res: Response, user: AuthDetails = Depends
     name = usr.first_name
 
     # send email notification about approval
-    await relief_email_handler.send_approval(email, name, relief.name)
+    await relief_email_handler.send_approval(email, name, relief.name, db=db)
     
     relief.is_active = True
     relief.phase = 'PREPARING'
@@ -643,7 +638,7 @@ async def approveReliefEffort(id:int, res: Response, user: AuthDetails = Depends
     return {"detail": "Relief effort successfully approved"}
 
 @router.patch("/{id}/reject")
-async def rejectReliefEffort(id:int, res: Response,user: AuthDetails = Depends(get_current_user)):
+async def rejectReliefEffort(db: DB, id:int, res: Response,user: AuthDetails = Depends(get_current_user)):
     """
     Rejects a relief effort
     """
@@ -685,14 +680,14 @@ async def rejectReliefEffort(id:int, res: Response,user: AuthDetails = Depends(g
     name = usr.first_name
 
     # send email about this
-    await relief_email_handler.send_rejection(email, name, relief.name)
+    await relief_email_handler.send_rejection(email, name, relief.name, db=db)
 
     db.commit()
 
     return {"detail": "Relief effort successfully rejected."}
 
 @router.delete("/{id}")
-async def delete_relief_effort(id:int, res: Response,user: AuthDetails = Depends(get_current_user)):
+async def delete_relief_effort(db: DB, id:int, res: Response,user: AuthDetails = Depends(get_current_user)):
     """
     Deletes a relief effort.
     """
@@ -724,14 +719,14 @@ async def delete_relief_effort(id:int, res: Response,user: AuthDetails = Depends
     name = user.first_name
 
     # send email about this
-    await relief_email_handler.send_deletion_notice(email, name, relief.name)
+    await relief_email_handler.send_deletion_notice(email, name, relief.name, db=db)
 
     db.commit()
 
     return {"detail": "Relief effort successfully deleted."}
 
 @router.get("/bookmarks/")
-def retrieve_book_marks(res:Response, user: AuthDetails = Depends(get_current_user)):
+def retrieve_book_marks(db: DB, res:Response, user: AuthDetails = Depends(get_current_user)):
     """
     Retrieves bookmarks of user
     """
@@ -743,7 +738,7 @@ def retrieve_book_marks(res:Response, user: AuthDetails = Depends(get_current_us
     return bookmarks
 
 @router.post("/bookmarks/{id}")
-def bookmark_relief_effort(id:int, res:Response, user: AuthDetails = Depends(get_current_user)):
+def bookmark_relief_effort(db: DB, id:int, res:Response, user: AuthDetails = Depends(get_current_user)):
     """
     Creates bookmark
     """
@@ -772,7 +767,7 @@ def bookmark_relief_effort(id:int, res:Response, user: AuthDetails = Depends(get
     return {"detail": "Relief effort bookmarked"}
 
 @router.delete("/bookmarks/{id}")
-def unbookmark_relief_effort(id:int, res:Response, user: AuthDetails = Depends(get_current_user)):
+def unbookmark_relief_effort(db: DB, id:int, res:Response, user: AuthDetails = Depends(get_current_user)):
     """
     Removes bookmark
     """
@@ -791,7 +786,7 @@ def unbookmark_relief_effort(id:int, res:Response, user: AuthDetails = Depends(g
     return {"detail": "Relief effort unbookmarked"}
 
 @router.get("/{id}/comments")
-def get_comments(id:int, res:Response):
+def get_comments(db: DB, id:int, res:Response):
     """
     Retrieves comments of a relief effort
     """
@@ -802,7 +797,7 @@ class ReliefCommentDTO(BaseModel):
     message: str
 
 @router.post("/{id}/comments")
-def create_comment(id:int, body: ReliefCommentDTO, res:Response, user: AuthDetails = Depends(get_current_user)):
+def create_comment(db: DB, id:int, body: ReliefCommentDTO, res:Response, user: AuthDetails = Depends(get_current_user)):
     """
     Creates comment
     """
@@ -833,7 +828,7 @@ def create_comment(id:int, body: ReliefCommentDTO, res:Response, user: AuthDetai
     return {"detail": "Sucessfully created comment"}
 
 @router.delete("/{id}/comments/{comment_id}")
-def delete_comment(id:int, comment_id:int, res:Response, user: AuthDetails = Depends(get_current_user)):
+def delete_comment(db: DB, id:int, comment_id:int, res:Response, user: AuthDetails = Depends(get_current_user)):
     """
     Deletes comment
     """
@@ -861,7 +856,7 @@ def delete_comment(id:int, comment_id:int, res:Response, user: AuthDetails = Dep
     return {"detail": "Sucessfully deleted comment"}
 
 @router.get("/{id}/updates")
-def retrieve_updates(id:int, f: str = None):
+def retrieve_updates(db: DB, id:int, f: str = None):
     """
     Retrieves updates of relief effort with `id`
     """
@@ -895,6 +890,19 @@ async def retrieve_update_images(id:int, res:Response, update_id:int):
 
     return resu[0]
 
+# (name, email) of every user following relief `relief_id`: approved volunteers, donors and bookmarkers
+def get_relief_followers(db: Session, relief_id:int):
+    followers = union(
+        select(Volunteer.volunteer_id).filter(and_(Volunteer.relief_id == relief_id, Volunteer.status == 'APPROVED', Volunteer.is_deleted == False)),
+        select(ReceivedMoney.donor_id).filter(and_(ReceivedMoney.relief_id == relief_id, ReceivedMoney.is_deleted == False)),
+        select(InkindDonation.donor_id).filter(and_(InkindDonation.relief_id == relief_id, InkindDonation.is_deleted == False)),
+        select(ReliefBookmark.user_id).filter(and_(ReliefBookmark.relief_id == relief_id, ReliefBookmark.is_deleted == False))
+    ).subquery()
+
+    query = select(User.first_name, User.email).filter(and_(User.id.in_(select(followers.c[0])), User.is_deleted == False, User.email != None))
+
+    return [(first_name, email) for first_name, email in db.execute(query)]
+
 class CreateUpdateDTO(BaseModel):
     owner_type: str # ORGANIZATION || USER
     owner_id: int
@@ -903,7 +911,7 @@ class CreateUpdateDTO(BaseModel):
     type: str = None
 
 @router.post("/{id}/updates")
-async def create_update(id:int, res:Response, body: CreateUpdateDTO, user: AuthDetails = Depends(get_current_user)):
+async def create_update(db: DB, id:int, res:Response, body: CreateUpdateDTO, user: AuthDetails = Depends(get_current_user)):
     """
     Create update for relief `id`
     """
@@ -956,6 +964,10 @@ async def create_update(id:int, res:Response, body: CreateUpdateDTO, user: AuthD
     update.type = body.type if hasattr(body, 'type') else 'General'
 
     db.add(update)
+
+    # let everyone following the relief effort know, in the same transaction as the update
+    await relief_email_handler.send_update_notice(get_relief_followers(db, relief.id), relief.name, update.title, update.description, db=db)
+
     db.commit()
 
     return {"detail": "Successfully created update.",
@@ -965,7 +977,7 @@ async def create_update(id:int, res:Response, body: CreateUpdateDTO, user: AuthD
             }}
 
 @router.post('/{relief_id}/updates/{update_id}')
-async def upload_update_images(update_id:int, relief_id:int, res:Response, images:List[UploadFile] = File(...), user: AuthDetails = Depends(get_current_user)):
+async def upload_update_images(db: DB, update_id:int, relief_id:int, res:Response, images:List[UploadFile] = File(...), user: AuthDetails = Depends(get_current_user)):
     authorize(user, 2, 4)
 
     # check if images are valid
@@ -1002,13 +1014,82 @@ async def upload_update_images(update_id:int, relief_id:int, res:Response, image
     
     return {'detail': 'Successfully uploaded images to relief update.'} 
 
+@router.post('/{relief_id}/updates/{update_id}/uploads')
+async def issue_update_image_uploads(db: DB, update_id:int, relief_id:int, res:Response, body:IssueUploadsDTO, user: AuthDetails = Depends(get_current_user)):
+    """
+    Issues direct uploads of relief update images to storage. Finish with `POST /{relief_id}/updates/{update_id}/uploads/confirm`.
+    """
+    authorize(user, 2, 4)
+
+    relief_effort:ReliefEffort = db.query(ReliefEffort).filter(and_(ReliefEffort.id == relief_id, ReliefEffort.is_deleted == False)).first()
+
+    # check if relief exists    
+    if relief_effort is None:
+        res.status_code = 404
+        return {'detail' : 'Relief effort non-existent'}
+    
+    relief_update = db.query(ReliefUpdate).filter(and_(ReliefUpdate.id == update_id, ReliefUpdate.relief_id == relief_id, ReliefUpdate.is_deleted == False)).first()
+
+    # check if update exists
+    if relief_update is None:
+        res.status_code = 404
+        return {'detail': 'Relief update non-existing'}
+
+    # check if user is authorized to act on behalf
+    if is_authorized(relief_effort.owner_id, relief_effort.owner_type, user) == False:
+        res.status_code = 403
+        return {'detail' : 'Unable to act on behalf of relief effort.'}
+
+    resu = await file_handler.issue_uploads(body.filenames, update_id, 'relief-efforts/updates')
+
+    if resu[1] == False:
+        return upload_error_response(res, resu[0])
+
+    return {'detail' : 'Uploads issued.', 'data' : resu[0]}
+
+@router.post('/{relief_id}/updates/{update_id}/uploads/confirm')
+async def confirm_update_image_uploads(db: DB, update_id:int, relief_id:int, res:Response, body:ConfirmUploadsDTO, background_tasks:BackgroundTasks, user: AuthDetails = Depends(get_current_user)):
+    """
+    Records relief update images uploaded directly to storage.
+    """
+    authorize(user, 2, 4)
+
+    relief_effort:ReliefEffort = db.query(ReliefEffort).filter(and_(ReliefEffort.id == relief_id, ReliefEffort.is_deleted == False)).first()
+
+    # check if relief exists    
+    if relief_effort is None:
+        res.status_code = 404
+        return {'detail' : 'Relief effort non-existent'}
+    
+    relief_update = db.query(ReliefUpdate).filter(and_(ReliefUpdate.id == update_id, ReliefUpdate.relief_id == relief_id, ReliefUpdate.is_deleted == False)).first()
+
+    # check if update exists
+    if relief_update is None:
+        res.status_code = 404
+        return {'detail': 'Relief update non-existing'}
+
+    # check if user is authorized to act on behalf
+    if is_authorized(relief_effort.owner_id, relief_effort.owner_type, user) == False:
+        res.status_code = 403
+        return {'detail' : 'Unable to act on behalf of relief effort.'}
+
+    resu = await file_handler.confirm_uploads(body.public_ids, update_id, 'relief-efforts/updates')
+
+    if resu[1] == False:
+        return upload_error_response(res, resu[0])
+
+    # variants are generated once the response is sent
+    background_tasks.add_task(file_handler.process_uploads, body.public_ids)
+
+    return {'detail': 'Successfully uploaded images to relief update.'}
+
 class ReliefUpdateStatusDTO(BaseModel):
     owner_type: str
     owner_id: int
     phase: str
 
 @router.patch("/{id}/phase")
-async def update_relief_phase(id:int, res:Response, body: ReliefUpdateStatusDTO, user: AuthDetails = Depends(get_current_user)):
+async def update_relief_phase(db: DB, id:int, res:Response, body: ReliefUpdateStatusDTO, user: AuthDetails = Depends(get_current_user)):
     """
     Manually update relief effort's phase.
     """
@@ -1054,6 +1135,10 @@ async def update_relief_phase(id:int, res:Response, body: ReliefUpdateStatusDTO,
     # update status
     relief.phase = body.phase
     relief.updated_at = datetime.now()
+
+    # let everyone following the relief effort know, in the same transaction as the change
+    await relief_email_handler.send_phase_notice(get_relief_followers(db, relief.id), relief.name, relief.phase, db=db)
+
     db.commit()
 
     return {"detail" : "Relief effort phase updated."}
\ No newline at end of file
@@ -1,6 +1,6 @@
 from typing import Annotated, List
 from fastapi import APIRouter, Depends, UploadFile, HTTPException, status, Response, Body, Form
-from dependencies import get_logger, get_current_user, get_code_email_handler, get_file_handler
+from dependencies import get_db_session, get_reports_handler, get_logger, get_current_user, get_code_email_handler, get_file_handler
 from services.db.database import Session
 from services.db.models import User, Address, UserUpgradeRequest, VerificationCode, SponsorshipRequest, Organization, Report
 from services.log.log_handler import LoggingService
@@ -13,6 +13,7 @@ from util.auth.jwt_util import (
     get_hashed_password
 )
 from util.files.image_validator import is_image_valid
+from util.pagination import paginate, set_next_cursor
 from pydantic import BaseModel, Json
 from datetime import datetime, timedelta
 from sqlalchemy import and_
@@ -30,11 +31,11 @@ router = APIRouter(
 valid_types = ['comments', 'relief', 'organization']
 valid_statuses = ['pending', 'resolved', 'deleted', 'all']
 
-db = Session()
-report_handler = ReportsHandler()
+DB = Annotated[Session, Depends(get_db_session)]
+ReportsService = Annotated[ReportsHandler, Depends(get_reports_handler)]
 
 @router.get("/comments")
-def retrieve_reports(type:str, res:Response, p:int = 1, c:int = 10, status:str='pending', user:AuthDetails = Depends(get_current_user)):
+def retrieve_reports(report_handler: ReportsService, type:str, res:Response, p:int = 1, c:int = 10, cursor:str = None, status:str='pending', user:AuthDetails = Depends(get_current_user)):
     """
     Retrieves reports on comment. Takes `c` entries of page `p` with status `status`
     """
@@ -42,9 +43,10 @@ def retrieve_reports(type:str, res:Response, p:int = 1, c:int = 10, status:str='
     # check authorization
     authorize(user, 4, 4)
 
-    resu = report_handler.retrieve_reports(type, status)
+    resu = report_handler.retrieve_reports(type, status, p, c, cursor)
 
     if resu[1] == True:
+        set_next_cursor(res, resu[0], c)
         return resu[0]
 
     match resu[0]:
@@ -59,7 +61,7 @@ def retrieve_reports(type:str, res:Response, p:int = 1, c:int = 10, status:str='
             return {'detail': 'Server error.'}
 
 @router.get("/{report_id}")
-def retrieve_report(report_id:int, type:str, res:Response, user:AuthDetails = Depends(get_current_user)):
+def retrieve_report(db: DB, report_id:int, type:str, res:Response, user:AuthDetails = Depends(get_current_user)):
     """
     Retrieves report identified by `report_id`
     """
@@ -86,7 +88,7 @@ class CreateReportDTO(BaseModel):
     reason:str
 
 @router.post('/')
-def create_report(body:CreateReportDTO, res:Response, user:AuthDetails = Depends(get_current_user)):
+def create_report(report_handler: ReportsService, body:CreateReportDTO, res:Response, user:AuthDetails = Depends(get_current_user)):
     """
     Creates report.
     """
@@ -112,7 +114,7 @@ def create_report(body:CreateReportDTO, res:Response, user:AuthDetails = Depends
             return {'detail': 'Internal server error.'}
         
 @router.patch('/takedown/{report_id}')
-def takedown(report_id:int, res:Response, user:AuthDetails = Depends(get_current_user)):
+def takedown(report_handler: ReportsService, report_id:int, res:Response, user:AuthDetails = Depends(get_current_user)):
     """
     Takes down a piece of content. Requires admin access.
     """
@@ -130,7 +132,7 @@ def takedown(report_id:int, res:Response, user:AuthDetails = Depends(get_current
             return {'detail': 'Internal server error.'}
 
 @router.patch('/resolve/{report_id}')
-def resolve(report_id:int, res:Response, user:AuthDetails = Depends(get_current_user)):
+def resolve(report_handler: ReportsService, report_id:int, res:Response, user:AuthDetails = Depends(get_current_user)):
     """
     Marks report as resolved and not alarming. Requires admin access.
     """
@@ -1,7 +1,7 @@
 from typing import Annotated, List
-from fastapi import APIRouter, Depends, UploadFile, HTTPException, status, Response, Body, Form
-from dependencies import get_logger, get_current_user, get_code_email_handler, get_file_handler
-from services.db.database import Session
+from fastapi import APIRouter, Depends, UploadFile, HTTPException, status, Response, Body, Form, BackgroundTasks
+from dependencies import get_db_session, get_async_db_session, get_logger, get_current_user, get_code_email_handler, get_file_handler
+from services.db.database import Session, AsyncSession
 from services.db.models import User, Address, UserUpgradeRequest, VerificationCode, SponsorshipRequest, Organization
 from services.log.log_handler import LoggingService
 from services.email.code_email_handler import CodeEmailHandler
@@ -9,13 +9,14 @@ from services.email.user_email_handler import UserEmailHandler
 from services.storage.file_handler import FileHandler
 from models.auth_details import AuthDetails
 from util.auth.auth_tool import authorize
-from util.auth.jwt_util import (
-    get_hashed_password
-)
+from util.auth.password_hasher import hash_password
+from util.auth.principal_cache import principal_cache
 from util.files.image_validator import is_image_valid
+from util.files.direct_upload import upload_error_response
+from util.pagination import paginate, set_next_cursor
 from pydantic import BaseModel, Json
 from datetime import datetime, timedelta
-from sqlalchemy import and_
+from sqlalchemy import and_, select
 import json
 from types import SimpleNamespace
 from util.code_generator import generate_code
@@ -26,7 +27,8 @@ router = APIRouter(
     dependencies=[]
 )
 
-db = Session()
+DB = Annotated[Session, Depends(get_db_session)]
+AsyncDB = Annotated[AsyncSession, Depends(get_async_db_session)]
 file_handler = FileHandler()
 user_email_handler = UserEmailHandler()
 code_email_handler = CodeEmailHandler()
@@ -65,20 +67,23 @@ class RetrieveUserResponse(BaseModel):
 
 
 @router.get("/")
-async def retrieve_users(p: int = 1, c: int = 10):
+async def retrieve_users(db: AsyncDB, res: Response, p: int = 1, c: int = 10, cursor: str = None):
     """
-    Retrieves users (non-admin). Gets `c` amount of users according to `p` page
+    Retrieves users (non-admin). Gets `c` amount of users according to `p` page, or after `cursor` when given
     """
 
     # Gets list of users
-    users:List[User] = db.query(User).filter(and_(User.is_deleted == False, User.level < 4)).limit(c).offset((p-1)*c).all() 
+    users:List[User] = (await db.execute(paginate(select(User).filter(and_(User.is_deleted == False, User.level < 4)), User, p, c, cursor))).scalars().all()
+    set_next_cursor(res, users, c)
     
     # initialize array of users
     to_return = []
 
+    profile_links = await file_handler.get_user_profiles([user.id for user in users], 'thumbnail')
+
     # iterate and only select necessary data from each user
     for user in users:
-        profile_link = await file_handler.get_user_profile(user.id)
+        profile_link = profile_links[user.id]
         to_return.append({
             "id" : user.id,
             "sponsor_id" : user.sponsor_id,
@@ -92,7 +97,7 @@ async def retrieve_users(p: int = 1, c: int = 10):
     return to_return
 
 @router.get("/{id}")
-async def retrieve_user(id:int):
+async def retrieve_user(db: DB, id:int):
     """
     Retrieves a particular user, identified by `id`.
     """
@@ -124,7 +129,7 @@ async def retrieve_user(id:int):
 
 
 @router.get("/is-username-taken")
-async def check_if_username_is_taken(username:str, res:Response):
+async def check_if_username_is_taken(db: DB, username:str, res:Response):
     """
     Checks if username is already taken.
     """
@@ -135,7 +140,7 @@ async def check_if_username_is_taken(username:str, res:Response):
     return True
 
 @router.get("/is-email-taken")
-async def check_if_email_is_taken(email:str, res:Response):
+async def check_if_email_is_taken(db: DB, email:str, res:Response):
     """
     Checks if email is already taken
     """
@@ -155,7 +160,7 @@ class BasicUserDTO(BaseModel):
     mobile: str
 
 @router.post("/basic")
-async def basic_signup(res: Response, body:BasicUserDTO):
+async def basic_signup(db: DB, res: Response, body:BasicUserDTO):
     """
     Creates level 1 user.
     Requires `fname`, `lname`, `username`, `password`, `confirmPassword`, `email`, `mobile`.
@@ -189,7 +194,7 @@ async def basic_signup(res: Response, body:BasicUserDTO):
     user.first_name = body.fname
     user.last_name = body.lname
     user.username = body.username
-    user.password =  get_hashed_password(body.password)
+    user.password = await hash_password(body.password)
     user.email = body.email
     user.mobile = body.mobile
     user.level = 1
@@ -207,11 +212,12 @@ async def basic_signup(res: Response, body:BasicUserDTO):
     verification_request.expired_at = datetime.now() + timedelta(days=1)
 
     db.add(verification_request)
-    db.commit()
 
     # send verification code to user
-    ## thru email
-    await code_email_handler.send_email_verfication_code(user.email, user.first_name, verification_request.code)
+    ## thru email, queued in the same transaction as the code
+    await code_email_handler.send_email_verfication_code(user.email, user.first_name, verification_request.code, db=db)
+
+    db.commit()
 
     # return HTTP 200
     return {
@@ -219,7 +225,7 @@ async def basic_signup(res: Response, body:BasicUserDTO):
     }
 
 @router.post("/personal/verify/{user_email}")
-async def verify_email(user_email:str, code:str, res:Response):
+async def verify_email(db: DB, user_email:str, code:str, res:Response):
     """
     Verify user email.
     """
@@ -270,7 +276,7 @@ class UpgradeAccountDTO(BaseModel):
     coordinates: str
 
 @router.post("/upgrades")
-async def upgrade_personal_account(res: Response, valid_id: UploadFile, body:UpgradeAccountDTO = Form(), user: AuthDetails = Depends(get_current_user)):
+async def upgrade_personal_account(db: DB, res: Response, valid_id: UploadFile, body:UpgradeAccountDTO = Form(), user: AuthDetails = Depends(get_current_user)):
     """
     Upgrades user to account level 2
     """
@@ -291,10 +297,55 @@ async def upgrade_personal_account(res: Response, valid_id: UploadFile, body:Upg
         res.status_code = 500
         return {'detail': 'Error uploading image.'}
 
-    # create account upgrade request
+    save_upgrade_request(db, user.user_id, body)
+
+    return {'detail' : 'Successfully sent upgrade request.'}
+
+class IssueUploadDTO(BaseModel):
+    filename: str
+
+class ConfirmUpgradeAccountDTO(UpgradeAccountDTO):
+    # public id of the valid id, as issued by `POST /upgrades/valid-id/upload`
+    valid_id: str
+
+@router.post("/upgrades/valid-id/upload")
+async def issue_valid_id_upload(res: Response, body:IssueUploadDTO, user: AuthDetails = Depends(get_current_user)):
+    """
+    Issues a direct upload of the valid id to storage. Finish with `POST /upgrades/confirm`.
+    """
+    authorize(user, 1, 1)
+
+    resu = await file_handler.issue_uploads([body.filename], user.user_id, 'valid_ids')
+
+    if resu[1] == False:
+        return upload_error_response(res, resu[0])
+
+    return {'detail' : 'Upload issued.', 'data' : resu[0][0]}
+
+@router.post("/upgrades/confirm")
+async def confirm_upgrade_personal_account(db: DB, res: Response, body:ConfirmUpgradeAccountDTO, background_tasks:BackgroundTasks, user: AuthDetails = Depends(get_current_user)):
+    """
+    Upgrades user to account level 2, with a valid id uploaded directly to storage.
+    """
+    authorize(user, 1, 1)
+
+    resu = await file_handler.confirm_uploads([body.valid_id], user.user_id, 'valid_ids')
+
+    if resu[1] == False:
+        return upload_error_response(res, resu[0])
+
+    # variants are generated once the response is sent
+    background_tasks.add_task(file_handler.process_uploads, [body.valid_id])
+
+    save_upgrade_request(db, user.user_id, body)
+
+    return {'detail' : 'Successfully sent upgrade request.'}
+
+# creates the account upgrade request and address of user `user_id`
+def save_upgrade_request(db: Session, user_id:int, body:UpgradeAccountDTO):
     upgrade_request = UserUpgradeRequest()
     
-    upgrade_request.user_id = user.user_id
+    upgrade_request.user_id = user_id
     upgrade_request.first_name = body.first_name
     upgrade_request.last_name = body.last_name
     upgrade_request.birthday = body.birthday
@@ -305,7 +356,7 @@ async def upgrade_personal_account(res: Response, valid_id: UploadFile, body:Upg
     # save address
     address = Address()
 
-    address.owner_id = user.user_id
+    address.owner_id = user_id
     address.owner_type = 'USER'
     address.region = body.region
     address.city = body.city
@@ -318,10 +369,8 @@ async def upgrade_personal_account(res: Response, valid_id: UploadFile, body:Upg
     db.add(address)
     db.commit()
 
-    return {'detail' : 'Successfully sent upgrade request.'}
-
 @router.get("/upgrades/")
-def retrieve_upgrade_requests(p: int = 1, c: int = 10, status:str = 'ALL', user: AuthDetails = Depends(get_current_user)):
+def retrieve_upgrade_requests(db: DB, res: Response, p: int = 1, c: int = 10, cursor: str = None, status:str = 'ALL', user: AuthDetails = Depends(get_current_user)):
     """
     Retrieve upgrade requests. Requires admin access.
     """
@@ -329,24 +378,24 @@ def retrieve_upgrade_requests(p: int = 1, c: int = 10, status:str = 'ALL', user:
     # check user authorization
     authorize(user, 4, 4) # only admin can see upgrade requests
     
-    # initializes request list
-    requests = List[UserUpgradeRequest]
+    query = db.query(UserUpgradeRequest)
 
     match status.lower():
         case 'pending':
-            requests = db.query(UserUpgradeRequest).filter(UserUpgradeRequest.status == 'PENDING').limit(c).offset((p-1)*c).all()
+            query = query.filter(UserUpgradeRequest.status == 'PENDING')
         case 'rejected':
-            requests = db.query(UserUpgradeRequest).filter(UserUpgradeRequest.status == 'REJECTED').limit(c).offset((p-1)*c).all()
+            query = query.filter(UserUpgradeRequest.status == 'REJECTED')
         case 'approved':
-            requests = db.query(UserUpgradeRequest).filter(UserUpgradeRequest.status == 'APPROVED').limit(c).offset((p-1)*c).all()
-        case _:
-            # returns all when query is invalid
-            requests = db.query(UserUpgradeRequest).limit(c).offset((p-1)*c).all()
+            query = query.filter(UserUpgradeRequest.status == 'APPROVED')
+        # returns all when query is invalid
+
+    requests:List[UserUpgradeRequest] = paginate(query, UserUpgradeRequest, p, c, cursor).all()
+    set_next_cursor(res, requests, c)
 
     return requests
 
 @router.get("/upgrades/{upgrade_request_id}/valid-id")
-async def retrieve_valid_id(upgrade_request_id:int, res:Response, user: AuthDetails = Depends(get_current_user)):
+async def retrieve_valid_id(db: DB, upgrade_request_id:int, res:Response, user: AuthDetails = Depends(get_current_user)):
     """
     Retrieve request valid id. Requires admin access.
     """
@@ -373,7 +422,7 @@ async def retrieve_valid_id(upgrade_request_id:int, res:Response, user: AuthDeta
     return resu[0]
 
 @router.get("/upgrades/{upgrade_request_id}")
-async def retrieve_upgrade_request(res:Response, upgrade_request_id: int, user: AuthDetails = Depends(get_current_user)):
+async def retrieve_upgrade_request(db: DB, res:Response, upgrade_request_id: int, user: AuthDetails = Depends(get_current_user)):
     """
     Retrieves particular user upgrade request via `upgrade_request_id`. Requires admin access.
     """
@@ -404,7 +453,7 @@ async def retrieve_upgrade_request(res:Response, upgrade_request_id: int, user:
     return to_return
 
 @router.post("/upgrades/{action}/{upgrade_request_id}")
-async def resolve_upgrade_request(action:str, upgrade_request_id, res:Response, user: AuthDetails = Depends(get_current_user)):
+async def resolve_upgrade_request(db: DB, action:str, upgrade_request_id, res:Response, user: AuthDetails = Depends(get_current_user)):
     """
     Resolves (approve/reject) user upgrade request of `upgrade_request_id`. Requires admin access.
     """
@@ -429,10 +478,11 @@ async def resolve_upgrade_request(action:str, upgrade_request_id, res:Response,
             
             # increment user id
             user.level = 2
-            await user_email_handler.send_upgrade_approval_notice(user.first_name, user.email)
+            user.token_version = User.token_version + 1
+            await user_email_handler.send_upgrade_approval_notice(user.first_name, user.email, db=db)
         case 'reject':
             upgrade_request.status = 'REJECTED'
-            await user_email_handler.send_upgrade_rejection_notice(user.first_name, user.email)
+            await user_email_handler.send_upgrade_rejection_notice(user.first_name, user.email, db=db)
         case _:
             # return HTTP 406 when action is not allowed
             res.status_code = 406
@@ -442,6 +492,7 @@ async def resolve_upgrade_request(action:str, upgrade_request_id, res:Response,
     upgrade_request.updated_at = datetime.now()
 
     db.commit()
+    principal_cache.invalidate(user.id)
 
     return {'detail' : 'Successfully resolved upgrade request.'}
 
@@ -450,7 +501,7 @@ class EditUserDetailsDTO(BaseModel):
     mobile:str = None
 
 @router.patch("/details")
-async def edit_user_details(body:EditUserDetailsDTO, res:Response, user: AuthDetails = Depends(get_current_user)):
+async def edit_user_details(db: DB, body:EditUserDetailsDTO, res:Response, user: AuthDetails = Depends(get_current_user)):
     """
     Edits user details.
     """
@@ -471,7 +522,7 @@ async def edit_user_details(body:EditUserDetailsDTO, res:Response, user: AuthDet
     return {'detail': 'Successfully edited user details.'}
 
 @router.patch("/address")
-async def edit_user_address(res: Response, body: NewAddressDTO, user: AuthDetails = Depends(get_current_user)):#
+async def edit_user_address(db: DB, res: Response, body: NewAddressDTO, user: AuthDetails = Depends(get_current_user)):#
     """
     Edits user's address.
     """
@@ -506,7 +557,7 @@ async def save_user_profile(image: UploadFile, res:Response, user: AuthDetails =
     authorize(user, 1, 4)
     
     # checks if file has valid suffix, returns HTTP 400 if invalid
-    if file_handler.is_file_valid(image, file_handler.allowed_img_suffix) == False:
+    if await file_handler.is_file_valid(image, file_handler.allowed_img_suffix) == False:
         res.status_code = 400
         return {"detail" : "Invalid image format."}
 
@@ -522,9 +573,42 @@ async def save_user_profile(image: UploadFile, res:Response, user: AuthDetails =
         "detail": "Profile successfully uploaded."
     }
 
+@router.post("/profile/upload")
+async def issue_user_profile_upload(res:Response, body:IssueUploadDTO, user: AuthDetails = Depends(get_current_user)):
+    """
+    Issues a direct upload of the user's profile image to storage. Finish with `POST /profile/confirm`.
+    """
+    authorize(user, 1, 4)
+
+    resu = await file_handler.issue_upload(body.filename, user.user_id, 'users')
+
+    if resu[1] == False:
+        return upload_error_response(res, resu[0])
+
+    return {'detail' : 'Upload issued.', 'data' : resu[0]}
+
+@router.post("/profile/confirm")
+async def confirm_user_profile_upload(res:Response, background_tasks:BackgroundTasks, user: AuthDetails = Depends(get_current_user)):
+    """
+    Sets the profile image uploaded directly to storage as the user's profile.
+    """
+    authorize(user, 1, 4)
+
+    resu = await file_handler.confirm_upload(user.user_id, 'users')
+
+    if resu[1] == False:
+        return upload_error_response(res, resu[0])
+
+    # variants are generated once the response is sent
+    background_tasks.add_task(file_handler.process_uploads, [f"relieph/users/{user.user_id}"])
+
+    return {
+        "detail": "Profile successfully uploaded."
+    }
+
 # get user profile
 @router.get("/{id}/profile")
-async def retrieve_user_profile_image(id:int, res: Response):
+async def retrieve_user_profile_image(db: DB, id:int, res: Response):
     """
     Returns user profile image.
     """
@@ -540,7 +624,7 @@ async def retrieve_user_profile_image(id:int, res: Response):
     return profile_link
 
 @router.delete("/{id}")
-async def delete_user(id:int, res: Response, user:AuthDetails = Depends(get_current_user)):
+async def delete_user(db: DB, id:int, res: Response, user:AuthDetails = Depends(get_current_user)):
     # checks for user authorization
     authorize(user, 1,4)
     
@@ -554,8 +638,10 @@ async def delete_user(id:int, res: Response, user:AuthDetails = Depends(get_curr
     user:User = db.query(User).filter(User.id == user.user_id).first()
     # sets user.is_deleted to `True`
     user.is_deleted = True
+    user.token_version = User.token_version + 1
 
     db.commit()
+    principal_cache.invalidate(user.id)
 
     return {
         "detail" : "Successfully deleted user."
@@ -566,7 +652,7 @@ class UserSponsorshipRequestDTO(BaseModel):
     message: str
 
 @router.post("/{id}/sponsorship")
-async def apply_for_sponsorship(body:UserSponsorshipRequestDTO, res:Response, user:AuthDetails = Depends(get_current_user)):
+async def apply_for_sponsorship(db: DB, body:UserSponsorshipRequestDTO, res:Response, user:AuthDetails = Depends(get_current_user)):
     """
     Allows user to apply for sponsorship in foundation
     """
@@ -1,9 +1,10 @@
 from typing import Annotated, List
 from fastapi import APIRouter, Depends, HTTPException, status, Response
-from dependencies import get_logger, get_current_user
+from dependencies import get_db_session, get_logger, get_current_user, get_counter_handler
 from services.db.database import Session, engine
 from services.db.models import Volunteer, VolunteerRequirement, ReliefEffort, User
 from services.email.volunteer_email_handler import VolunteerEmailHandler
+from services.counters.counter_handler import CounterHandler
 from models.auth_details import AuthDetails
 from util.auth.auth_tool import authorize, is_authorized
 from sqlalchemy import and_
@@ -16,11 +17,12 @@ router = APIRouter(
     dependencies=[Depends(get_logger)]
 )
 
-db = Session()
+DB = Annotated[Session, Depends(get_db_session)]
+Counters = Annotated[CounterHandler, Depends(get_counter_handler)]
 volunteer_email_handler = VolunteerEmailHandler()
 
 @router.get("/{relief_id}")
-def retrieve_volunteer_requirements(relief_id:int):
+def retrieve_volunteer_requirements(db: DB, relief_id:int):
     """
     Retrieve list of volunteer requirements for relief `relief_id`
     """
@@ -39,7 +41,7 @@ def retrieve_volunteer_requirements(relief_id:int):
     return volunteer_requirements
 
 @router.get("/{relief_id}/volunteers")
-def retrieve_applicants(relief_id:int, type:str, res:Response, user:AuthDetails = Depends(get_current_user)):
+def retrieve_applicants(db: DB, relief_id:int, type:str, res:Response, user:AuthDetails = Depends(get_current_user)):
     # check for authorization
     authorize(user, 2, 4)
 
@@ -119,7 +121,7 @@ class VolunteerRequirementsDTO(BaseModel):
 #     return {"details": "Organization created."}
 
 @router.patch("/{id}")
-def edit_volunteer_requirements(body:VolunteerRequirementsDTO, res:Response, id: int, user:AuthDetails = Depends(get_current_user)):
+def edit_volunteer_requirements(db: DB, body:VolunteerRequirementsDTO, res:Response, id: int, user:AuthDetails = Depends(get_current_user)):
     """
     Edit volunteer requirement with `id`
     """
@@ -149,7 +151,7 @@ def edit_volunteer_requirements(body:VolunteerRequirementsDTO, res:Response, id:
     return {"detail": "Volunteer requirements successfully updated."}
 
 @router.post("/{volunteer_requirement_id}/apply")
-def apply_as_volunteer(volunteer_requirement_id:int, res:Response, user:AuthDetails = Depends(get_current_user)):
+def apply_as_volunteer(db: DB, volunteer_requirement_id:int, res:Response, user:AuthDetails = Depends(get_current_user)):
     """
     Apply as volunteer to a relief, specifically for volunteer requirement `id`
     """
@@ -179,7 +181,7 @@ def apply_as_volunteer(volunteer_requirement_id:int, res:Response, user:AuthDeta
     return {"details": "Successfully applied as a volunteer."}
 
 @router.patch("/{volunteer_requirement_id}/approve/{user_id}")
-async def approve_application (volunteer_requirement_id:int, user_id:int, res:Response, user : AuthDetails = Depends(get_current_user)):
+async def approve_application (db: DB, counters: Counters, volunteer_requirement_id:int, user_id:int, res:Response, user : AuthDetails = Depends(get_current_user)):
     """
     Approve volunteer application
     """
@@ -191,7 +193,8 @@ async def approve_application (volunteer_requirement_id:int, user_id:int, res:Re
         res.status_code = 404
         return {"detail": "Relief effort not found."}
     
-    volunteer:Volunteer = db.query(Volunteer).filter(Volunteer.volunteer_id == user_id).first()
+    # locked until commit, so concurrent requests count the status change once
+    volunteer:Volunteer = db.query(Volunteer).filter(Volunteer.volunteer_id == user_id).with_for_update().first()
 
     # check if volunteer exists
     if volunteer is None:
@@ -204,19 +207,21 @@ async def approve_application (volunteer_requirement_id:int, user_id:int, res:Re
         res.status_code = 403
         return {'detail' : 'Not authorized to access this resource.'}
     
+    # only count the volunteer the first time they are approved
+    if volunteer.status != 'APPROVED' and volunteer.is_deleted == False:
+        counters.record_volunteer(volunteer.volunteer_requirement_id, volunteer.relief_id)
+
     volunteer.status = 'APPROVED'
 
-    volunteer_requirement.count += 1
+    _user:User = db.query(User).filter(and_(User.id == volunteer.volunteer_id)).first()
+    await volunteer_email_handler.send_volunteer_acceptance_notice(_user.first_name, _user.email, relief.name, db=db)
 
     db.commit()
-    
-    _user:User = db.query(User).filter(and_(User.id == volunteer.volunteer_id)).first()
-    await volunteer_email_handler.send_volunteer_acceptance_notice(_user.first_name, _user.email, relief.name)
 
     return {"detail": "Volunteer approved."}
 
 @router.patch("/{volunteer_requirement_id}/reject/{user_id}")
-async def reject_application (volunteer_requirement_id:int, user_id:int, res:Response, user:AuthDetails = Depends(get_current_user)):
+async def reject_application (db: DB, counters: Counters, volunteer_requirement_id:int, user_id:int, res:Response, user:AuthDetails = Depends(get_current_user)):
     """
     Reject volunteer application
     """
@@ -228,7 +233,8 @@ async def reject_application (volunteer_requirement_id:int, user_id:int, res:Res
         res.status_code = 404
         return {"detail": "Relief effort not found."}
     
-    volunteer:Volunteer = db.query(Volunteer).filter(Volunteer.volunteer_id == user_id).first()
+    # locked until commit, so concurrent requests count the status change once
+    volunteer:Volunteer = db.query(Volunteer).filter(Volunteer.volunteer_id == user_id).with_for_update().first()
     
     # check if volunteer exists
     if volunteer is None:
@@ -243,17 +249,21 @@ async def reject_application (volunteer_requirement_id:int, user_id:int, res:Res
         res.status_code = 403
         return {'detail' : 'Not authorized to access this resource.'}
 
+    # take back the volunteer if they were previously approved
+    if volunteer.status == 'APPROVED' and volunteer.is_deleted == False:
+        counters.record_volunteer(volunteer.volunteer_requirement_id, volunteer.relief_id, -1)
+
     volunteer.status = 'REJECTED'
 
-    db.commit()
-    
     _user:User = db.query(User).filter(and_(User.id == volunteer.volunteer_id)).first()
-    await volunteer_email_handler.send_volunteer_rejection_notice(_user.first_name, _user.email, relief.name)
+    await volunteer_email_handler.send_volunteer_rejection_notice(_user.first_name, _user.email, relief.name, db=db)
+
+    db.commit()
 
     return {"detail": "Volunteer rejected."}
 
 @router.delete("/{volunteer_requirement_id}/remove/")
-def remove_application (volunteer_requirement_id:int, user_id:int, res:Response, user: AuthDetails = Depends(get_current_user)):
+def remove_application (db: DB, counters: Counters, volunteer_requirement_id:int, user_id:int, res:Response, user: AuthDetails = Depends(get_current_user)):
     """
     Remove application. Used for users who want to remove their application from a volunteer event
     """
@@ -266,13 +276,18 @@ def remove_application (volunteer_requirement_id:int, user_id:int, res:Response,
         res.status_code = 404
         return {"detail": "Relief effort not found."}
     
-    volunteer:Volunteer = db.query(Volunteer).filter(Volunteer.volunteer_id == user.user_id).first()
+    # locked until commit, so concurrent requests count the status change once
+    volunteer:Volunteer = db.query(Volunteer).filter(Volunteer.volunteer_id == user.user_id).with_for_update().first()
 
     # check if volunteer exists
     if volunteer is None:
         res.status_code = 404
         return {"detail": "User not found."}
     
+    # take back the volunteer if they were previously approved
+    if volunteer.status == 'APPROVED' and volunteer.is_deleted == False:
+        counters.record_volunteer(volunteer.volunteer_requirement_id, volunteer.relief_id, -1)
+
     # soft delete volunteer
     volunteer.is_deleted = True
 
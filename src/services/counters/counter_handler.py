@@ -0,0 +1,94 @@
+import logging
+from sqlalchemy import and_, func, select, delete, literal
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from services.db.database import Session as SessionMaker
+from services.db.models import ReliefCounter, RequirementCounter, ReceivedMoney, InkindDonation, Volunteer
+
+logger = logging.getLogger(__name__)
+
+class CounterHandler():
+    """
+    Maintains the materialized progress counters of relief efforts.
+
+    Counters are written with the caller's session and are never committed here,
+    so they land in the same transaction as the change they describe.
+    """
+    def __init__(self, db:Session):
+        self.db = db
+
+    # adds `amount` to the money raised by relief `relief_id`
+    def record_money(self, relief_id:int, amount, donations:int = 1):
+        stmt = insert(ReliefCounter).values(relief_id=relief_id, money_raised=amount, donation_count=donations)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ReliefCounter.relief_id],
+            set_={
+                'money_raised' : ReliefCounter.money_raised + stmt.excluded.money_raised,
+                'donation_count' : ReliefCounter.donation_count + stmt.excluded.donation_count,
+                'updated_at' : func.now()
+            }
+        )
+        self.db.execute(stmt)
+
+    # adds `quantity` delivered items to inkind requirement `requirement_id`; negative to take back
+    def record_inkind(self, requirement_id:int, relief_id:int, quantity:int):
+        self.record_requirement('INKIND', requirement_id, relief_id, quantity)
+
+    # adds `count` approved volunteers to volunteer requirement `requirement_id`; negative to take back
+    def record_volunteer(self, requirement_id:int, relief_id:int, count:int = 1):
+        self.record_requirement('VOLUNTEER', requirement_id, relief_id, count)
+
+    def record_requirement(self, requirement_type:str, requirement_id:int, relief_id:int, delta:int):
+        stmt = insert(RequirementCounter).values(
+            requirement_type=requirement_type,
+            requirement_id=requirement_id,
+            relief_id=relief_id,
+            fulfilled=delta
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[RequirementCounter.requirement_type, RequirementCounter.requirement_id],
+            set_={
+                'fulfilled' : RequirementCounter.fulfilled + stmt.excluded.fulfilled,
+                'updated_at' : func.now()
+            }
+        )
+        self.db.execute(stmt)
+
+    # recomputes every counter from the source tables
+    def rebuild(self):
+        self.db.execute(delete(ReliefCounter))
+        self.db.execute(delete(RequirementCounter))
+
+        money = select(
+                    ReceivedMoney.relief_id,
+                    func.sum(ReceivedMoney.amount),
+                    func.count()
+                ).filter(ReceivedMoney.is_deleted == False).group_by(ReceivedMoney.relief_id)
+        self.db.execute(insert(ReliefCounter).from_select(['relief_id', 'money_raised', 'donation_count'], money))
+
+        inkind = select(
+                    literal('INKIND'),
+                    InkindDonation.inkind_requirement_id,
+                    func.min(InkindDonation.relief_id),
+                    func.sum(InkindDonation.quantity)
+                ).filter(and_(InkindDonation.status == 'DELIVERED', InkindDonation.is_deleted == False)).group_by(InkindDonation.inkind_requirement_id)
+        self.db.execute(insert(RequirementCounter).from_select(['requirement_type', 'requirement_id', 'relief_id', 'fulfilled'], inkind))
+
+        volunteers = select(
+                    literal('VOLUNTEER'),
+                    Volunteer.volunteer_requirement_id,
+                    func.min(Volunteer.relief_id),
+                    func.count()
+                ).filter(and_(Volunteer.status == 'APPROVED', Volunteer.is_deleted == False)).group_by(Volunteer.volunteer_requirement_id)
+        self.db.execute(insert(RequirementCounter).from_select(['requirement_type', 'requirement_id', 'relief_id', 'fulfilled'], volunteers))
+
+# reconciliation job; repairs any drift between the counters and the source tables
+def rebuild_counters():
+    with SessionMaker() as db:
+        try:
+            CounterHandler(db).rebuild()
+            db.commit()
+            logger.info("Successfully rebuilt relief counters.")
+        except Exception:
+            db.rollback()
+            logger.exception("Error in rebuilding relief counters.")
@@ -1,15 +1,52 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession as AsyncSessionClass
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
+from .pool import MeteredQueuePool, MeteredAsyncQueuePool, pool_metrics, async_pool_metrics, pool_options
 import os
 
 load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.environ.get("DB_KEY")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# derives the asyncpg url from the sync url when not set explicitly
+def get_async_database_url(url:str):
+    url = make_url(url)
+    query = dict(url.query)
+
+    # asyncpg does not understand libpq's `sslmode`
+    if 'sslmode' in query:
+        query['ssl'] = query.pop('sslmode')
+
+    return url.set(drivername=f'{url.get_backend_name()}+asyncpg', query=query)
+
+ASYNC_SQLALCHEMY_DATABASE_URL = os.environ.get("ASYNC_DB_KEY") or get_async_database_url(SQLALCHEMY_DATABASE_URL)
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=MeteredQueuePool, **pool_options())
 Session = sessionmaker(bind=engine)
 session = Session
 
-Base = declarative_base()
\ No newline at end of file
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, poolclass=MeteredAsyncQueuePool, **pool_options())
+AsyncSession = sessionmaker(bind=async_engine, class_=AsyncSessionClass, expire_on_commit=False)
+
+def register_pool_events(sync_engine, metrics):
+    @event.listens_for(sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        metrics.record_connect()
+
+    @event.listens_for(sync_engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.record_invalidation()
+
+register_pool_events(engine, pool_metrics)
+register_pool_events(async_engine.sync_engine, async_pool_metrics)
+
+def get_pool_status():
+    return {
+        "sync" : pool_metrics.snapshot(engine.pool),
+        "async" : async_pool_metrics.snapshot(async_engine.pool)
+    }
+
+Base = declarative_base()
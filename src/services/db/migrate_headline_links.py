@@ -0,0 +1,71 @@
+"""
+Builds the unique index on `headlines.link` in a database created before it
+existed. Run once before deploying the code that relies on it:
+
+    python -m services.db.migrate_headline_links [--attempts N]
+
+All headlines but the oldest of each link are deleted, and generated reliefs
+pointing at the deleted ones are moved to the kept one. The index is then
+built concurrently, so the scraper keeps writing meanwhile; duplicates it
+writes fail the build, which is dropped and tried again.
+"""
+import sys
+import argparse
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from .database import engine
+
+INDEX = 'ux_headlines_link'
+
+DEDUPLICATE = [
+    text("""
+        UPDATE generated_relief g SET headline_id = d.keep_id
+        FROM (SELECT id, min(id) OVER (PARTITION BY link) AS keep_id FROM headlines) d
+        WHERE g.headline_id = d.id AND d.id <> d.keep_id
+    """),
+    text("DELETE FROM headlines h USING headlines k WHERE h.link = k.link AND h.id > k.id")
+]
+
+CREATE_INDEX = text(f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {INDEX} ON headlines (link)")
+
+# null when the index does not exist, false when a failed concurrent build left it behind
+INDEX_VALID_QUERY = text("""
+    SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name
+""")
+
+# returns whether the index is in place
+def migrate(attempts:int = 3):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as con:
+        for attempt in range(attempts):
+            valid = con.execute(INDEX_VALID_QUERY, {'name': INDEX}).scalar()
+            if valid:
+                return True
+            if valid is not None:
+                con.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {INDEX}'))
+
+            with engine.begin() as tx:
+                for statement in DEDUPLICATE:
+                    result = tx.execute(statement)
+                print(f'Deleted {result.rowcount} duplicate headlines.')
+
+            try:
+                con.execute(CREATE_INDEX)
+            except IntegrityError as e:
+                print(f'Duplicates written while building {INDEX} (attempt {attempt + 1}): {e.orig}')
+
+        return bool(con.execute(INDEX_VALID_QUERY, {'name': INDEX}).scalar())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--attempts', type=int, default=3, help='index builds to try before giving up')
+    args = parser.parse_args()
+
+    if not migrate(args.attempts):
+        print(f'Unable to build {INDEX}; duplicates keep being written.')
+        sys.exit(1)
+
+    print(f'{INDEX} is in place.')
+
+if __name__ == '__main__':
+    main()
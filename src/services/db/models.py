@@ -1,6 +1,7 @@
 # coding: utf-8
-from sqlalchemy import Boolean, Column, Date, DateTime, ForeignKey, Integer, Numeric, SmallInteger, String, Text, text, BigInteger
+from sqlalchemy import Boolean, Column, Date, DateTime, ForeignKey, Integer, Numeric, SmallInteger, String, Text, text, BigInteger, Index, func, literal_column
 from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 
 from .database import Base, Session, engine
@@ -8,6 +9,20 @@ from .database import Base, Session, engine
 Base = declarative_base()
 metadata = Base.metadata
 
+# sort key of paginated listings: created_at, with rows that have none (older schemas left
+# it nullable) sorted as the oldest. to_timestamp is immutable, so the key can be indexed
+def created_sort_key(created_at):
+    return func.coalesce(created_at, func.to_timestamp(literal_column('0')))
+
+# columns added to tables that already existed, which create_all leaves alone
+ADDED_COLUMNS = [
+    'ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version integer NOT NULL DEFAULT 0'
+]
+
+# indexes on tables that may already hold rows they would reject, built by a migration
+# instead (see `services.db.migrate_headline_links`); new databases get them from create_all
+MIGRATED_INDEXES = {'ux_headlines_link'}
+
 class Address(Base):
     __tablename__ = 'addresses'
 
@@ -24,6 +39,8 @@ class Address(Base):
     created_at = Column(DateTime(True), server_default=text("CURRENT_TIMESTAMP"))
     updated_at = Column(DateTime(True))
 
+Index('ix_addresses_owner_location', Address.owner_type, Address.owner_id, Address.city, Address.region)
+
 
 class Headline(Base):
     __tablename__ = 'headlines'
@@ -37,6 +54,9 @@ class Headline(Base):
     updated_at = Column(DateTime(True))
     article = Column(Text, nullable=False)
 
+Index('ix_headlines_sort_key_id', created_sort_key(Headline.created_at), Headline.id)
+Index('ux_headlines_link', Headline.link, unique=True)
+
 
 class GenerateRelief(Base):
     __tablename__ = 'generated_relief'
@@ -70,7 +90,7 @@ class InkindDonationRequirement(Base):
     __tablename__ = 'inkind_donation_requirements'
 
     id = Column(Integer, primary_key=True, server_default=text("nextval('inkind_donation_requirements_id_seq'::regclass)"))
-    relief_id = Column(Integer, nullable=False)
+    relief_id = Column(Integer, nullable=False, index=True)
     name = Column(String(150), nullable=False)
     description = Column(String(250))
     count = Column(Integer, server_default=text("0"))
@@ -93,6 +113,8 @@ class ReceivedMoney(Base):
     created_at = Column(DateTime(True), server_default=text("CURRENT_TIMESTAMP"))
     updated_at = Column(DateTime(True))
 
+Index('ix_received_money_relief_id_sort_key_id', ReceivedMoney.relief_id, created_sort_key(ReceivedMoney.created_at), ReceivedMoney.id)
+
 
 class ReliefBookmark(Base):
     __tablename__ = 'relief_bookmarks'
@@ -110,7 +132,7 @@ class ReliefComment(Base):
 
     id = Column(Integer, primary_key=True, server_default=text("nextval('relief_comments_id_seq'::regclass)"))
     user_id = Column(Integer, nullable=False)
-    relief_id = Column(Integer, nullable=False)
+    relief_id = Column(Integer, nullable=False, index=True)
     message = Column(Text, nullable=False)
     is_deleted = Column(Boolean, nullable=False, server_default=text("false"))
     created_at = Column(DateTime(True), server_default=text("CURRENT_TIMESTAMP"))
@@ -141,6 +163,20 @@ class ReliefEffort(Base):
     is_accepting_volunteers = Column(Boolean, server_default=text("true"))
     is_accepting_money = Column(Boolean, server_default=text("true"))
 
+# text of a relief effort searched by keyword
+relief_search_text = (
+    func.coalesce(ReliefEffort.name, text("''")) + text("' '") +
+    func.coalesce(ReliefEffort.description, text("''")) + text("' '") +
+    func.coalesce(ReliefEffort.disaster_type, text("''"))
+)
+
+# full-text search document of a relief effort. searches must use this exact
+# expression (literals included) for Postgres to match it against the index
+relief_search_document = func.to_tsvector(text("'english'"), relief_search_text)
+
+Index('ix_relief_efforts_search', relief_search_document, postgresql_using='gin')
+Index('ix_relief_efforts_active_type', ReliefEffort.is_active, ReliefEffort.disaster_type)
+
 class ReliefPaymentKey(Base):
     __tablename__ = 'relief_payment_keys'
 
@@ -157,7 +193,7 @@ class ReliefUpdate(Base):
     __tablename__ = 'relief_updates'
 
     id = Column(Integer, primary_key=True, server_default=text("nextval('relief_updates_id_seq'::regclass)"))
-    relief_id = Column(Integer, nullable=False)
+    relief_id = Column(Integer, nullable=False, index=True)
     title = Column(String(150), nullable=False)
     description = Column(Text, nullable=False)
     media_dir = Column(String(255))
@@ -180,6 +216,8 @@ class UsedMoney(Base):
     created_at = Column(DateTime(True), server_default=text("CURRENT_TIMESTAMP"))
     updated_at = Column(DateTime(True))
 
+Index('ix_used_money_relief_id_sort_key_id', UsedMoney.relief_id, created_sort_key(UsedMoney.created_at), UsedMoney.id)
+
 
 class UserUpgradeRequest(Base):
     __tablename__ = 'user_upgrade_requests'
@@ -196,6 +234,8 @@ class UserUpgradeRequest(Base):
     created_at = Column(DateTime(True), nullable=False, server_default=text("CURRENT_TIMESTAMP"))
     updated_at = Column(DateTime(True))
 
+Index('ix_user_upgrade_requests_sort_key_id', created_sort_key(UserUpgradeRequest.created_at), UserUpgradeRequest.id)
+
 
 class User(Base):
     __tablename__ = 'users'
@@ -213,6 +253,11 @@ class User(Base):
     updated_at = Column(DateTime(True))
     sponsor_id = Column(Integer)
     is_verified = Column(Boolean, nullable=False, server_default=text("false"))
+    # bumped when the user's level changes, they are deleted or their password is reset;
+    # access tokens carrying an older version are refused
+    token_version = Column(Integer, nullable=False, server_default=text("0"))
+
+Index('ix_users_sort_key_id', created_sort_key(User.created_at), User.id)
 
 class VerificationCode(Base):
     __tablename__ = 'verification_codes'
@@ -229,7 +274,7 @@ class VolunteerRequirement(Base):
     __tablename__ = 'volunteer_requirements'
 
     id = Column(Integer, primary_key=True, server_default=text("nextval('volunteer_requirements_id_seq'::regclass)"))
-    relief_id = Column(Integer, nullable=False)
+    relief_id = Column(Integer, nullable=False, index=True)
     name = Column(String(150), nullable=False)
     description = Column(String(250))
     count = Column(Integer, server_default=text("0"))
@@ -257,6 +302,8 @@ class InkindDonation(Base):
 
     inkind_requirement = relationship('InkindDonationRequirement')
 
+Index('ix_inkind_donations_relief_id_sort_key_id', InkindDonation.relief_id, created_sort_key(InkindDonation.created_at), InkindDonation.id)
+
 
 class Organization(Base):
     __tablename__ = 'organizations'
@@ -274,6 +321,8 @@ class Organization(Base):
 
     owner = relationship('User')
 
+Index('ix_organizations_sort_key_id', created_sort_key(Organization.created_at), Organization.id)
+
 
 class Report(Base):
     __tablename__ = 'report'
@@ -290,6 +339,8 @@ class Report(Base):
 
     user = relationship('User')
 
+Index('ix_report_sort_key_id', created_sort_key(Report.created_at), Report.id)
+
 
 class Volunteer(Base):
     __tablename__ = 'volunteers'
@@ -321,5 +372,70 @@ class SponsorshipRequest(Base):
 
     foundation = relationship('Organization', primaryjoin='SponsorshipRequest.foundation_id == Organization.id')
     owner = relationship('Organization', primaryjoin='SponsorshipRequest.owner_id == Organization.id')
+
+
+class ReliefCounter(Base):
+    __tablename__ = 'relief_counters'
+
+    relief_id = Column(BigInteger, primary_key=True)
+    money_raised = Column(Numeric, nullable=False, server_default=text("0.00"))
+    donation_count = Column(Integer, nullable=False, server_default=text("0"))
+    updated_at = Column(DateTime(True), server_default=text("CURRENT_TIMESTAMP"))
+
+
+class RequirementCounter(Base):
+    __tablename__ = 'requirement_counters'
+
+    requirement_type = Column(String(50), primary_key=True)
+    requirement_id = Column(Integer, primary_key=True)
+    relief_id = Column(Integer, nullable=False, index=True)
+    fulfilled = Column(Integer, nullable=False, server_default=text("0"))
+    updated_at = Column(DateTime(True), server_default=text("CURRENT_TIMESTAMP"))
+
+
+class EmailOutbox(Base):
+    __tablename__ = 'email_outbox'
+
+    id = Column(BigInteger, primary_key=True)
+    path = Column(String(50), nullable=False, server_default=text("'/email'::character varying"))
+    body = Column(JSONB, nullable=False)
+    # PENDING, SENT or DEAD (gave up after too many or permanent failures)
+    status = Column(String(20), nullable=False, server_default=text("'PENDING'::character varying"))
+    attempts = Column(Integer, nullable=False, server_default=text("0"))
+    last_error = Column(Text)
+    available_at = Column(DateTime(True), nullable=False, server_default=text("CURRENT_TIMESTAMP"))
+    created_at = Column(DateTime(True), nullable=False, server_default=text("CURRENT_TIMESTAMP"))
+    sent_at = Column(DateTime(True))
+
+Index('ix_email_outbox_pending', EmailOutbox.available_at, EmailOutbox.id, postgresql_where=text("status = 'PENDING'"))
+
+
+class RefreshToken(Base):
+    __tablename__ = 'refresh_tokens'
+
+    # `jti` claim of the token
+    id = Column(String(32), primary_key=True)
+    user_id = Column(BigInteger, nullable=False)
+    # tokens rotated from the same login; replaying a used token revokes all of them
+    family = Column(String(32), nullable=False)
+    expires_at = Column(DateTime(True), nullable=False)
+    revoked_at = Column(DateTime(True))
+    created_at = Column(DateTime(True), nullable=False, server_default=text("CURRENT_TIMESTAMP"))
+
+Index('ix_refresh_tokens_family', RefreshToken.family)
+Index('ix_refresh_tokens_user_id', RefreshToken.user_id)
+Index('ix_refresh_tokens_expires_at', RefreshToken.expires_at)
     
-Base.metadata.create_all(engine)
\ No newline at end of file
+Base.metadata.create_all(engine)
+
+# create_all skips tables that already exist, so make sure their indexes are in place.
+# existing names come from pg_indexes since reflection skips expression indexes
+with engine.begin() as con:
+    for statement in ADDED_COLUMNS:
+        con.execute(text(statement))
+
+    existing_indexes = set(con.execute(text("SELECT indexname FROM pg_indexes")).scalars())
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name not in existing_indexes and index.name not in MIGRATED_INDEXES:
+                index.create(con)
@@ -0,0 +1,97 @@
+import os
+import time
+from threading import Lock
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class PoolMetrics():
+    def __init__(self):
+        self.lock = Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    # records time spent waiting for a connection
+    def record_wait(self, seconds:float, timed_out:bool = False):
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.total_wait += seconds
+            self.max_wait = max(self.max_wait, seconds)
+
+    def record_checkin(self):
+        with self.lock:
+            self.checkins += 1
+
+    def record_connect(self):
+        with self.lock:
+            self.connects += 1
+
+    def record_invalidation(self):
+        with self.lock:
+            self.invalidations += 1
+
+    # returns counters together with the live state of `pool`
+    def snapshot(self, pool:QueuePool):
+        with self.lock:
+            waits = self.checkouts + self.timeouts
+            return {
+                "pool_size" : pool.size(),
+                "checked_out" : pool.checkedout(),
+                "checked_in" : pool.checkedin(),
+                "overflow" : pool.overflow(),
+                "checkouts" : self.checkouts,
+                "checkins" : self.checkins,
+                "connects" : self.connects,
+                "invalidations" : self.invalidations,
+                "timeouts" : self.timeouts,
+                "avg_wait_ms" : round(self.total_wait / waits * 1000, 3) if waits > 0 else 0.0,
+                "max_wait_ms" : round(self.max_wait * 1000, 3)
+            }
+
+pool_metrics = PoolMetrics()
+async_pool_metrics = PoolMetrics()
+
+class MeteredPoolMixin():
+    """
+    Records how long each checkout waited for a connection.
+    """
+    metrics: PoolMetrics = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except Exception:
+            self.metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record_wait(time.perf_counter() - start)
+        return conn
+
+    def _do_return_conn(self, conn):
+        self.metrics.record_checkin()
+        super()._do_return_conn(conn)
+
+class MeteredQueuePool(MeteredPoolMixin, QueuePool):
+    metrics = pool_metrics
+
+class MeteredAsyncQueuePool(MeteredPoolMixin, AsyncAdaptedQueuePool):
+    metrics = async_pool_metrics
+
+# pool settings, tunable through the environment
+def pool_options():
+    return {
+        "pool_size" : int(os.environ.get("DB_POOL_SIZE", 10)),
+        "max_overflow" : int(os.environ.get("DB_MAX_OVERFLOW", 20)),
+        "pool_timeout" : int(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        "pool_recycle" : int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping" : os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true"
+    }
@@ -1,5 +1,4 @@
 from dotenv import load_dotenv
-import requests, json, os
 from .email_handler import EmailHandler
 
 load_dotenv()
@@ -7,36 +6,9 @@ load_dotenv()
 class CodeEmailHandler(EmailHandler):
     def __init__(self):
         super().__init__()
-    
 
-    async def send_password_reset_code(self, email: str, name: str, code: str):
-        email_content = f"<html><head></head><body>\
-                                <p>Good day, {name.split(' ')[0]}</p>\
-                                <p>We received a request to reset the password for your account. Below is the code for resetting the password.</p>\
-                                <center><h2>{code}</h2></center>\
-                                <p>If you did not send a request to change your password, kindly disregard this code and secure your account.</p>\
-                                <p>Regards,<br /><b>Elbit Development Team</b></p>\
-                            </body>\
-                            </html>"
-        body = self.craft_email_body(name, email, 'Password Reset', email_content)
-        res = requests.request('POST', f'{self.base_URL}/email', headers=self.headers, data=json.dumps(body, indent=4))
-        return {
-            "status": res.status_code,
-            "body" : res.json()
-        }
-    
-    async def send_email_verfication_code(self, email: str, name: str, code: str):
-        email_content = f"<html><head></head><body>\
-                                <p>Good day, {name.split(' ')[0]}</p>\
-                                <p>Use the code below to complete setting up your account.</p>\
-                                <center><h2>{code}</h2></center>\
-                                <p>If you did not sign up for the service, kindly disregard this code and secure your email.</p>\
-                                <p>Regards,<br /><b>Elbit Development Team</b></p>\
-                            </body>\
-                            </html>"
-        body = self.craft_email_body(name, email, 'Continue Setting Up your Account', email_content)
-        res = requests.request('POST', f'{self.base_URL}/email', headers=self.headers, data=json.dumps(body, indent=4))
-        return {
-            "status": res.status_code,
-            "body" : res.json()
-        }
\ No newline at end of file
+    async def send_password_reset_code(self, email: str, name: str, code: str, db = None):
+        return await self.send_template(name, email, 'Password Reset', 'password_reset', code=code, db=db)
+
+    async def send_email_verfication_code(self, email: str, name: str, code: str, db = None):
+        return await self.send_template(name, email, 'Continue Setting Up your Account', 'email_verification', code=code, db=db)
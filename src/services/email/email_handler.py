@@ -1,14 +1,49 @@
 from dotenv import load_dotenv
-import requests, json, os
+import asyncio, httpx, json, os
+from typing import List, Tuple
+from services.db.database import AsyncSession, AsyncSessionClass
+from services.db.models import EmailOutbox
+from .template_registry import email_templates, brevo_literal_text
 
 load_dotenv()
 
+# seconds to wait on Brevo before giving up on an attempt
+EMAIL_TIMEOUT = float(os.environ.get("EMAIL_TIMEOUT", 10))
+EMAIL_MAX_CONNECTIONS = int(os.environ.get("EMAIL_MAX_CONNECTIONS", 20))
+# recipients per bulk send; Brevo takes at most 1000 message versions per call
+BULK_EMAIL_CHUNK_SIZE = min(int(os.environ.get("BULK_EMAIL_CHUNK_SIZE", 1000)), 1000)
+
+http_client:httpx.AsyncClient = None
+http_client_loop = None
+
+# keep-alive client shared by every handler; bound to the running event loop
+def get_http_client():
+    global http_client, http_client_loop
+
+    loop = asyncio.get_running_loop()
+    if http_client is None or http_client_loop is not loop:
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(EMAIL_TIMEOUT),
+            limits=httpx.Limits(max_connections=EMAIL_MAX_CONNECTIONS, max_keepalive_connections=EMAIL_MAX_CONNECTIONS)
+        )
+        http_client_loop = loop
+
+    return http_client
+
+async def close_http_client():
+    global http_client
+
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+
 class EmailHandler():
     def __init__(self):
-        self.base_URL = base_URL = 'https://api.brevo.com/v3/smtp'
+        # EMAIL_API_URL points at a fake Brevo (see `tests/fakes/fake_brevo.py`) when testing
+        self.base_URL = base_URL = f"{os.environ.get('EMAIL_API_URL', 'https://api.brevo.com/v3')}/smtp"
         self.key = os.environ.get("EMAIL_KEY")
         self.headers = {
-            "api-key" : self.key,
+            "api-key" : self.key or "",
             "Content-Type" : "application/json",
             "Accept": "application/json",
             "X-Sib-Sandbox" : "drop"
@@ -31,4 +66,102 @@ class EmailHandler():
         "htmlContent" : htmlContent
         }
 
-        return body
\ No newline at end of file
+        return body
+
+    # body of template `template` sent to `name`, whose first name the template greets
+    def craft_template_email_body(self, name:str, email:str, subject:str, template:str, **params):
+        html_content = email_templates.render(template, first_name=(name or '').split(' ')[0], **params)
+        return self.craft_email_body(name, email, subject, html_content)
+
+    def craft_bulk_email_bodies(self, recipients:List[Tuple[str, str]], subject:str, htmlContent:str):
+        """
+        Bodies sending `htmlContent` to every (name, email) in `recipients`, one
+        message version per recipient and up to `BULK_EMAIL_CHUNK_SIZE`
+        recipients per body. `{{ params.name }}` in `htmlContent` is replaced
+        with each recipient's first name; Brevo tags in `subject` are made literal.
+        """
+        versions = [
+            {
+                "to" : [{"name" : name, "email" : email}],
+                "params" : {"name" : (name or '').split(' ')[0]}
+            }
+            for name, email in recipients
+        ]
+
+        return [
+            {
+                "sender" : {
+                    "name" : "Elbit",
+                    "email" : self.sender_email
+                },
+                "subject" : brevo_literal_text(subject),
+                "htmlContent" : htmlContent,
+                "messageVersions" : versions[i:i+BULK_EMAIL_CHUNK_SIZE]
+            }
+            for i in range(0, len(versions), BULK_EMAIL_CHUNK_SIZE)
+        ]
+
+    async def enqueue(self, emails:List[EmailOutbox], db = None):
+        """
+        Adds `emails` to the outbox, where `EmailOutboxWorker` delivers them.
+
+        Given the caller's session `db` (sync or async), the emails are only
+        flushed into its transaction: they are sent if and only if the caller
+        commits, so enqueue before committing the change they announce.
+        Without it they are committed at once in a session of their own.
+        """
+        if db is None:
+            async with AsyncSession() as db:
+                db.add_all(emails)
+                await db.commit()
+        elif isinstance(db, AsyncSessionClass):
+            db.add_all(emails)
+            await db.flush()
+        else:
+            db.add_all(emails)
+            db.flush()
+
+    # queues `body` in the outbox (see `enqueue`)
+    async def send(self, body:dict, path:str = '/email', db = None):
+        email = EmailOutbox(path=path, body=body)
+        await self.enqueue([email], db)
+
+        return {
+            "status": 202,
+            "body" : {
+                "outbox_id" : email.id
+            }
+        }
+
+    async def send_template(self, name:str, email:str, subject:str, template:str, db = None, **params):
+        return await self.send(self.craft_template_email_body(name, email, subject, template, **params), db=db)
+
+    # sends template `template` to every (name, email) in `recipients`, rendered once for all of them
+    async def send_bulk_template(self, recipients:List[Tuple[str, str]], subject:str, template:str, db = None, **params):
+        html_content = email_templates.render_bulk(template, **params)
+        return await self.send_bulk(self.craft_bulk_email_bodies(recipients, subject, html_content), db=db)
+
+    # queues every body in `bodies` in one transaction (see `enqueue`)
+    async def send_bulk(self, bodies:List[dict], path:str = '/email', db = None):
+        if len(bodies) == 0:
+            return {
+                "status": 202,
+                "body" : {
+                    "outbox_ids" : []
+                }
+            }
+
+        emails = [EmailOutbox(path=path, body=body) for body in bodies]
+        await self.enqueue(emails, db)
+
+        return {
+            "status": 202,
+            "body" : {
+                "outbox_ids" : [email.id for email in emails]
+            }
+        }
+
+    # posts `body` to Brevo once; retrying is left to the outbox
+    async def deliver(self, body:dict, path:str = '/email'):
+        content = json.dumps(body, separators=(',', ':'), ensure_ascii=False).encode()
+        return await get_http_client().post(f'{self.base_URL}{path}', headers=self.headers, content=content)
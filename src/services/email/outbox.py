@@ -0,0 +1,187 @@
+from dotenv import load_dotenv
+import asyncio, httpx, logging, os, time
+from sqlalchemy import text
+from services.db.database import AsyncSession, Session
+from .email_handler import EmailHandler
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# claims due emails, pushing them back by the lease so other workers skip them while they are sent.
+# an email whose worker dies mid-send becomes due again once the lease runs out
+CLAIM_QUERY = text("""
+    UPDATE email_outbox
+    SET attempts = attempts + 1,
+        available_at = now() + make_interval(secs => :lease)
+    WHERE id IN (
+        SELECT id FROM email_outbox
+        WHERE status = 'PENDING' AND available_at <= now()
+        ORDER BY available_at, id
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, path, body, attempts
+""")
+
+SENT_QUERY = text("""
+    UPDATE email_outbox SET status = 'SENT', sent_at = now(), last_error = NULL WHERE id = :id
+""")
+
+RETRY_QUERY = text("""
+    UPDATE email_outbox SET available_at = now() + make_interval(secs => :delay), last_error = :error WHERE id = :id
+""")
+
+DEAD_QUERY = text("""
+    UPDATE email_outbox SET status = 'DEAD', last_error = :error WHERE id = :id
+""")
+
+# drops delivered and dead emails older than the retention period, a batch at a time
+PURGE_QUERY = text("""
+    DELETE FROM email_outbox
+    WHERE id IN (
+        SELECT id FROM email_outbox
+        WHERE status IN ('SENT', 'DEAD') AND coalesce(sent_at, created_at) < now() - make_interval(days => :days)
+        LIMIT :batch_size
+    )
+""")
+
+class RateLimiter():
+    """
+    Token bucket allowing `rate` acquisitions per second, in bursts of up to `burst`.
+    """
+    def __init__(self, rate:float, burst:int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class EmailOutboxWorker():
+    """
+    Drains the `email_outbox` table into Brevo. Failed sends are retried with
+    exponential backoff; emails failing permanently (4xx other than 429) or
+    `max_attempts` times are dead-lettered with status DEAD.
+    """
+    def __init__(self, batch_size:int = 50, rate:float = 10, max_attempts:int = 8,
+                 retry_delay:float = 30, lease:float = 300, poll_interval:float = 2):
+        self.batch_size = batch_size
+        self.rate_limiter = RateLimiter(rate, burst=max(int(rate), 1))
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.email_handler = EmailHandler()
+        self.task:asyncio.Task = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def run(self):
+        while True:
+            try:
+                sent = await self.drain_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error in draining email outbox.")
+                sent = 0
+
+            # keep going while there is a backlog, otherwise wait for new emails
+            if sent < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    # sends one batch of due emails; returns how many were claimed
+    async def drain_once(self):
+        async with AsyncSession() as db:
+            emails = (await db.execute(CLAIM_QUERY, {'lease': self.lease, 'batch_size': self.batch_size})).mappings().all()
+            await db.commit()
+
+        if len(emails) == 0:
+            return 0
+
+        results = await asyncio.gather(*(self.deliver(email) for email in emails))
+
+        async with AsyncSession() as db:
+            for query, params in results:
+                await db.execute(query, params)
+            await db.commit()
+
+        return len(emails)
+
+    # sends `email`, returning the query recording the outcome
+    async def deliver(self, email):
+        await self.rate_limiter.acquire()
+
+        retry_after = None
+        try:
+            res = await self.email_handler.deliver(email['body'], email['path'])
+        except httpx.TransportError as e:
+            error = f'{type(e).__name__}: {e}'
+        else:
+            if res.is_success:
+                return (SENT_QUERY, {'id': email['id']})
+
+            error = f'HTTP {res.status_code}: {res.text[:500]}'
+            if res.status_code != 429 and res.status_code < 500:
+                logger.error(f"Dead-lettering email {email['id']}; {error}")
+                return (DEAD_QUERY, {'id': email['id'], 'error': error})
+
+            retry_after = res.headers.get('Retry-After')
+
+        if email['attempts'] >= self.max_attempts:
+            logger.error(f"Dead-lettering email {email['id']} after {email['attempts']} attempts; {error}")
+            return (DEAD_QUERY, {'id': email['id'], 'error': error})
+
+        return (RETRY_QUERY, {'id': email['id'], 'delay': self.backoff(email['attempts'], retry_after), 'error': error})
+
+    # seconds until the next attempt, honouring Retry-After when Brevo sends one
+    def backoff(self, attempts:int, retry_after:str = None):
+        try:
+            return float(retry_after)
+        except (TypeError, ValueError):
+            return min(self.retry_delay * 2 ** (attempts - 1), 3600)
+
+outbox_worker = EmailOutboxWorker(
+    batch_size=int(os.environ.get("EMAIL_OUTBOX_BATCH_SIZE", 50)),
+    rate=float(os.environ.get("EMAIL_RATE_LIMIT", 10)),
+    max_attempts=int(os.environ.get("EMAIL_MAX_ATTEMPTS", 8)),
+    retry_delay=float(os.environ.get("EMAIL_RETRY_DELAY", 30)),
+    lease=float(os.environ.get("EMAIL_OUTBOX_LEASE", 300)),
+    poll_interval=float(os.environ.get("EMAIL_OUTBOX_POLL_INTERVAL", 2))
+)
+
+# scheduled job; EMAIL_OUTBOX_RETENTION_DAYS keeps sent and dead emails around for inspection
+def purge_outbox(batch_size:int = 10000):
+    days = int(os.environ.get("EMAIL_OUTBOX_RETENTION_DAYS", 30))
+
+    with Session() as db:
+        while True:
+            deleted = db.execute(PURGE_QUERY, {'days': days, 'batch_size': batch_size}).rowcount
+            db.commit()
+
+            if deleted < batch_size:
+                return
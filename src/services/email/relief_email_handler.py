@@ -1,5 +1,5 @@
 from dotenv import load_dotenv
-import requests, json, os
+from typing import List, Tuple
 from .email_handler import EmailHandler
 
 load_dotenv()
@@ -7,53 +7,20 @@ load_dotenv()
 class ReliefEmailHandler(EmailHandler):
     def __init__(self):
         super().__init__()
-    
-    async def send_rejection(self, email:str, name:str, title: str):
-        email_content = f"<html><head></head><body>\
-                                <p>Greetings, {name.split(' ')[0]}</p>\
-                                <p>Unfortunately, your relief effort, <b>{title}</b>, was <b style='color:red'>REJECTED</b>. This may be due to the following reasons, but not limited to:</p>\
-                                <ul>\
-                                    <li>Irrelevant Relief Effort</li>\
-                                    <li>Too many similar initiatives</li>\
-                                    <li>Insufficient details</li>\
-                                </ul>\
-                                <p>Regards,<br /><b>Elbit Development Team</b></p>\
-                            </body>\
-                            </html>"
-        body = self.craft_email_body(name, email, 'Relief Effort Rejection', email_content)
 
-        res = requests.request('POST', f'{self.base_URL}/email', headers=self.headers, data=json.dumps(body, indent=4))
-        return {
-            "status": res.status_code,
-            "body" : res.json()
-        }
-    
-    async def send_approval(self, email:str, name:str, title: str):
-        email_content = f"<html><head></head><body>\
-                                <p>Greetings, {name.split(' ')[0]}</p>\
-                                <p>We are delighted to inform you that your relief effort, <b>{title}</b>, has been approved and is now public.</p>\
-                                <p>We wish you the best of luck on your initiative.</p>\
-                                <p>Regards,<br /><b>Elbit Development Team</b></p>\
-                            </body>\
-                            </html>"
-        body = self.craft_email_body(name, email, 'Relief Effort Approval', email_content)
-        res = requests.request('POST', f'{self.base_URL}/email', headers=self.headers, data=json.dumps(body, indent=4))
-        return {
-            "status": res.status_code,
-            "body" : res.json()
-        }
-    
-    async def send_deletion_notice(self, email:str, name:str, title: str):
-        email_content = f"<html><head></head><body>\
-                                <p>Greetings, {name.split(' ')[0]}</p>\
-                                <p>Your relief effort, titled <b>{title}</b>, has been marked as deleted and would no longer be able to accept donations and volunteers. This is due to a breach of rules and terms of the platform.</p>\
-                                <p>If you think that this was an error, kindly send us an email.</p>\
-                                <p>Regards,<br /><b>Elbit Development Team</b></p>\
-                            </body>\
-                            </html>"
-        body = self.craft_email_body(name, email, 'Relief Effort Deletion', email_content)
-        res = requests.request('POST', f'{self.base_URL}/email', headers=self.headers, data=json.dumps(body, indent=4))
-        return {
-            "status": res.status_code,
-            "body" : res.json()
-        }
\ No newline at end of file
+    async def send_rejection(self, email:str, name:str, title: str, db = None):
+        return await self.send_template(name, email, 'Relief Effort Rejection', 'relief_rejected', title=title, db=db)
+
+    async def send_approval(self, email:str, name:str, title: str, db = None):
+        return await self.send_template(name, email, 'Relief Effort Approval', 'relief_approved', title=title, db=db)
+
+    async def send_deletion_notice(self, email:str, name:str, title: str, db = None):
+        return await self.send_template(name, email, 'Relief Effort Deletion', 'relief_deleted', title=title, db=db)
+
+    # notifies followers of a relief effort, given as (name, email) pairs, of a new update
+    async def send_update_notice(self, recipients:List[Tuple[str, str]], title:str, update_title:str, update_message:str, db = None):
+        return await self.send_bulk_template(recipients, f'Update on {title}', 'relief_update', title=title, update_title=update_title, update_message=update_message, db=db)
+
+    # notifies followers of a relief effort, given as (name, email) pairs, that it entered `phase`
+    async def send_phase_notice(self, recipients:List[Tuple[str, str]], title:str, phase:str, db = None):
+        return await self.send_bulk_template(recipients, f'{title} is now in {phase}', 'relief_phase', title=title, phase=phase, db=db)
@@ -0,0 +1,68 @@
+import os
+import re
+from pathlib import Path
+from dotenv import load_dotenv
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, StrictUndefined
+from markupsafe import Markup, escape
+
+load_dotenv()
+
+TEMPLATE_DIRECTORY = Path(__file__).parent / 'templates'
+
+# placeholder Brevo fills with each recipient's first name in bulk sends
+BREVO_FIRST_NAME = '{{ params.name }}'
+
+BREVO_TAG = re.compile(r'\{(?=[{%#])')
+
+# Brevo evaluates bulk bodies and subjects as templates of its own, where a stray `{{` or
+# `{%` in user text fails the whole send. In HTML, braces are written as entities, which
+# read the same; in plain text a space is put after the brace
+def brevo_literal(value:str):
+    return Markup(str(escape(value)).replace('{', '&#123;').replace('}', '&#125;'))
+
+def brevo_literal_text(value:str):
+    return BREVO_TAG.sub('{ ', value)
+
+class TemplateRegistry():
+    """
+    Email templates under `templates/`, compiled once per process. Compiled
+    bytecode is cached on disk (EMAIL_TEMPLATE_CACHE, defaults to a temporary
+    directory) so restarts skip parsing. Rendered bodies are not cached: they
+    hold recipient names and codes, and bulk bodies are rendered once per send.
+    """
+    def __init__(self, directory:Path = TEMPLATE_DIRECTORY, cache_directory:str = None):
+        self.environment = Environment(
+            loader=FileSystemLoader(directory),
+            bytecode_cache=FileSystemBytecodeCache(cache_directory),
+            autoescape=True,
+            auto_reload=False,
+            trim_blocks=True,
+            lstrip_blocks=True,
+            undefined=StrictUndefined
+        )
+        self.templates = {}
+
+    # compiles every template up front; call on startup
+    def compile_all(self):
+        for name in self.environment.list_templates(extensions=['html']):
+            self.get(name)
+
+    def get(self, name:str):
+        template = self.templates.get(name)
+
+        if template is None:
+            template = self.templates[name] = self.environment.get_template(name)
+
+        return template
+
+    # renders template `name` (without the .html)
+    def render(self, name:str, **params):
+        # newlines after tags are only template layout, so they are dropped from the output
+        return self.get(f'{name}.html').render(params).replace('>\n', '>')
+
+    # renders template `name` as the body of a Brevo bulk send, greeting each recipient by name
+    def render_bulk(self, name:str, **params):
+        params = {key : brevo_literal(value) if isinstance(value, str) else value for key, value in params.items()}
+        return self.render(name, first_name=BREVO_FIRST_NAME, **params)
+
+email_templates = TemplateRegistry(cache_directory=os.environ.get("EMAIL_TEMPLATE_CACHE"))
@@ -1,26 +1,31 @@
 from typing import List
-from sqlalchemy import and_
+from sqlalchemy import and_, select
 from datetime import datetime, timedelta
 from ..db.models import Headline
+from util.pagination import paginate, next_cursor
 
 WEEKS=400
 
-def retrieveHeadlineData(db, p, c):
+def headline_query(p, c, cursor=None):
     current_datetime = datetime.now()
     two_weeks = current_datetime + timedelta(weeks=WEEKS)
 
-    headline_data: List[Headline] = (
-        db.query(Headline).filter(
+    return paginate(
+        select(Headline).filter(
             and_(
                 Headline.disaster_type != 'non-disaster',
                 Headline.posted_datetime < two_weeks
-            )).limit(c).offset((p-1)*c).all())    
+            )), Headline, p, c, cursor)
+
+def retrieveHeadlineData(db, p, c):
+    headline_data: List[Headline] = db.execute(headline_query(p, c)).scalars().all()
 
     return headline_data
 
-def fetch(db, p, c):
+# returns a page of headlines together with the cursor of the next page
+async def fetch(db, p, c, cursor=None):
     headlines = []
-    headline_data = retrieveHeadlineData(db, p, c)
+    headline_data: List[Headline] = (await db.execute(headline_query(p, c, cursor))).scalars().all()
 
     for data in headline_data:
 
@@ -33,4 +38,4 @@ def fetch(db, p, c):
 
         headlines.append(headline)
     
-    return headlines
\ No newline at end of file
+    return (headlines, next_cursor(headline_data, c))
\ No newline at end of file
@@ -4,19 +4,21 @@ import requests
 from requests import Response
 from sqlalchemy import and_, or_
 from services.db.models import ReliefPaymentKey, ReceivedMoney, ReliefEffort
+from services.counters.counter_handler import CounterHandler
 from base64 import urlsafe_b64encode
 from cryptography.fernet import Fernet
-from services.db.database import Session
+from sqlalchemy.orm import Session
 import secrets
 
 load_dotenv()
 
 class PaymentHandler():
-    def __init__(self, redirect_url:str):
+    def __init__(self, db:Session, redirect_url:str = None):
         self.redirect_url = redirect_url
         self.maya_checkout_link = "https://pg-sandbox.paymaya.com/checkout/v1/checkouts" # currently set to sandbox mode
         self.maya_retrieve_payment_by_rrn_link = "https://pg-sandbox.paymaya.com/payments/v1/payment-rrns/"
-        self.db = Session()
+        self.db = db
+        self.counters = CounterHandler(db)
         self.base_url = os.environ['BASE_URL']
         self.redirect_url = f'{os.environ["BASE_URL"]}/api/monetary/redirect'
 
@@ -118,6 +120,7 @@ class PaymentHandler():
         received.reference_no = rrn
 
         self.db.add(received)
+        self.counters.record_money(relief_id, received.amount)
 
         self.db.commit()
 
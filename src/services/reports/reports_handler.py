@@ -1,14 +1,15 @@
 from sqlalchemy import and_
 from datetime import datetime
 
-from services.db.database import Session
+from sqlalchemy.orm import Session
 from services.db.models import Report, ReliefComment, Organization, ReliefEffort, User
+from util.pagination import paginate
 
 class ReportsHandler():
-    def __init__(self):
+    def __init__(self, db:Session):
         self.valid_types = ['COMMENTS', 'RELIEF', 'ORGANIZATION']
         self.valid_statuses = ['PENDING', 'RESOLVED', 'DELETED', 'ALL']
-        self.db = Session()
+        self.db = db
     
     def create_report(self, target_type:str, target_id:int, reason:str, user_id:int):
 
@@ -35,7 +36,7 @@ class ReportsHandler():
 
         return ('Successful', True)
     
-    def retrieve_reports(self, target_type:str, status:str, p:int, c:int):
+    def retrieve_reports(self, target_type:str, status:str, p:int, c:int, cursor:str = None):
 
         # check if `status` is valid
         if status.upper() not in self.valid_statuses:
@@ -46,7 +47,7 @@ class ReportsHandler():
             return ('InvalidType', False)
 
         # retrieves data
-        reports = self.db.query(Report).filter(and_(Report.is_deleted == False, Report.status == status, Report.target_type == type)).limit(c).offset((p-1)*c).all()
+        reports = paginate(self.db.query(Report).filter(and_(Report.is_deleted == False, Report.status == status, Report.target_type == target_type)), Report, p, c, cursor).all()
 
         return (reports, True)
 
@@ -0,0 +1,37 @@
+import re
+from sqlalchemy import func, select, text
+from services.db.models import relief_search_document, relief_search_text
+
+token_pattern = re.compile(r'\w+')
+
+# documents searched per text search configuration. 'simple' keeps stopwords but has
+# no index; it is only searched when 'english' drops every token of the keyword
+search_documents = {
+    'english' : relief_search_document,
+    'simple' : func.to_tsvector(text("'simple'"), relief_search_text)
+}
+
+def tokenize(value:str):
+    return token_pattern.findall(value.lower()) if value else []
+
+# turns free text into a prefix-matching tsquery, e.g. "typhoon ode" -> "typhoon:* & ode:*"
+def build_tsquery(keyword:str):
+    tokens = tokenize(keyword)
+
+    if len(tokens) == 0:
+        return None
+
+    return ' & '.join(f'{token}:*' for token in tokens)
+
+# the configuration `tsquery` is searched with: 'english', or 'simple' when every token
+# is an english stopword (e.g. "will do"), which 'english' would match with nothing
+async def search_config(db, tsquery:str):
+    nodes = (await db.execute(select(func.numnode(func.to_tsquery(text("'english'"), tsquery))))).scalar()
+    return 'english' if nodes > 0 else 'simple'
+
+# returns the match condition and rank expression of `tsquery` against the search index
+def full_text_search(tsquery:str, config:str = 'english'):
+    document = search_documents[config]
+    query = func.to_tsquery(text(f"'{config}'"), tsquery)
+
+    return (document.op('@@')(query), func.ts_rank(document, query))
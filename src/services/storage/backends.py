@@ -0,0 +1,426 @@
+import os
+import time
+import mimetypes
+from threading import Lock
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import List
+from urllib.parse import urlparse
+from urllib.request import urlopen
+from dotenv import load_dotenv
+import urllib3
+import cloudinary
+import cloudinary.api
+import cloudinary.search
+import cloudinary.uploader
+from cloudinary.exceptions import Error as CloudinaryError, NotFound, GeneralError, RateLimited
+from cloudinary.utils import cloudinary_url, cloudinary_api_url, api_sign_request
+from minio import Minio
+from minio.datatypes import PostPolicy
+from minio.deleteobjects import DeleteObject
+from minio.error import S3Error
+from services.storage.image_pipeline import FORMATS, MAX_IMAGE_BYTES
+
+load_dotenv()
+
+class StorageBackend():
+    """
+    Object store behind `FileHandler`. Files are addressed by public id, a path
+    without extension such as `relieph/users/1`; folders hold files uploaded
+    together, e.g. `relieph/relief-efforts/main/1`.
+
+    Methods are blocking; `FileHandler` runs them on its storage executor and
+    retries the errors listed in `transient_errors`. Calls it marks as safe
+    to repeat (uploads to a fixed public id and deletes) also retry
+    `idempotent_errors`, failures after which the request may still have
+    reached the store.
+    """
+    transient_errors = ()
+    idempotent_errors = ()
+
+    # provisions what the store needs before files can be written to it; cheap once done
+    def prepare(self):
+        pass
+
+    # errors a call is retried on
+    def retryable_errors(self, idempotent:bool = False):
+        if idempotent:
+            return self.transient_errors + self.idempotent_errors
+        return self.transient_errors
+
+    # delivery url of `public_id` without checking that it exists
+    def build_url(self, public_id:str, version = None, format:str = None):
+        raise NotImplementedError
+
+    # delivery url of `public_id`, `None` if it does not exist
+    def resolve(self, public_id:str):
+        raise NotImplementedError
+
+    def resolve_many(self, public_ids:List[str]):
+        return {public_id : self.resolve(public_id) for public_id in public_ids}
+
+    # delivery urls of the files in `folder`, ordered by public id
+    def list_folder(self, folder:str):
+        raise NotImplementedError
+
+    def list_folders(self, folders:List[str]):
+        return {folder : self.list_folder(folder) for folder in folders}
+
+    # stores `file` as `public_id` and returns its delivery url
+    def upload(self, file, public_id:str, suffix:str):
+        raise NotImplementedError
+
+    # contents of `public_id`
+    def download(self, public_id:str):
+        raise NotImplementedError
+
+    # describes a request the client can upload `public_id` with directly to the store:
+    # {"public_id", "method", "url", "fields" (form fields), "headers"}. The store only
+    # accepts images of the formats in `FORMATS` up to `MAX_IMAGE_BYTES`, as far as it can
+    # enforce that; the upload is checked again when processed
+    def presign_upload(self, public_id:str, suffix:str):
+        raise NotImplementedError
+
+    def delete(self, public_id:str):
+        raise NotImplementedError
+
+    def delete_folder(self, folder:str):
+        raise NotImplementedError
+
+class UploaderConnectionError(CloudinaryError):
+    """The Cloudinary uploader could not reach the API or read its response."""
+
+# messages of the uploader's failed requests. It raises the base error for these and for
+# errors the API reports (invalid image, bad credentials) alike; only these are retried
+UPLOADER_CONNECTION_ERRORS = ('Unexpected error', 'Socket error', 'Error parsing server response')
+
+class CloudinaryBackend(StorageBackend):
+    def __init__(self, timeout:float = 30):
+        cloudinary.config(
+            cloud_name = os.environ.get('CLOUDINARY_CLOUD_NAME'),
+            api_key = os.environ.get('CLOUDINARY_API_KEY'),
+            api_secret = os.environ.get('CLOUDINARY_SECRET'),
+            secure=True
+        )
+        self.timeout = timeout
+        # the Admin API raises GeneralError on network and server errors
+        self.transient_errors = (GeneralError, RateLimited)
+        self.idempotent_errors = (UploaderConnectionError,)
+
+    # calls uploader function `fn`, telling failed requests apart from errors the API reports
+    def uploader(self, fn, *args, **kwargs):
+        try:
+            return fn(*args, timeout=self.timeout, **kwargs)
+        except CloudinaryError as e:
+            if type(e) is CloudinaryError and str(e).startswith(UPLOADER_CONNECTION_ERRORS):
+                raise UploaderConnectionError(str(e)) from e
+            raise
+
+    def build_url(self, public_id:str, version = None, format:str = None):
+        return cloudinary_url(public_id, version=version, format=format, secure=True)[0]
+
+    def resolve(self, public_id:str):
+        try:
+            resource = cloudinary.api.resource(public_id, timeout=self.timeout)
+        except NotFound:
+            return None
+
+        return self.build_url(public_id, resource['version'], resource['format'])
+
+    # looked up 100 ids per Admin API call
+    def resolve_many(self, public_ids:List[str]):
+        resolved = {}
+        for i in range(0, len(public_ids), 100):
+            chunk = public_ids[i:i+100]
+            resu = cloudinary.api.resources_by_ids(chunk, timeout=self.timeout)
+
+            found = {image['public_id'] : self.build_url(image['public_id'], image['version'], image['format']) for image in resu['resources']}
+            for public_id in chunk:
+                resolved[public_id] = found.get(public_id)
+
+        return resolved
+
+    def list_folder(self, folder:str):
+        return self.list_folders([folder])[folder]
+
+    # a single search per page of results, whatever the number of folders
+    def list_folders(self, folders:List[str]):
+        resolved = {folder : [] for folder in folders}
+        if len(folders) == 0:
+            return resolved
+
+        expression = ' OR '.join(f'folder="{folder}"' for folder in folders)
+        next_cursor = None
+        while True:
+            search = cloudinary.search.Search().expression(expression).sort_by('public_id', 'asc').max_results(500)
+            if next_cursor is not None:
+                search = search.next_cursor(next_cursor)
+
+            resu = search.execute(timeout=self.timeout)
+            for image in resu['resources']:
+                if image['folder'] in resolved:
+                    resolved[image['folder']].append(self.build_url(image['public_id'], image['version'], image['format']))
+
+            next_cursor = resu.get('next_cursor')
+            if next_cursor is None:
+                break
+
+        return resolved
+
+    def upload(self, file, public_id:str, suffix:str):
+        file.seek(0)
+        resu = self.uploader(cloudinary.uploader.upload, file, public_id=public_id)
+        return self.build_url(public_id, resu['version'], resu['format'])
+
+    def download(self, public_id:str):
+        url = self.resolve(public_id)
+        if url is None:
+            raise NotFound(f'Resource not found - {public_id}')
+
+        with urlopen(url, timeout=self.timeout) as resp:
+            return resp.read()
+
+    # signed upload parameters; the client posts them with its file as multipart form data.
+    # Cloudinary has no signed size limit, so oversized files are only refused when processed
+    def presign_upload(self, public_id:str, suffix:str):
+        config = cloudinary.config()
+        params = {
+            'public_id' : public_id,
+            'allowed_formats' : ','.join(FORMATS.values()),
+            'overwrite' : 'true',
+            'invalidate' : 'true',
+            'timestamp' : int(time.time())
+        }
+
+        return {
+            'public_id' : public_id,
+            'method' : 'POST',
+            'url' : cloudinary_api_url('upload', resource_type='image'),
+            'fields' : {
+                **params,
+                'api_key' : config.api_key,
+                'signature' : api_sign_request(params, config.api_secret)
+            },
+            'headers' : {}
+        }
+
+    def delete(self, public_id:str):
+        self.uploader(cloudinary.uploader.destroy, public_id)
+
+    def delete_folder(self, folder:str):
+        cloudinary.api.delete_resources_by_prefix(f'{folder}/', timeout=self.timeout)
+
+class S3Backend(StorageBackend):
+    """
+    S3 or MinIO bucket. Files are served through presigned urls, so downloads
+    go straight to the object store. `public_endpoint` is the host clients
+    reach the store at when it differs from the one the API uses.
+
+    Nothing connects to the store on construction; the bucket is created by
+    `prepare`, at startup or before the first write.
+    """
+    def __init__(self, endpoint:str, access_key:str, secret_key:str, bucket:str, secure:bool = True,
+                 region:str = 'us-east-1', public_endpoint:str = None, url_expiry:int = 86400, upload_expiry:int = 900, timeout:float = 30):
+        http_client = urllib3.PoolManager(
+            timeout=urllib3.Timeout(connect=timeout, read=timeout),
+            maxsize=int(os.environ.get("FILE_STORAGE_WORKERS", 16)),
+            retries=urllib3.Retry(total=0)
+        )
+        self.client = Minio(endpoint, access_key=access_key, secret_key=secret_key, secure=secure, region=region, http_client=http_client)
+        # presigning is done offline, so this client never connects
+        self.public_client = Minio(public_endpoint or endpoint, access_key=access_key, secret_key=secret_key, secure=secure, region=region)
+        self.bucket = bucket
+        self.upload_url = f"{'https' if secure else 'http'}://{public_endpoint or endpoint}/{bucket}"
+        self.url_expiry = timedelta(seconds=url_expiry)
+        self.upload_expiry = timedelta(seconds=upload_expiry)
+        self.transient_errors = (urllib3.exceptions.HTTPError,)
+        self.bucket_lock = Lock()
+        self.bucket_ready = False
+
+    def prepare(self):
+        if self.bucket_ready:
+            return
+
+        with self.bucket_lock:
+            if not self.bucket_ready:
+                if not self.client.bucket_exists(self.bucket):
+                    self.client.make_bucket(self.bucket)
+                self.bucket_ready = True
+
+    def build_url(self, public_id:str, version = None, format:str = None):
+        return self.public_client.presigned_get_object(self.bucket, public_id, expires=self.url_expiry)
+
+    def resolve(self, public_id:str):
+        try:
+            self.client.stat_object(self.bucket, public_id)
+        except S3Error as e:
+            if e.code in ('NoSuchKey', 'NoSuchObject'):
+                return None
+            raise
+
+        return self.build_url(public_id)
+
+    def list_folder(self, folder:str):
+        objects = self.client.list_objects(self.bucket, prefix=f'{folder}/')
+        return [self.build_url(name) for name in sorted(obj.object_name for obj in objects if not obj.is_dir)]
+
+    def upload(self, file, public_id:str, suffix:str):
+        self.prepare()
+        file.seek(0)
+        content_type = mimetypes.types_map.get(f'.{suffix.lower()}', 'application/octet-stream')
+        self.client.put_object(self.bucket, public_id, file, length=-1, part_size=10*1024*1024, content_type=content_type)
+        return self.build_url(public_id)
+
+    def download(self, public_id:str):
+        resp = self.client.get_object(self.bucket, public_id)
+        try:
+            return resp.read()
+        finally:
+            resp.close()
+            resp.release_conn()
+
+    # presigned POST policy pinning the key, content type and size; the client posts the
+    # fields with its file (last) as multipart form data
+    def presign_upload(self, public_id:str, suffix:str):
+        content_type = mimetypes.types_map.get(f'.{suffix.lower()}', 'application/octet-stream')
+
+        policy = PostPolicy(self.bucket, datetime.now(timezone.utc) + self.upload_expiry)
+        policy.add_equals_condition('key', public_id)
+        policy.add_equals_condition('Content-Type', content_type)
+        policy.add_content_length_range_condition(1, MAX_IMAGE_BYTES)
+
+        return {
+            'public_id' : public_id,
+            'method' : 'POST',
+            'url' : self.upload_url,
+            'fields' : {
+                'key' : public_id,
+                'Content-Type' : content_type,
+                **self.public_client.presigned_post_policy(policy)
+            },
+            'headers' : {}
+        }
+
+    def delete(self, public_id:str):
+        self.client.remove_object(self.bucket, public_id)
+
+    def delete_folder(self, folder:str):
+        objects = self.client.list_objects(self.bucket, prefix=f'{folder}/', recursive=True)
+        errors = self.client.remove_objects(self.bucket, [DeleteObject(obj.object_name) for obj in objects])
+        # deletion is lazy; errors have to be consumed for it to happen
+        for error in errors:
+            raise RuntimeError(f'Failed deleting {error.name}: {error.message}')
+
+class LocalBackend(StorageBackend):
+    """
+    Directory on local disk, served by the app itself at `base_url` (see
+    `app.py`). Meant for development and tests; direct uploads are not
+    supported, files are uploaded through the API.
+    """
+    def __init__(self, root:str = 'storage', base_url:str = '/files'):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip('/')
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    # files are kept with their extension, which is not part of the public id
+    def find(self, public_id:str):
+        path = self.root / public_id
+        if not path.parent.is_dir():
+            return None
+
+        for match in sorted(path.parent.glob(f'{path.name}.*')):
+            if match.is_file():
+                return match
+        return None
+
+    def url_of(self, path:Path):
+        return f'{self.base_url}/{path.relative_to(self.root).as_posix()}'
+
+    def build_url(self, public_id:str, version = None, format:str = None):
+        path = self.find(public_id)
+        if path is None:
+            return f'{self.base_url}/{public_id}' + (f'.{format}' if format else '')
+        return self.url_of(path)
+
+    def resolve(self, public_id:str):
+        path = self.find(public_id)
+        return None if path is None else self.url_of(path)
+
+    def list_folder(self, folder:str):
+        path = self.root / folder
+        if not path.is_dir():
+            return []
+        return [self.url_of(file) for file in sorted(path.iterdir()) if file.is_file()]
+
+    def upload(self, file, public_id:str, suffix:str):
+        self.delete(public_id)
+
+        path = self.root / f'{public_id}.{suffix}'
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        file.seek(0)
+        with open(path, 'wb') as out:
+            while chunk := file.read(1024*1024):
+                out.write(chunk)
+
+        return self.url_of(path)
+
+    def download(self, public_id:str):
+        path = self.find(public_id)
+        if path is None:
+            raise FileNotFoundError(public_id)
+        return path.read_bytes()
+
+    def delete(self, public_id:str):
+        path = self.find(public_id)
+        if path is not None:
+            path.unlink()
+
+    def delete_folder(self, folder:str):
+        path = self.root / folder
+        if not path.is_dir():
+            return
+        for file in path.iterdir():
+            if file.is_file():
+                file.unlink()
+
+# the backend named by FILE_STORAGE_BACKEND: cloudinary (default), s3/minio or local
+@lru_cache(maxsize=None)
+def get_storage_backend():
+    backend = os.environ.get("FILE_STORAGE_BACKEND", "cloudinary").lower()
+    timeout = float(os.environ.get("FILE_STORAGE_TIMEOUT", 30))
+
+    if backend == 'cloudinary':
+        return CloudinaryBackend(timeout=timeout)
+
+    if backend in ('s3', 'minio'):
+        return S3Backend(
+            endpoint=os.environ.get("S3_ENDPOINT"),
+            access_key=os.environ.get("S3_ACCESS_KEY"),
+            secret_key=os.environ.get("S3_SECRET_KEY"),
+            bucket=os.environ.get("S3_BUCKET", "relieph"),
+            secure=os.environ.get("S3_SECURE", "true").lower() == "true",
+            region=os.environ.get("S3_REGION", "us-east-1"),
+            public_endpoint=os.environ.get("S3_PUBLIC_ENDPOINT"),
+            url_expiry=int(os.environ.get("S3_URL_EXPIRY", 86400)),
+            upload_expiry=int(os.environ.get("S3_UPLOAD_EXPIRY", 900)),
+            timeout=timeout
+        )
+
+    if backend == 'local':
+        return LocalBackend(
+            root=os.environ.get("FILE_STORAGE_ROOT", "storage"),
+            base_url=os.environ.get("FILE_STORAGE_URL", "/files")
+        )
+
+    raise ValueError(f'Unknown storage backend: {backend}')
+
+# path the local backend's files are served at, `None` for other backends
+def local_storage_mount():
+    backend = get_storage_backend()
+
+    if not isinstance(backend, LocalBackend):
+        return None
+
+    return (urlparse(backend.base_url).path or '/files', str(backend.root))
@@ -1,25 +1,123 @@
 import os
-import cloudinary.search
-import cloudinary.search_folders
+import time
+import asyncio
+import logging
+from io import BytesIO
 from dotenv import load_dotenv
 from typing import List
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import UploadFile
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
+from services.storage.backends import StorageBackend, get_storage_backend
+from services.storage.image_pipeline import VARIANTS, InvalidImage, has_image_signature, process_image_async
+from services.storage.url_cache import url_cache
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# storage backends are blocking, so their calls run on this pool instead of the event loop
+storage_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("FILE_STORAGE_WORKERS", 16)),
+    thread_name_prefix="storage"
+)
+
+# uploads in flight per multi-file request
+UPLOAD_CONCURRENCY = int(os.environ.get("FILE_UPLOAD_CONCURRENCY", 5))
+# extra attempts after a timeout, network error or rate limit
+STORAGE_RETRIES = int(os.environ.get("FILE_STORAGE_RETRIES", 2))
+
 class FileHandler():
-    def __init__(self):
+    def __init__(self, backend:StorageBackend = None):
         self.allowed_directories = ('users', 'organizations', 'relief-efforts', 'updates', 'valid_ids')
         self.allowed_img_suffix = ('png', 'jpg')
-        cloudinary.config(
-            cloud_name = os.environ.get('CLOUDINARY_CLOUD_NAME'),
-            api_key = os.environ.get('CLOUDINARY_API_KEY'),
-            api_secret = os.environ.get('CLOUDINARY_SECRET'),
-            secure=True
-        )
+        self.backend = backend or get_storage_backend()
+
+    # runs blocking backend call `fn` on the storage executor, retrying transient failures with backoff.
+    # `idempotent` calls are safe to repeat, so they are also retried when the store may have acted on them
+    async def call(self, fn, *args, idempotent:bool = False, **kwargs):
+        loop = asyncio.get_running_loop()
+        retryable = self.backend.retryable_errors(idempotent)
+
+        for attempt in range(STORAGE_RETRIES + 1):
+            try:
+                return await loop.run_in_executor(storage_executor, partial(fn, *args, **kwargs))
+            except retryable:
+                if attempt == STORAGE_RETRIES:
+                    raise
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+    # public id of `variant` of `public_id`; the full variant is stored under the public id itself
+    def variant_id(self, public_id:str, variant:str = 'full'):
+        if variant == 'full':
+            return public_id
+        return f"relieph/variants/{variant}/{public_id.removeprefix('relieph/')}"
+
+    # processes image `data` and stores every variant of it as `public_id`
+    async def store_image(self, data:bytes, public_id:str):
+        variants = await process_image_async(data)
+
+        async def store(variant:str):
+            content, suffix = variants[variant]
+            url = await self.call(self.backend.upload, BytesIO(content), self.variant_id(public_id, variant), suffix, idempotent=True)
+            url_cache.set(self.variant_id(public_id, variant), url)
+
+        await asyncio.gather(*(store(variant) for variant in variants))
+
+    # builds the delivery url of `public_id` without looking it up
+    def build_url(self, public_id:str, version = None, format:str = None):
+        return self.backend.build_url(public_id, version, format)
+
+    # resolves the delivery url of `public_id`, `None` if it does not exist. only cache misses reach the backend
+    async def resolve_url(self, public_id:str):
+        url, hit = url_cache.get(public_id)
+        if hit:
+            return url
+
+        url = await self.call(self.backend.resolve, public_id)
+
+        url_cache.set(public_id, url)
+        return url
+
+    # resolves many public ids at once; cache misses are looked up together
+    async def resolve_urls(self, public_ids:List[str]):
+        resolved = {}
+        missing = []
+
+        for public_id in dict.fromkeys(public_ids):
+            url, hit = url_cache.get(public_id)
+            if hit:
+                resolved[public_id] = url
+            else:
+                missing.append(public_id)
+
+        if len(missing) > 0:
+            found = await self.call(self.backend.resolve_many, missing)
+            for public_id in missing:
+                resolved[public_id] = found.get(public_id)
+                url_cache.set(public_id, resolved[public_id])
+
+        return resolved
+
+    # lists the files of many folders at once; cache misses are looked up together
+    async def resolve_folders(self, folders:List[str]):
+        resolved = {}
+        missing = []
+
+        for folder in dict.fromkeys(folders):
+            urls, hit = url_cache.get(f'{folder}/')
+            if hit:
+                resolved[folder] = urls
+            else:
+                missing.append(folder)
+
+        if len(missing) > 0:
+            found = await self.call(self.backend.list_folders, missing)
+            for folder in missing:
+                resolved[folder] = found.get(folder, [])
+                url_cache.set(f'{folder}/', resolved[folder])
+
+        return resolved
 
     # retrieves file from object store
     async def retrieve_file(self, id:int, from_:str):
@@ -28,28 +126,38 @@ class FileHandler():
 
         filename=f"relieph/{from_}/{id}"
 
-        if self.file_exists(filename, from_) == False:
-            return ('NonExistentFile', False)
         image_link = None
         try:
-            image_link = cloudinary.api.resource(filename)['secure_url']
+            image_link = await self.resolve_url(filename)
         except Exception as e:
             return ('ErrorRetrieving', False)
+
+        if image_link is None:
+            return ('NonExistentFile', False)
         return (image_link, True)
     
     # retrieve multiple files
     async def retrieve_files(self, id:int, from_:str):
-        resu = None
+        folder = f"relieph/{from_}/{id}"
 
         try:
-            resu = cloudinary.api.resources(type='upload',prefix=f"relieph/{from_}/{id}")
+            resu = await self.resolve_folders([folder])
         except Exception as e:
             return ('ErrorRetrievingFiles', False)
 
-        # extract only `secure_url`
-        parsed_resu = map(lambda image: image['secure_url'] ,resu['resources'])
-        
-        return (list(parsed_resu), True)
+        return (list(resu[folder]), True)
+
+    # retrieves `variant` of the files of each `id` under `from_` in one lookup; returns ({id: [urls]}, True).
+    # folders without the variant (e.g. uploaded before variants existed) fall back to the full files
+    async def retrieve_files_batch(self, ids:List[int], from_:str, variant:str = 'full'):
+        folders = {id : f"relieph/{from_}/{id}" for id in ids}
+
+        try:
+            resu = await self.resolve_folders(list(folders.values()) + [self.variant_id(folder, variant) for folder in folders.values()])
+        except Exception as e:
+            return ('ErrorRetrievingFiles', False)
+
+        return ({id : list(resu[self.variant_id(folder, variant)] or resu[folder]) for id, folder in folders.items()}, True)
 
     # upload a single file
     async def upload_file(self, file:UploadFile, id:int, to:str):
@@ -61,60 +169,178 @@ class FileHandler():
             # handle file checking outside this function
             suffix = file.filename.split('.')[-1]
             file.filename = f'{id}.{suffix}'
-            cloudinary.uploader.upload(file.file, public_id=f"relieph/{to}/{id}")
+            await self.store_image(await file.read(), f"relieph/{to}/{id}")
 
+        except InvalidImage:
+            return ('InvalidImage', False)
         except Exception as e:
             print(e)
             return ('FailedUpload', False)
 
         return ('Success', True)
 
-    # upload multiple file under `id` folder
+    # upload multiple file under `id` folder, at most `UPLOAD_CONCURRENCY` at a time
     async def upload_multiple_file(self, files: List[UploadFile], id: int, to:str):
-        try:
-            to_upload = []
+        semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
 
-            count = 1
-            # iterate thru uploaded files
-            for file in files:
-                suffix = file.filename.split('.')[-1]
-                file.filename = f'{count}.{suffix}'
-                cloudinary.uploader.upload(file.file, public_id=f"relieph/{to}/{id}/{file.filename}")
-                count += 1
+        async def upload(file:UploadFile, count:int):
+            suffix = file.filename.split('.')[-1]
+            file.filename = f'{count}.{suffix}'
+            async with semaphore:
+                await self.store_image(await file.read(), f"relieph/{to}/{id}/{count}")
 
-        except:
+        try:
+            # every upload is awaited before reporting, even when one of them fails
+            resu = await asyncio.gather(*(upload(file, count) for count, file in enumerate(files, start=1)), return_exceptions=True)
+        finally:
+            for variant in VARIANTS:
+                url_cache.invalidate(f"{self.variant_id(f'relieph/{to}/{id}', variant)}/")
+
+        if any(isinstance(r, InvalidImage) for r in resu):
+            return ('InvalidImage', False)
+        if any(isinstance(r, Exception) for r in resu):
             return ('UploadError', False)
         
         return ('Success', True)
     
+    # issues a direct upload of `filename` to the store, replacing the file of `id`
+    async def issue_upload(self, filename:str, id:int, to:str):
+        if to not in self.allowed_directories:
+            return ('InvalidDirectory', False)
+
+        suffix = filename.split('.')[-1]
+        if suffix not in self.allowed_img_suffix:
+            return ('InvalidFile', False)
+
+        try:
+            await self.call(self.backend.prepare)
+        except Exception:
+            logger.exception("Error preparing the file store.")
+            return ('StorageUnavailable', False)
+
+        try:
+            upload = self.backend.presign_upload(f"relieph/{to}/{id}", suffix)
+        except NotImplementedError:
+            return ('UnsupportedBackend', False)
+
+        return (upload, True)
+
+    # issues direct uploads of `filenames` into the `id` folder
+    async def issue_uploads(self, filenames:List[str], id:int, to:str):
+        if to.split('/')[0] not in self.allowed_directories:
+            return ('InvalidDirectory', False)
+
+        suffixes = [filename.split('.')[-1] for filename in filenames]
+        if len(filenames) == 0 or any(suffix not in self.allowed_img_suffix for suffix in suffixes):
+            return ('InvalidFile', False)
+
+        # timestamped names keep folders in upload order and never collide with earlier uploads
+        stamp = time.time_ns()
+        try:
+            await self.call(self.backend.prepare)
+        except Exception:
+            logger.exception("Error preparing the file store.")
+            return ('StorageUnavailable', False)
+
+        try:
+            uploads = [self.backend.presign_upload(f"relieph/{to}/{id}/{stamp}{count:03}", suffix) for count, suffix in enumerate(suffixes, start=1)]
+        except NotImplementedError:
+            return ('UnsupportedBackend', False)
+
+        return (uploads, True)
+
+    # records a direct upload issued by `issue_upload` once the client has finished it
+    async def confirm_upload(self, id:int, to:str):
+        public_id = f"relieph/{to}/{id}"
+
+        try:
+            url = await self.call(self.backend.resolve, public_id)
+        except Exception as e:
+            return ('ErrorRetrieving', False)
+
+        if url is None:
+            return ('NonExistentFile', False)
+
+        url_cache.set(public_id, url)
+        return ('Success', True)
+
+    # records direct uploads issued by `issue_uploads`; every public id has to exist in the `id` folder
+    async def confirm_uploads(self, public_ids:List[str], id:int, to:str):
+        folder = f"relieph/{to}/{id}"
+
+        if len(public_ids) == 0 or any(public_id.rsplit('/', 1)[0] != folder for public_id in public_ids):
+            return ('InvalidUpload', False)
+
+        try:
+            urls = await self.call(self.backend.resolve_many, public_ids)
+        except Exception as e:
+            return ('ErrorRetrieving', False)
+        finally:
+            url_cache.invalidate(f"{folder}/")
+
+        if any(urls.get(public_id) is None for public_id in public_ids):
+            return ('NonExistentFile', False)
+
+        return ('Success', True)
+
+    # replaces directly uploaded files with processed variants; run after confirming, off the request.
+    # Each upload is downloaded once into this process (at most MAX_IMAGE_BYTES, which the
+    # presigned upload enforces where the store can) so the variants can be made here
+    async def process_uploads(self, public_ids:List[str]):
+        for public_id in public_ids:
+            try:
+                data = await self.call(self.backend.download, public_id)
+                await self.store_image(data, public_id)
+            except InvalidImage:
+                logger.warning(f"Removing invalid image {public_id}.")
+                await self.call(self.backend.delete, public_id, idempotent=True)
+                url_cache.set(public_id, None)
+            except Exception:
+                logger.exception(f"Error processing image {public_id}.")
+            finally:
+                for variant in VARIANTS:
+                    url_cache.invalidate(f"{self.variant_id(public_id, variant).rsplit('/', 1)[0]}/")
+
     # deletes a single image
     async def remove_file(self, id:int, from_:str):
+        public_ids = [self.variant_id(f"relieph/{from_}/{id}", variant) for variant in VARIANTS]
+
         try:
-            cloudinary.uploader.destroy(f"relieph/{from_}/{id}")
+            await asyncio.gather(*(self.call(self.backend.delete, public_id, idempotent=True) for public_id in public_ids))
         except Exception as e:
+            for public_id in public_ids:
+                url_cache.invalidate(public_id)
             return ('ErrorDeleting', False)
+
+        for public_id in public_ids:
+            url_cache.set(public_id, None)
         
         return ('Success', True)
     
     # delete multiple files
-    def remove_files(self, id:int, from_:str):
+    async def remove_files(self, id:int, from_:str):
+        folders = [self.variant_id(f"relieph/{from_}/{id}", variant) for variant in VARIANTS]
+
         try:
-            cloudinary.api.delete_resources_by_prefix(f"{from_}/{id}")
+            await asyncio.gather(*(self.call(self.backend.delete_folder, folder, idempotent=True) for folder in folders))
         except Exception as e:
             return ('ErrorDeleting', False)
+        finally:
+            for folder in folders:
+                url_cache.invalidate_prefix(f"{folder}/")
         
         return ('Success', True)
     
+    # checks the suffix and, as far as its leading bytes tell, the real format of `file`
     async def is_file_valid(self, file:UploadFile, allowed_suffixes:List[str]):
         if file.filename.split('.')[-1] not in allowed_suffixes:
             # suffix is not in allowed suffixes
             return False
-        return True
+        return has_image_signature(file.file)
     
     async def are_files_valid(self, files:List[UploadFile], allowed_suffixes:List[str]):
         for file in files:
-            if file.filename.split('.')[-1] not in allowed_suffixes:
-                # suffix is not in allowed suffixes
+            if await self.is_file_valid(file, allowed_suffixes) == False:
                 return False
             
         return True
@@ -122,19 +348,36 @@ class FileHandler():
     async def file_exists(self, id:int, from_:str):
         try:
             # try getting file
-            image = cloudinary.api.resource(f"relieph/{from_}/{id}")
+            return await self.resolve_url(f"relieph/{from_}/{id}") is not None
         except Exception as e:
             return False
-        return True
     
     async def get_user_profile(self, id:int):
         resu = await self.retrieve_file(id, 'users')
         if resu[1] == False:
-            return cloudinary.api.resource('relieph/users/default_profile')['secure_url']
+            return self.build_url('relieph/users/default_profile')
         return resu[0]
     
     async def get_org_profile(self, id:int):
         resu = await self.retrieve_file(id, 'organizations')
         if resu[1] == False:
-            return cloudinary.api.resource('relieph/organizations/default_profile')['secure_url']
-        return resu[0]
\ No newline at end of file
+            return self.build_url('relieph/organizations/default_profile')
+        return resu[0]
+
+    # resolves `variant` profile links of many ids in one lookup, falling back to the full image, then the default profile
+    async def get_profiles(self, ids:List[int], from_:str, variant:str = 'full'):
+        default = self.build_url(f'relieph/{from_}/default_profile')
+        public_ids = {id : f"relieph/{from_}/{id}" for id in ids}
+
+        try:
+            resu = await self.resolve_urls(list(public_ids.values()) + [self.variant_id(public_id, variant) for public_id in public_ids.values()])
+        except Exception as e:
+            return {id : default for id in ids}
+
+        return {id : resu[self.variant_id(public_id, variant)] or resu[public_id] or default for id, public_id in public_ids.items()}
+
+    async def get_user_profiles(self, ids:List[int], variant:str = 'full'):
+        return await self.get_profiles(ids, 'users', variant)
+
+    async def get_org_profiles(self, ids:List[int], variant:str = 'full'):
+        return await self.get_profiles(ids, 'organizations', variant)
\ No newline at end of file
@@ -0,0 +1,98 @@
+import os
+import asyncio
+from io import BytesIO
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from PIL import Image, ImageOps
+
+load_dotenv()
+
+# longest side, in pixels, of each stored variant of an image
+VARIANTS = {
+    'thumbnail' : int(os.environ.get("IMAGE_THUMBNAIL_SIZE", 320)),
+    'medium' : int(os.environ.get("IMAGE_MEDIUM_SIZE", 1024)),
+    'full' : int(os.environ.get("IMAGE_FULL_SIZE", 2048))
+}
+
+# formats images may be uploaded in, by the suffix they are stored with
+FORMATS = {
+    'PNG' : 'png',
+    'JPEG' : 'jpg'
+}
+
+# leading bytes of each accepted format
+SIGNATURES = (b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff')
+
+# largest file accepted, also signed into direct uploads
+MAX_IMAGE_BYTES = int(os.environ.get("IMAGE_MAX_BYTES", 10 * 1024 * 1024))
+
+# refuse decompression bombs well before they reach memory
+Image.MAX_IMAGE_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", 50_000_000))
+
+class InvalidImage(Exception):
+    pass
+
+# cheap check of the leading bytes of `file`, which is left rewound
+def has_image_signature(file):
+    head = file.read(8)
+    file.seek(0)
+    return head.startswith(SIGNATURES)
+
+def process_image(data:bytes):
+    """
+    Decodes `data` and re-encodes it once per variant, returning
+    `{variant: (bytes, suffix)}`. Images are turned upright and stripped of
+    EXIF and other metadata; variants are only ever scaled down.
+
+    Raises `InvalidImage` when `data` is not a PNG or JPEG image, or is
+    larger than `MAX_IMAGE_BYTES`.
+    """
+    if len(data) > MAX_IMAGE_BYTES:
+        raise InvalidImage(f'Image is larger than {MAX_IMAGE_BYTES} bytes')
+
+    try:
+        image = Image.open(BytesIO(data))
+        format = image.format
+        if format not in FORMATS:
+            raise InvalidImage(f'Unsupported image format: {format}')
+
+        image.load()
+        image = ImageOps.exif_transpose(image)
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise InvalidImage(str(e))
+
+    try:
+        # 16 and 32 bit greyscale cannot be resized; scaled down to 8 bits first
+        if image.mode.startswith('I'):
+            image = image.convert('I').point(lambda value: value * (1 / 256)).convert('L')
+
+        if format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        variants = {}
+        for variant, size in VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+
+            out = BytesIO()
+            # metadata is only written when passed explicitly, so none is carried over
+            if format == 'JPEG':
+                resized.save(out, 'JPEG', quality=85, optimize=True, progressive=True)
+            else:
+                resized.save(out, 'PNG', optimize=True)
+
+            variants[variant] = (out.getvalue(), FORMATS[format])
+    except (OSError, ValueError) as e:
+        raise InvalidImage(str(e))
+
+    return variants
+
+# processing is CPU bound, so it runs in worker processes; started on first use
+@lru_cache(maxsize=None)
+def get_image_executor():
+    return ProcessPoolExecutor(max_workers=int(os.environ.get("IMAGE_WORKERS", 2)))
+
+async def process_image_async(data:bytes):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_image_executor(), process_image, data)
@@ -0,0 +1,79 @@
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class UrlCache():
+    """
+    TTL/LRU cache of resolved delivery URLs, keyed by public id (or folder prefix).
+
+    A cached `None` (or empty folder) records an asset known to be missing,
+    so misses don't hit the Admin API either, e.g. users without a profile
+    image on every list page. `FileHandler` replaces an entry whenever it
+    stores, confirms or deletes that asset; changes made by another worker
+    show up here once the entry expires.
+    """
+    def __init__(self, maxsize:int = 4096, ttl:float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # returns (value, True) on a hit, (None, False) on a miss
+    def get(self, key:str):
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None or entry[1] < time.monotonic():
+                self.entries.pop(key, None)
+                self.misses += 1
+                return (None, False)
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return (entry[0], True)
+
+    def set(self, key:str, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key:str):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    # drops every key starting with `prefix`
+    def invalidate_prefix(self, prefix:str):
+        with self.lock:
+            for key in [key for key in self.entries if key.startswith(prefix)]:
+                del self.entries[key]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size" : len(self.entries),
+                "hits" : self.hits,
+                "misses" : self.misses
+            }
+
+def cache_ttl():
+    ttl = float(os.environ.get("FILE_URL_CACHE_TTL", 3600))
+
+    # presigned S3 URLs expire; cached ones are handed out with at least half their lifetime left
+    if os.environ.get("FILE_STORAGE_BACKEND", "cloudinary").lower() in ('s3', 'minio'):
+        ttl = min(ttl, int(os.environ.get("S3_URL_EXPIRY", 86400)) / 2)
+
+    return ttl
+
+url_cache = UrlCache(
+    maxsize=int(os.environ.get("FILE_URL_CACHE_SIZE", 4096)),
+    ttl=cache_ttl()
+)
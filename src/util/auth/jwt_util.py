@@ -4,8 +4,8 @@ from datetime import datetime, timedelta
 from typing import Union, Any
 from jose import jwt
 
-import bcrypt
 from base64 import b64decode, b64encode
+from .password_hasher import hash_password_sync, check_password_sync
 
 load_dotenv()
 
@@ -15,29 +15,36 @@ ALGORITHM = "HS256"
 JWT_SECRET_KEY = os.environ['JWT_SECRET_KEY']   # should be kept secret
 JWT_REFRESH_SECRET_KEY = os.environ['JWT_REFRESH_SECRET_KEY']    # should be kept secret
 
+# blocking; prefer `hash_password` and `check_password` from password_hasher in async code
 def get_hashed_password(password: str) -> str:
-    password = password.encode('utf-8')
-    return bcrypt.hashpw(password, bcrypt.gensalt()).decode('utf-8')
+    return hash_password_sync(password)
 
 def verify_password(password: str, hashed_pass: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), bytes(hashed_pass, 'UTF-8'))
+    return check_password_sync(password, hashed_pass)
 
-def create_access_token(username: Union[str, Any], role: Union[str, Any], expires_delta: int = None) -> str:
+def create_access_token(username: Union[str, Any], role: Union[str, Any], expires_delta: int = None, user_id: int = None, version: int = 0) -> str:
     if expires_delta is not None:
         expires_delta = datetime.utcnow() + expires_delta
     else:
         expires_delta = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode = {"exp": expires_delta, "sub": str(username), "role":str(role)}
+    # uid lets requests be authenticated without looking the user up by name;
+    # ver is the user's token version, the token is refused once it is bumped
+    to_encode = {"exp": expires_delta, "sub": str(username), "role":str(role), "uid": user_id, "ver": version}
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, ALGORITHM)
     return encoded_jwt
 
-def create_refresh_token(username: Union[str, Any], role: Union[str, Any], expires_delta: int = None) -> str:
+def create_refresh_token(username: Union[str, Any], role: Union[str, Any], expires_delta: int = None, user_id: int = None, token_id: str = None, family: str = None) -> str:
     if expires_delta is not None:
         expires_delta = datetime.utcnow() + expires_delta
     else:
         expires_delta = datetime.utcnow() + timedelta(minutes=REFRESH_TOKEN_EXPIRE_MINUTES)
     
-    to_encode = {"exp": expires_delta, "sub": str(username), "role":str(role)}
+    # uid lets requests be authenticated without looking the user up by name
+    to_encode = {"exp": expires_delta, "sub": str(username), "role":str(role), "uid": user_id, "jti": token_id, "fam": family}
     encoded_jwt = jwt.encode(to_encode, JWT_REFRESH_SECRET_KEY, ALGORITHM)
-    return encoded_jwt
\ No newline at end of file
+    return encoded_jwt
+
+# raises `JWTError` when the token is invalid or expired
+def decode_refresh_token(token: str) -> dict:
+    return jwt.decode(token, JWT_REFRESH_SECRET_KEY, algorithms=[ALGORITHM])
\ No newline at end of file
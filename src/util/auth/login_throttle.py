@@ -0,0 +1,91 @@
+import os
+import time
+from collections import OrderedDict, deque
+from ipaddress import ip_address, ip_network
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# addresses or networks of the proxies in front of the app (e.g. "10.0.0.0/8,127.0.0.1"), whose
+# X-Forwarded-For entries name the client. Without any, the peer address is the client
+TRUSTED_PROXIES = [ip_network(proxy.strip()) for proxy in os.environ.get("TRUSTED_PROXIES", "").split(',') if proxy.strip()]
+
+def is_trusted_proxy(ip:str):
+    try:
+        address = ip_address(ip)
+    except ValueError:
+        return False
+    return any(address in network for network in TRUSTED_PROXIES)
+
+def client_ip(request):
+    """
+    Address of the client that sent `request`. Behind trusted proxies it is
+    the last X-Forwarded-For entry not added by one of them; the entries
+    before it come from the client and can be forged.
+    """
+    if request.client is None:
+        return 'unknown'
+
+    ip = request.client.host
+    forwarded = [entry.strip() for header in request.headers.getlist('x-forwarded-for') for entry in header.split(',')]
+    while is_trusted_proxy(ip) and len(forwarded) > 0:
+        ip = forwarded.pop()
+
+    return ip
+
+class LoginThrottle():
+    """
+    Counts failed logins per key (client IP, username) over a sliding window
+    of `window` seconds. Once a key has `limit` failures in the window it is
+    blocked until the oldest of them expires. Keys are kept in memory, so the
+    limits apply per worker process; the least recently failed keys are
+    dropped past `max_keys`.
+    """
+    def __init__(self, limit:int, window:float, max_keys:int = 100_000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self.failures:OrderedDict[str, deque] = OrderedDict()
+
+    # seconds until `key` may try again, or 0 when it is not blocked
+    def retry_after(self, key:str) -> float:
+        failures = self.failures.get(key)
+        if failures is None:
+            return 0
+
+        now = time.monotonic()
+        while len(failures) > 0 and failures[0] <= now - self.window:
+            failures.popleft()
+
+        if len(failures) == 0:
+            del self.failures[key]
+            return 0
+
+        if len(failures) < self.limit:
+            return 0
+
+        return failures[0] + self.window - now
+
+    def record_failure(self, key:str):
+        failures = self.failures.get(key)
+        if failures is None:
+            failures = self.failures[key] = deque(maxlen=self.limit)
+
+        failures.append(time.monotonic())
+        self.failures.move_to_end(key)
+
+        while len(self.failures) > self.max_keys:
+            self.failures.popitem(last=False)
+
+    def reset(self, key:str):
+        self.failures.pop(key, None)
+
+# an address gets more attempts than an account, as several users may share it
+ip_throttle = LoginThrottle(
+    limit=int(os.environ.get("LOGIN_MAX_FAILURES_PER_IP", 50)),
+    window=float(os.environ.get("LOGIN_THROTTLE_WINDOW", 900))
+)
+username_throttle = LoginThrottle(
+    limit=int(os.environ.get("LOGIN_MAX_FAILURES_PER_USERNAME", 10)),
+    window=float(os.environ.get("LOGIN_THROTTLE_WINDOW", 900))
+)
@@ -0,0 +1,55 @@
+import os
+import asyncio
+import bcrypt
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# bcrypt cost factor of new hashes; hashes of another cost are replaced on the next login
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+# hashes queued or running at once; callers past this wait their turn
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get("PASSWORD_HASH_CONCURRENCY", PASSWORD_HASH_WORKERS * 4))
+
+def hash_password_sync(password:str, rounds:int = BCRYPT_ROUNDS) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+def check_password_sync(password:str, hashed_pass:str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), hashed_pass.encode('utf-8'))
+
+# cost factor of `hashed_pass`, e.g. 12 for "$2b$12$..."
+def hash_rounds(hashed_pass:str):
+    try:
+        return int(hashed_pass.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+def needs_rehash(hashed_pass:str) -> bool:
+    return hash_rounds(hashed_pass) != BCRYPT_ROUNDS
+
+# bcrypt is CPU bound for 100ms+, so it runs in worker processes; started on first use
+@lru_cache(maxsize=None)
+def get_hash_executor():
+    return ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+
+semaphores = {}
+
+def get_semaphore():
+    loop = asyncio.get_running_loop()
+
+    if loop not in semaphores:
+        semaphores[loop] = asyncio.Semaphore(PASSWORD_HASH_CONCURRENCY)
+
+    return semaphores[loop]
+
+async def run_hash(fn, *args):
+    async with get_semaphore():
+        return await asyncio.get_running_loop().run_in_executor(get_hash_executor(), fn, *args)
+
+async def hash_password(password:str) -> str:
+    return await run_hash(hash_password_sync, password, BCRYPT_ROUNDS)
+
+async def check_password(password:str, hashed_pass:str) -> bool:
+    return await run_hash(check_password_sync, password, hashed_pass)
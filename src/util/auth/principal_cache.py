@@ -0,0 +1,74 @@
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from dotenv import load_dotenv
+from sqlalchemy import select
+from services.db.database import AsyncSession
+from services.db.models import User
+
+load_dotenv()
+
+class PrincipalCache():
+    """
+    TTL/LRU cache of the current `(username, level, token_version)` of users,
+    keyed by id, so authenticating a request does not query the DB. A cached
+    `None` records a deleted or missing user.
+
+    Entries are dropped through `invalidate` when a user's level changes or
+    the user is deleted. Other workers reload an entry as soon as they see a
+    token carrying a newer token version than the cached one, and otherwise
+    pick the change up within `ttl`.
+    """
+    def __init__(self, maxsize:int = 10000, ttl:float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = Lock()
+        self.entries = OrderedDict()
+        # bumped by every invalidation, so loads that raced one are not cached
+        self.generation = 0
+
+    # the principal of `user_id`, reloaded when the cached one is older than `min_version`
+    async def get(self, user_id:int, min_version:int = 0):
+        with self.lock:
+            entry = self.entries.get(user_id)
+
+            if entry is not None and entry[1] >= time.monotonic() and (entry[0] is None or entry[0][2] >= min_version):
+                self.entries.move_to_end(user_id)
+                return entry[0]
+
+            generation = self.generation
+
+        principal = await self.load(user_id)
+        self.set(user_id, principal, generation)
+        return principal
+
+    async def load(self, user_id:int):
+        async with AsyncSession() as db:
+            user = (await db.execute(
+                select(User.username, User.level, User.token_version).filter(User.id == user_id, User.is_deleted == False)
+            )).first()
+
+        return None if user is None else (user.username, user.level, user.token_version)
+
+    # skipped when an entry was invalidated after `generation` was read, since `principal` may predate that change
+    def set(self, user_id:int, principal, generation:int = None):
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+
+            self.entries[user_id] = (principal, time.monotonic() + self.ttl)
+            self.entries.move_to_end(user_id)
+
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, user_id:int):
+        with self.lock:
+            self.generation += 1
+            self.entries.pop(user_id, None)
+
+principal_cache = PrincipalCache(
+    maxsize=int(os.environ.get("AUTH_PRINCIPAL_CACHE_SIZE", 10000)),
+    ttl=float(os.environ.get("AUTH_PRINCIPAL_CACHE_TTL", 60))
+)
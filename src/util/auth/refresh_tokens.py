@@ -0,0 +1,130 @@
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Lock
+from uuid import uuid4
+from dotenv import load_dotenv
+from jose import JWTError
+from pytz import UTC as utc
+from sqlalchemy import text
+from services.db.database import Session
+from services.db.models import RefreshToken
+from .jwt_util import create_refresh_token, decode_refresh_token, REFRESH_TOKEN_EXPIRE_MINUTES
+
+load_dotenv()
+
+# marks a live token as used, so each refresh token can be exchanged once
+CONSUME_QUERY = text("""
+    UPDATE refresh_tokens SET revoked_at = now()
+    WHERE id = :id AND revoked_at IS NULL AND expires_at > now()
+    RETURNING user_id, family
+""")
+
+REVOKE_FAMILY_QUERY = text("""
+    UPDATE refresh_tokens SET revoked_at = now() WHERE family = :family AND revoked_at IS NULL
+""")
+
+REVOKE_USER_QUERY = text("""
+    UPDATE refresh_tokens SET revoked_at = now() WHERE user_id = :user_id AND revoked_at IS NULL
+    RETURNING family
+""")
+
+PURGE_QUERY = text("""
+    DELETE FROM refresh_tokens WHERE expires_at < now()
+""")
+
+class InvalidRefreshToken(Exception):
+    pass
+
+class RefreshTokenStore():
+    """
+    Issues and rotates refresh tokens, recorded in the `refresh_tokens` table.
+
+    Every refresh consumes the presented token and issues a new one in the
+    same family. Presenting a token that was already used means it was
+    copied, so the whole family is revoked and its holder has to log in again.
+    Recently used tokens and revoked families are also kept in an in-memory
+    LRU, so replays are rejected without a DB round trip.
+    """
+    def __init__(self, revoked_cache_size:int = 100_000):
+        self.revoked_cache_size = revoked_cache_size
+        self.lock = Lock()
+        self.revoked = OrderedDict()
+
+    # records a new token for the user and returns it; a new family is started when none is given
+    def issue(self, db:Session, user_id:int, username:str, level:int, family:str = None) -> str:
+        token_id = uuid4().hex
+        family = family or uuid4().hex
+        expires_delta = timedelta(minutes=REFRESH_TOKEN_EXPIRE_MINUTES)
+
+        db.add(RefreshToken(id=token_id, user_id=user_id, family=family, expires_at=datetime.now(utc) + expires_delta))
+        return create_refresh_token(username, level, expires_delta, user_id=user_id, token_id=token_id, family=family)
+
+    def rotate(self, db:Session, token:str):
+        """
+        Consumes `token`, returning `(user_id, family)` of its owner; the
+        replacement is issued with `issue`. Raises `InvalidRefreshToken`
+        when the token is invalid, expired, revoked or already used.
+        """
+        try:
+            payload = decode_refresh_token(token)
+        except JWTError:
+            raise InvalidRefreshToken('Invalid or expired refresh token.')
+
+        token_id, family = payload.get('jti'), payload.get('fam')
+        if token_id is None or family is None:
+            raise InvalidRefreshToken('Refresh token predates rotation. Sign in again.')
+
+        if self.is_revoked(token_id) or self.is_revoked(family):
+            self.revoke_family(db, family)
+            raise InvalidRefreshToken('Refresh token has been revoked.')
+
+        consumed = db.execute(CONSUME_QUERY, {'id': token_id}).first()
+        if consumed is None:
+            self.revoke_family(db, family)
+            raise InvalidRefreshToken('Refresh token has been revoked.')
+
+        self.remember(token_id)
+        return (consumed.user_id, consumed.family)
+
+    # revokes `token` and its family; invalid tokens are ignored
+    def revoke(self, db:Session, token:str):
+        try:
+            family = decode_refresh_token(token).get('fam')
+        except JWTError:
+            return
+
+        if family is not None:
+            self.revoke_family(db, family)
+
+    # revokes every token rotated from the same login
+    def revoke_family(self, db:Session, family:str):
+        db.execute(REVOKE_FAMILY_QUERY, {'family': family})
+        db.commit()
+        self.remember(family)
+
+    # revokes every token of the user, e.g. once their password changes; committed by the caller
+    def revoke_user(self, db:Session, user_id:int):
+        families = set(db.execute(REVOKE_USER_QUERY, {'user_id': user_id}).scalars())
+        for family in families:
+            self.remember(family)
+
+    def is_revoked(self, key:str) -> bool:
+        with self.lock:
+            return key in self.revoked
+
+    def remember(self, key:str):
+        with self.lock:
+            self.revoked[key] = True
+            self.revoked.move_to_end(key)
+
+            while len(self.revoked) > self.revoked_cache_size:
+                self.revoked.popitem(last=False)
+
+refresh_tokens = RefreshTokenStore(int(os.environ.get("REFRESH_TOKEN_REVOKED_CACHE_SIZE", 100_000)))
+
+# drops expired tokens; scheduled periodically
+def purge_expired_refresh_tokens():
+    with Session() as db:
+        db.execute(PURGE_QUERY)
+        db.commit()
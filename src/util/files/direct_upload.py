@@ -0,0 +1,25 @@
+from fastapi import Response
+from pydantic import BaseModel
+from typing import List
+
+class IssueUploadsDTO(BaseModel):
+    filenames: List[str]
+
+class ConfirmUploadsDTO(BaseModel):
+    public_ids: List[str]
+
+upload_errors = {
+    'InvalidDirectory' : (500, 'Invalid upload directory.'),
+    'InvalidFile' : (400, 'Invalid image type in one or more images.'),
+    'InvalidUpload' : (400, 'One or more uploads were not issued for this resource.'),
+    'StorageUnavailable' : (503, 'File storage is unavailable. Try again later.'),
+    'UnsupportedBackend' : (501, 'Direct uploads are not supported by the storage backend. Upload through the API instead.'),
+    'NonExistentFile' : (400, 'One or more images were not uploaded.'),
+    'ErrorRetrieving' : (500, 'Unable to verify uploaded images.')
+}
+
+# sets the status code of a failed direct upload `error` (from `FileHandler`) and returns its response body
+def upload_error_response(res:Response, error:str):
+    status_code, detail = upload_errors.get(error, (500, 'Unable to process upload.'))
+    res.status_code = status_code
+    return {'detail' : detail}
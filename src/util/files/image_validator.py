@@ -1,9 +1,10 @@
 from fastapi import UploadFile
+from services.storage.image_pipeline import has_image_signature
 
 def is_image_valid(image: UploadFile):
     suffix = image.filename.split('.')[-1]
     if suffix not in ('png', 'jpg'):
         # if not valid image file, return error
         return False
-    # process and add image to list of to_upload
-    return True
\ No newline at end of file
+    # the suffix has to match the content, at least as far as its leading bytes tell
+    return has_image_signature(image.file)
\ No newline at end of file
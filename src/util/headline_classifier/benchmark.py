@@ -0,0 +1,57 @@
+"""
+Per-headline cost of classifying the raw headlines under `dataset/`, one at
+a time and as a single batch.
+
+    python -m util.headline_classifier.benchmark [--limit N] [--repeat N]
+"""
+import os
+import glob
+import time
+import argparse
+import pandas as pd
+from .preprocessing import preprocess_texts
+from .classify import classify_headline, classify_headlines
+
+current_dir = os.path.dirname(__file__)
+
+def load_headlines(limit:int = None):
+    paths = sorted(glob.glob(os.path.join(current_dir, 'dataset/*.csv')))
+    headlines = pd.concat([pd.read_csv(path) for path in paths], ignore_index=True)['headline'].astype(str).tolist()
+    return headlines[:limit] if limit else headlines
+
+# best of `repeat` runs, in microseconds per headline
+def measure(fn, headlines, repeat:int):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(headlines)
+        best = min(best, time.perf_counter() - start)
+
+    return best / len(headlines) * 1_000_000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--limit', type=int, default=None, help='headlines to classify (default: all)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement; the fastest is reported')
+    args = parser.parse_args()
+
+    headlines = load_headlines(args.limit)
+
+    # first run loads the NLTK corpora, which should not count against either path
+    classify_headlines(headlines[:10])
+
+    results = {
+        'preprocess only' : measure(preprocess_texts, headlines, args.repeat),
+        'classify_headline (loop)' : measure(lambda batch: [classify_headline(headline) for headline in batch], headlines, args.repeat),
+        'classify_headlines (batch)' : measure(classify_headlines, headlines, args.repeat)
+    }
+
+    print(f'{len(headlines)} headlines, best of {args.repeat}')
+    for name, cost in results.items():
+        print(f'{name:<28}{cost:>10.1f} us/headline')
+
+    loop, batch = results['classify_headline (loop)'], results['classify_headlines (batch)']
+    print(f'batch speedup: {loop / batch:.1f}x')
+
+if __name__ == '__main__':
+    main()
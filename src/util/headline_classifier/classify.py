@@ -1,7 +1,7 @@
 import os
 import numpy as np
 from joblib import load
-from .preprocessing import preprocess_text
+from .preprocessing import preprocess_text, preprocess_texts
 
 current_dir = os.path.dirname(__file__)
 
@@ -9,22 +9,30 @@ model_file_path = os.path.join(current_dir, 'model/disaster_classifier.joblib')
 
 model = load(model_file_path)
 
-def classify_headline(data):
-    headline = data
+# headlines the model is less sure of are treated as non-disaster
+MIN_PREDICTION_SCORE = 0.94
+
+def classify_headlines(headlines):
+    """
+    Classifies `headlines` with a single call to the model, returning
+    `{"prediction": category}` for each in order.
+    """
+    if len(headlines) == 0:
+        return []
 
-    preprocessed_headline = preprocess_text(headline)
+    prediction_probabilities = model.predict_proba(preprocess_texts(headlines))
 
-    prediction_probabilities = model.predict_proba([preprocessed_headline])[0]
+    max_prob_indexes = np.argmax(prediction_probabilities, axis=1)
 
-    max_prob_index = np.argmax(prediction_probabilities)
+    prediction_scores = prediction_probabilities[np.arange(len(headlines)), max_prob_indexes]
 
-    predicted_category = model.classes_[max_prob_index]
+    predicted_categories = np.where(
+        prediction_scores >= MIN_PREDICTION_SCORE,
+        model.classes_[max_prob_indexes],
+        "non-disaster"
+    )
 
-    prediction_score = prediction_probabilities[max_prob_index]
-    
-    min_prediction_score_threshold = 0.94
-    
-    if prediction_score >= min_prediction_score_threshold:
-        return {"prediction": predicted_category}
-    else:
-        return {"prediction": "non-disaster"}
\ No newline at end of file
+    return [{"prediction": category} for category in predicted_categories.tolist()]
+
+def classify_headline(data):
+    return classify_headlines([data])[0]
@@ -0,0 +1,46 @@
+import os
+from threading import Lock
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+load_dotenv()
+
+# links of headlines saved within the window; older articles are off the front page
+WARM_QUERY = text("""
+    SELECT link FROM headlines WHERE created_at > now() - make_interval(days => :days)
+""")
+
+class KnownUrls():
+    """
+    Article links already scraped, so each cycle only fetches new articles.
+
+    Warmed once per process from the links saved in the last `days` days,
+    then extended with every link scraped, including non-disaster headlines
+    that are never saved. The unique index on `headlines.link` still guards
+    against anything this misses.
+    """
+    def __init__(self, days:int = 30):
+        self.days = days
+        self.lock = Lock()
+        self.urls = set()
+        self.warmed = False
+
+    def warm(self, db):
+        if self.warmed:
+            return
+
+        links = db.execute(WARM_QUERY, {'days': self.days}).scalars().all()
+        with self.lock:
+            self.urls.update(links)
+            self.warmed = True
+
+    # `urls` not seen before, in order
+    def unknown(self, urls):
+        with self.lock:
+            return [url for url in urls if url not in self.urls]
+
+    def add(self, urls):
+        with self.lock:
+            self.urls.update(urls)
+
+known_urls = KnownUrls(int(os.environ.get("HEADLINE_KNOWN_URL_DAYS", 30)))
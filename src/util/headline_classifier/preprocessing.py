@@ -1,38 +1,100 @@
-
 import os
 import re
+import glob
 import nltk
+import pandas as pd
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
 
 current_dir = os.path.dirname(__file__)
 nltk.data.path.append(os.path.join(current_dir, '/nltk_data'))
 
 from nltk.corpus import stopwords
 from nltk.stem import WordNetLemmatizer
-from .dataset import biohazard, conflict, earthquake, fire, typhoon, volcanic
+
+raw_data_path = os.path.join(current_dir, 'dataset')
+preprocessed_data_path = os.path.join(current_dir, 'preprocessed_data')
 
 lemmatizer = WordNetLemmatizer()
 
+NON_ALPHA = re.compile(r'[^a-zA-Z\s]')
+
+# "fast" or "nltk"; both give the same tokens for preprocessed text
+TOKENIZER = os.environ.get("HEADLINE_TOKENIZER", "fast")
+
+# word_tokenize's contraction rules that can match text of only letters and whitespace
+# (the rest need an apostrophe), as the position each of these words is split at
+CONTRACTIONS = {'cannot': 3, 'gimme': 3, 'gonna': 3, 'gotta': 3, 'lemme': 3, 'wanna': 3}
+
+# loaded on first use, so importing this module does not need the corpus
+@lru_cache(maxsize=None)
+def get_stop_words():
+    return frozenset(stopwords.words('english'))
+
+# headline vocabulary is small and repetitive, so most tokens are lemmatized once
+lemmatize = lru_cache(maxsize=int(os.environ.get("HEADLINE_LEMMA_CACHE_SIZE", 50000)))(lemmatizer.lemmatize)
+
+# same tokens as `nltk.word_tokenize` for text of only letters and whitespace, which
+# has no sentences to split or punctuation to separate, only contractions
+def fast_tokenize(text):
+    tokens = []
+
+    for token in text.split():
+        split_at = CONTRACTIONS.get(token.lower())
+        if split_at is None:
+            tokens.append(token)
+        else:
+            tokens += [token[:split_at], token[split_at:]]
+
+    return tokens
+
+def tokenize(text):
+    if TOKENIZER == 'nltk':
+        return nltk.word_tokenize(text)
+
+    return fast_tokenize(text)
+
 def preprocess_text(text):
-    text = re.sub(r'[^a-zA-Z\s]', '', text)
+    text = NON_ALPHA.sub('', text)
     
     text = text.lower()
 
-    tokens = nltk.word_tokenize(text)
+    tokens = tokenize(text)
     
-    stop_words = set(stopwords.words('english'))
+    stop_words = get_stop_words()
 
     filtered_tokens = [word for word in tokens if word not in stop_words]
     
-    lemmatized_tokens = [lemmatizer.lemmatize(word) for word in filtered_tokens]
+    lemmatized_tokens = [lemmatize(word) for word in filtered_tokens]
     
     preprocessed_text = ' '.join(lemmatized_tokens)
     return preprocessed_text
 
-def preprocess_csv_files():
-    
-    datas = [biohazard, conflict, earthquake, fire, typhoon, volcanic]
-    for data in datas:
+def preprocess_texts(texts):
+    return [preprocess_text(text) for text in texts]
+
+def preprocess_csv_files(workers:int = None):
+    """
+    Preprocesses the raw headlines of every `dataset/*.csv` into the file of
+    the same name under `preprocessed_data/`, for retraining. With `workers`,
+    headlines are preprocessed across that many processes.
+    """
+    executor = ProcessPoolExecutor(max_workers=workers) if workers else None
+
+    try:
+        for path in sorted(glob.glob(os.path.join(raw_data_path, '*.csv'))):
+            data = pd.read_csv(path)
+            headlines = data['headline'].astype(str).tolist()
 
-        data['headline'] = data['headline'].apply(preprocess_text)
-        data.to_csv(f'{data}', index=False)
+            if executor is None:
+                data['headline'] = preprocess_texts(headlines)
+            else:
+                data['headline'] = list(executor.map(preprocess_text, headlines, chunksize=256))
 
+            data.to_csv(os.path.join(preprocessed_data_path, os.path.basename(path)), index=False)
+    finally:
+        if executor is not None:
+            executor.shutdown()
\ No newline at end of file
@@ -1,45 +1,54 @@
 import logging
-from sqlalchemy import and_
+from sqlalchemy.dialects.postgresql import insert
 from services.db.models import Headline
 from services.db.database import Session
-from .scrape_headline import classified_headlines
+from .scrape_headline import classified_headlines, index_validators
+from .known_urls import known_urls
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-db = Session()
-
-def add_data(db, headline_data, p: int = 1, c: int = 10):
-    for data in headline_data:
-        existing_headline = db.query(Headline).filter(
-            and_(Headline.link == data['link'])).limit(c).offset((p-1)*c).first()    
-        
-        if existing_headline:
-            logger.info("Duplicate Headline!")
-            continue
-
-        if data['disaster_type'] == "non-disaster":
-            logger.info("Non-disaster Headline!")
-            continue
-
-        headline = Headline(
-            title=data['title'],
-            link=data['link'],
-            disaster_type=data['disaster_type'],
-            posted_datetime=data['posted_datetime'],
-            article=data['article']
-        )
-        logger.info("Succesfully Added Headline!")
-        db.add(headline)
+# saves the disaster headlines in one statement, returning the ids of those not saved before
+def add_data(db, headline_data):
+    rows = [
+        {
+            'title': data['title'],
+            'link': data['link'],
+            'disaster_type': data['disaster_type'],
+            'posted_datetime': data['posted_datetime'],
+            'article': data['article']
+        }
+        for data in headline_data if data['disaster_type'] != "non-disaster"
+    ]
+
+    if len(rows) == 0:
+        logger.info(f"No disaster headlines among {len(headline_data)} scraped.")
+        return []
+
+    # duplicates, including ones saved concurrently by another worker, are skipped by the unique index on link
+    stmt = insert(Headline).values(rows).on_conflict_do_nothing(index_elements=[Headline.link]).returning(Headline.id)
+    ids = db.execute(stmt).scalars().all()
     db.commit()
 
+    logger.info(f"Added {len(ids)} headlines; {len(rows) - len(ids)} duplicates and {len(headline_data) - len(rows)} non-disaster headlines skipped.")
+    return ids
+
 def start_model():
     try:
+        # separate sessions, so no connection is held while scraping
+        with Session() as db:
+            known_urls.warm(db)
+
+        headline_data, fetched = classified_headlines(known_urls)
+
         with Session() as db:
-            headline_data = classified_headlines()
             add_data(db, headline_data)
+        # recorded once saved, so a failed save is retried next cycle
+        known_urls.add(fetched)
     except Exception as e:
-        db.rollback()
+        logger.exception("Error in saving headlines.")
+        # articles of an unchanged index page are otherwise never fetched again
+        index_validators.clear()
 
 # if __name__ == '__main__':
 #     add_data(db, headline_data(["https://www.philstar.com/headlines/2023/09/03/2293550/two-dead-over-400000-affected-habagat-due-hanna-goring"]))
@@ -1,73 +1,220 @@
+import os
+import time
+import random
+import asyncio
+import logging
 import pytz
-import requests
+import httpx
 
 from bs4 import BeautifulSoup
 from datetime import datetime
-from .classify import classify_headline
-
-main_url = 'https://www.philstar.com/'
-
-def get_soup(url):
-    response = requests.get(url)
-
-    soup = BeautifulSoup(response.content, 'html.parser')
-    return soup
-
-def get_headlines(url):
-    soup = get_soup(url)
-
+from urllib.parse import urlsplit
+from dotenv import load_dotenv
+from .classify import classify_headlines
+from .known_urls import KnownUrls
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# HEADLINE_SOURCE_URL points at the fixture server (see `tests/fakes/fixture_server.py`) when testing
+main_url = os.environ.get("HEADLINE_SOURCE_URL", 'https://www.philstar.com/')
+
+# statuses worth retrying; anything else is final
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# request headers revalidating each index page, from the validators of its last response
+index_validators = {}
+
+class HeadlineScraper():
+    """
+    Fetches pages over one keep-alive client, with at most `per_host`
+    requests in flight per host and at least `delay` seconds between the
+    starts of requests to the same host. Timeouts, transport errors and
+    retryable statuses are retried up to `retries` times with exponential
+    backoff. `transport` replaces the network, e.g. with an ASGI app in tests.
+    """
+    def __init__(self, per_host:int = 4, delay:float = 0.25, timeout:float = 10, retries:int = 2, retry_delay:float = 1,
+                 transport:httpx.AsyncBaseTransport = None):
+        self.per_host = per_host
+        self.delay = delay
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.transport = transport
+        self.client:httpx.AsyncClient = None
+        self.hosts = {}
+
+    async def __aenter__(self):
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout),
+            limits=httpx.Limits(max_connections=self.per_host * 4, max_keepalive_connections=self.per_host * 4),
+            headers={'User-Agent': 'relieph-headline-scraper/1.0'},
+            follow_redirects=True,
+            transport=self.transport
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+        self.client = None
+        self.hosts = {}
+
+    # per host semaphore, lock and the time the next request may start
+    def host(self, url:str):
+        host = urlsplit(url).netloc
+
+        if host not in self.hosts:
+            self.hosts[host] = {'semaphore': asyncio.Semaphore(self.per_host), 'lock': asyncio.Lock(), 'next_at': 0}
+
+        return self.hosts[host]
+
+    async def wait_turn(self, host):
+        async with host['lock']:
+            wait = host['next_at'] - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            host['next_at'] = time.monotonic() + self.delay
+
+    # returns the final response, whatever its status; None when every attempt failed
+    # with a timeout, transport error or retryable status
+    async def fetch(self, url:str, headers:dict = None):
+        host = self.host(url)
+
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1) * (1 + random.random() / 2))
+
+            async with host['semaphore']:
+                await self.wait_turn(host)
+                try:
+                    response = await self.client.get(url, headers=headers)
+                except httpx.TransportError as e:
+                    logger.warning(f'Error fetching {url} (attempt {attempt + 1}): {type(e).__name__}: {e}')
+                    continue
+
+            if response.status_code in RETRY_STATUSES:
+                logger.warning(f'Error fetching {url} (attempt {attempt + 1}): HTTP {response.status_code}')
+                continue
+
+            if not response.is_success and response.status_code != 304:
+                logger.warning(f'Error fetching {url}: HTTP {response.status_code}')
+
+            return response
+
+        return None
+
+def parse_headline_links(soup):
     ribbon_containers = soup.find_all('div', class_='tiles late ribbon-cont')
 
     headlines = []
 
     for ribbon_cont in ribbon_containers:
         links = ribbon_cont.select('.ribbon .ribbon_content .ribbon_title a[href]')
-        
+
         for link in links:
             href = link['href']
             headlines.append(href)
-        
+
     return headlines
 
-def headline_data(urls):
-    headline_data = []
+# returns the article at `url`, or None when the page is not an article
+def parse_article(soup, url):
+    title_div = soup.find('div', class_='article__title')
+    if not title_div:
+        return None
 
-    for url in urls:
-        soup = get_soup(url)
-    
-        title_div = soup.find('div', class_='article__title')
-        if not title_div:
-            continue
-        
-        title = title_div.find('h1').text.strip()
+    title = title_div.find('h1').text.strip()
 
-        date_time_str = soup.find('div', class_='article__date-published').text.strip()
-        
-        formatted_date_time = datetime.strptime(date_time_str, '%B %d, %Y | %I:%M%p')
+    date_time_str = soup.find('div', class_='article__date-published').text.strip()
 
-        localized_time = pytz.timezone('Asia/Manila').localize(formatted_date_time)
+    formatted_date_time = datetime.strptime(date_time_str, '%B %d, %Y | %I:%M%p')
 
-        disaster_type = classify_headline(title)['prediction']
+    localized_time = pytz.timezone('Asia/Manila').localize(formatted_date_time)
 
-        article_div = soup.find('div', class_="article__writeup")
+    article_div = soup.find('div', class_="article__writeup")
 
-        paragraphs = article_div.find_all('p')
+    paragraphs = article_div.find_all('p')
 
-        article_paragraph = ' '.join(p.get_text() for p in paragraphs)
+    article_paragraph = ' '.join(p.get_text() for p in paragraphs)
 
-        headline_data.append({
-            'title': title,
-            'link': url,
-            'disaster_type': disaster_type,
-            'posted_datetime': localized_time,
-            'article': article_paragraph
-        })
-    
-    return headline_data
+    return {
+        'title': title,
+        'link': url,
+        'posted_datetime': localized_time,
+        'article': article_paragraph
+    }
 
-def classified_headlines():
-    links = get_headlines(main_url)    
-    article_data = headline_data(links)
+# returns the links on the index page at `url`; none when it is unchanged since the last cycle
+async def get_headlines(scraper:HeadlineScraper, url):
+    response = await scraper.fetch(url, index_validators.get(url))
+    if response is None or not response.is_success:
+        return []
 
-    return article_data
+    validators = {}
+    if 'ETag' in response.headers:
+        validators['If-None-Match'] = response.headers['ETag']
+    if 'Last-Modified' in response.headers:
+        validators['If-Modified-Since'] = response.headers['Last-Modified']
+    index_validators[url] = validators
+
+    soup = BeautifulSoup(response.content, 'html.parser')
 
+    # keeps the page order while dropping links listed twice
+    return list(dict.fromkeys(parse_headline_links(soup)))
+
+# returns `(fetched, article)`; article is None for pages that are not articles. Pages
+# answering with a final status such as 404 count as fetched, as fetching again won't help
+async def get_article(scraper:HeadlineScraper, url):
+    response = await scraper.fetch(url)
+    if response is None:
+        return (False, None)
+    if not response.is_success:
+        return (True, None)
+
+    try:
+        return (True, parse_article(BeautifulSoup(response.content, 'html.parser'), url))
+    except (AttributeError, ValueError) as e:
+        logger.warning(f'Error parsing {url}: {type(e).__name__}: {e}')
+        return (True, None)
+
+# returns the classified articles at `urls` and the urls fetched, so fetches that failed
+# transiently are tried again next cycle
+async def headline_data(scraper:HeadlineScraper, urls):
+    results = await asyncio.gather(*(get_article(scraper, url) for url in urls))
+
+    headline_data = [article for _, article in results if article is not None]
+    fetched = [url for url, (was_fetched, _) in zip(urls, results) if was_fetched]
+
+    # classified together, so the model runs once per cycle
+    classifications = classify_headlines([article['title'] for article in headline_data])
+    for article, classification in zip(headline_data, classifications):
+        article['disaster_type'] = classification['prediction']
+
+    return (headline_data, fetched)
+
+async def scrape_headlines(url = main_url, known:KnownUrls = None, transport:httpx.AsyncBaseTransport = None):
+    async with HeadlineScraper(
+        per_host=int(os.environ.get("HEADLINE_SCRAPER_CONCURRENCY", 4)),
+        delay=float(os.environ.get("HEADLINE_SCRAPER_DELAY", 0.25)),
+        timeout=float(os.environ.get("HEADLINE_SCRAPER_TIMEOUT", 10)),
+        retries=int(os.environ.get("HEADLINE_SCRAPER_RETRIES", 2)),
+        transport=transport
+    ) as scraper:
+        links = await get_headlines(scraper, url)
+
+        # only articles not seen in earlier cycles are fetched
+        if known is not None:
+            links = known.unknown(links)
+
+        articles, fetched = await headline_data(scraper, links)
+
+        # articles that failed transiently are only retried if the index page is fetched in full
+        if len(fetched) < len(links):
+            index_validators.pop(url, None)
+
+        return (articles, fetched)
+
+# entry point for the scheduler, which runs jobs in worker threads without an event loop
+def classified_headlines(known:KnownUrls = None):
+    return asyncio.run(scrape_headlines(known=known))
@@ -0,0 +1,56 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+from datetime import datetime, timezone
+from fastapi import HTTPException, Response, status
+from sqlalchemy import tuple_
+from services.db.models import created_sort_key
+
+# what `created_sort_key` gives rows without a created_at
+EPOCH = datetime.fromtimestamp(0, timezone.utc)
+
+# response header carrying the cursor of the next page
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+def encode_cursor(created_at:datetime, id:int):
+    payload = json.dumps([created_at.isoformat(), id], separators=(',', ':'))
+    return urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor:str):
+    try:
+        created_at, id = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return (datetime.fromisoformat(created_at), int(id))
+    except (DecodeError, ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor."
+        )
+
+def paginate(query, model, p:int = 1, c:int = 10, cursor:str = None):
+    """
+    Orders `query` newest first and limits it to one page of `c` rows. Pages
+    continue after `cursor` (keyset pagination) when given, otherwise page `p`
+    is taken by offset. Works on both `Query` and `select()` objects.
+    """
+    sort_key = created_sort_key(model.created_at)
+    query = query.order_by(sort_key.desc(), model.id.desc())
+
+    if cursor is not None:
+        created_at, id = decode_cursor(cursor)
+        return query.filter(tuple_(sort_key, model.id) < tuple_(created_at, id)).limit(c)
+
+    return query.limit(c).offset((p-1)*c)
+
+# returns the cursor of the page after `rows`, or None on the last page
+def next_cursor(rows, c:int):
+    if c <= 0 or len(rows) < c:
+        return None
+
+    last = rows[-1]
+    return encode_cursor(last.created_at or EPOCH, last.id)
+
+def set_next_cursor(res:Response, rows, c:int):
+    cursor = next_cursor(rows, c)
+
+    if cursor is not None:
+        res.headers[NEXT_CURSOR_HEADER] = cursor
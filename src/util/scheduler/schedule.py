@@ -1,3 +1,4 @@
+from datetime import datetime
 from pytz import utc
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
@@ -5,6 +6,9 @@ from apscheduler.executors.pool import ThreadPoolExecutor, ProcessPoolExecutor
 from services.db.database import engine
 from ..generate_relief.save import start_gen
 from ..headline_classifier.save import start_model
+from services.counters.counter_handler import rebuild_counters
+from ..auth.refresh_tokens import purge_expired_refresh_tokens
+from services.email.outbox import purge_outbox
 
 jobstore = SQLAlchemyJobStore(engine=engine)
 
@@ -26,4 +30,8 @@ sched = BackgroundScheduler(
 
 sched.add_job(start_model, 'interval', seconds=3600)
 sched.add_job(start_gen, 'interval', seconds=1200)
+# also runs on startup, so counters are filled before the first interval elapses
+sched.add_job(rebuild_counters, 'interval', seconds=21600, next_run_time=datetime.now(utc))
+sched.add_job(purge_expired_refresh_tokens, 'interval', seconds=86400)
+sched.add_job(purge_outbox, 'interval', seconds=86400)
 
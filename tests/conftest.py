@@ -0,0 +1,9 @@
+import os
+import sys
+from dotenv import load_dotenv
+
+# the app imports modules relative to src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src'))
+
+# modules touching the database connect on import, with the settings in DB_KEY
+load_dotenv()
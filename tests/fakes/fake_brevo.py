@@ -0,0 +1,55 @@
+"""
+Stand-in for Brevo's transactional email API, for local runs and tests.
+
+    uvicorn tests.fakes.fake_brevo:app --port 8025
+    EMAIL_API_URL=http://localhost:8025/v3
+
+Accepted emails are kept in memory and listed at `GET /v3/smtp/emails`.
+`POST /v3/fake/failures` makes the next sends fail, to exercise retries
+and dead-lettering.
+"""
+from fastapi import FastAPI, Request, Response
+from pydantic import BaseModel
+from uuid import uuid4
+
+app = FastAPI(title="fake brevo")
+
+sent_emails = []
+failures = []
+
+class FailuresDTO(BaseModel):
+    # status codes the next sends respond with, in order
+    status_codes: list[int]
+
+@app.post("/v3/smtp/email", status_code=201)
+async def send_email(request:Request, res:Response):
+    if len(failures) > 0:
+        res.status_code = failures.pop(0)
+        return {"code" : "fake_failure", "message" : "Failure requested through /v3/fake/failures."}
+
+    body = await request.json()
+    message_ids = [f'<{uuid4()}@fake-brevo>' for _ in body.get('messageVersions', [None])]
+    sent_emails.append({
+        "message_ids" : message_ids,
+        "api_key" : request.headers.get('api-key'),
+        "body" : body
+    })
+
+    if 'messageVersions' in body:
+        return {"messageIds" : message_ids}
+    return {"messageId" : message_ids[0]}
+
+@app.get("/v3/smtp/emails")
+async def list_emails():
+    return sent_emails
+
+@app.delete("/v3/smtp/emails")
+async def clear_emails():
+    sent_emails.clear()
+    failures.clear()
+    return {"detail" : "Cleared."}
+
+@app.post("/v3/fake/failures")
+async def queue_failures(body:FailuresDTO):
+    failures.extend(body.status_codes)
+    return {"detail" : f"Next {len(failures)} sends will fail."}
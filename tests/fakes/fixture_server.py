@@ -0,0 +1,113 @@
+"""
+Stand-in for the philstar pages the headline scraper reads, for local runs and tests.
+
+    uvicorn tests.fakes.fixture_server:app --port 8026
+    HEADLINE_SOURCE_URL=http://localhost:8026/
+
+The front page links 20 generated articles and honours
+If-None-Match; `POST /fake/publish` adds articles to it. `POST /fake/failures`
+makes the next article requests fail and `POST /fake/latency` slows every
+response down, to exercise retries and timeouts. Requests served are listed
+at `GET /fake/requests`.
+"""
+import asyncio
+from html import escape
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import HTMLResponse
+from pydantic import BaseModel
+
+app = FastAPI(title="headline fixtures")
+
+articles = {'count': 20}
+
+TITLES = [
+    'Magnitude 6.1 quake rocks Surigao del Sur',
+    'Typhoon leaves thousands displaced in Bicol',
+    'Fire razes homes in Lapu-Lapu City',
+    'Senate opens hearings on the national budget',
+    'Taal volcano spews smog over Batangas towns'
+]
+
+requests_served = []
+failures = []
+latency = {'seconds': 0.0}
+
+class FailuresDTO(BaseModel):
+    # status codes the next article requests respond with, in order
+    status_codes: list[int]
+
+class LatencyDTO(BaseModel):
+    seconds: float
+
+def page(body:str):
+    return f'<html><head><title>fixture</title></head><body>{body}</body></html>'
+
+@app.middleware("http")
+async def record(request:Request, call_next):
+    if not request.url.path.startswith('/fake/'):
+        requests_served.append(request.url.path)
+        if latency['seconds'] > 0:
+            await asyncio.sleep(latency['seconds'])
+
+    return await call_next(request)
+
+@app.get("/", response_class=HTMLResponse)
+async def front_page(request:Request, res:Response):
+    etag = f'"front-{articles["count"]}"'
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers={'ETag': etag})
+
+    res.headers['ETag'] = etag
+    base = str(request.base_url).rstrip('/')
+    ribbons = ''.join(
+        f'<div class="ribbon"><div class="ribbon_content"><div class="ribbon_title">'
+        f'<a href="{base}/headlines/{id}">{escape(TITLES[id % len(TITLES)])}</a></div></div></div>'
+        for id in range(articles['count'])
+    )
+    # a page linking something that is not an article, which the scraper skips
+    ribbons += f'<div class="ribbon"><div class="ribbon_content"><div class="ribbon_title"><a href="{base}/videos/1">Video</a></div></div></div>'
+    return page(f'<div class="tiles late ribbon-cont">{ribbons}</div>')
+
+@app.get("/headlines/{id}", response_class=HTMLResponse)
+async def article(id:int, res:Response):
+    if len(failures) > 0:
+        res.status_code = failures.pop(0)
+        return page('<p>Fixture failure</p>')
+
+    title = escape(TITLES[id % len(TITLES)])
+    return page(
+        f'<div class="article__title"><h1>{title}</h1></div>'
+        f'<div class="article__date-published">December 04, 2023 | 12:{id % 60:02d}am</div>'
+        f'<div class="article__writeup"><p>{title}, officials said.</p><p>Article {id}.</p></div>'
+    )
+
+@app.get("/videos/{id}", response_class=HTMLResponse)
+async def video(id:int):
+    return page('<div class="video"><p>Video</p></div>')
+
+@app.get("/fake/requests")
+async def list_requests():
+    return requests_served
+
+@app.delete("/fake/requests")
+async def clear_requests():
+    requests_served.clear()
+    failures.clear()
+    latency['seconds'] = 0.0
+    articles['count'] = 20
+    return {"detail" : "Cleared."}
+
+@app.post("/fake/failures")
+async def queue_failures(body:FailuresDTO):
+    failures.extend(body.status_codes)
+    return {"detail" : f"Next {len(failures)} article requests will fail."}
+
+@app.post("/fake/publish")
+async def publish(count:int = 1):
+    articles['count'] += count
+    return {"detail" : f"Front page lists {articles['count']} articles."}
+
+@app.post("/fake/latency")
+async def set_latency(body:LatencyDTO):
+    latency['seconds'] = body.seconds
+    return {"detail" : f"Responses delayed by {body.seconds}s."}
@@ -0,0 +1,29 @@
+import pytest
+from ipaddress import ip_network
+from starlette.requests import Request
+from util.auth import login_throttle
+from util.auth.login_throttle import client_ip
+
+@pytest.fixture(autouse=True)
+def proxies(monkeypatch):
+    monkeypatch.setattr(login_throttle, 'TRUSTED_PROXIES', [ip_network('10.0.0.0/8')])
+
+def request(peer:str, forwarded:str = None):
+    headers = [(b'x-forwarded-for', forwarded.encode())] if forwarded else []
+    return Request({'type': 'http', 'client': (peer, 50000), 'headers': headers})
+
+def test_clients_reached_directly_are_the_peer():
+    assert client_ip(request('203.0.113.5')) == '203.0.113.5'
+    # only trusted proxies may say who the client is
+    assert client_ip(request('203.0.113.5', '198.51.100.7')) == '203.0.113.5'
+
+def test_clients_behind_proxies_come_from_the_forwarded_header():
+    assert client_ip(request('10.0.0.2', '198.51.100.7')) == '198.51.100.7'
+    assert client_ip(request('10.0.0.2', '198.51.100.7, 10.0.3.4')) == '198.51.100.7'
+
+def test_forged_entries_are_ignored():
+    # the client sent "1.2.3.4" itself; the proxy appended the address it saw
+    assert client_ip(request('10.0.0.2', '1.2.3.4, 198.51.100.7')) == '198.51.100.7'
+
+def test_requests_without_forwarded_header_are_the_proxy():
+    assert client_ip(request('10.0.0.2')) == '10.0.0.2'
@@ -0,0 +1,79 @@
+import os
+import asyncio
+import httpx
+import pytest
+
+if not os.environ.get('DB_KEY'):
+    pytest.skip('needs the database (DB_KEY)', allow_module_level=True)
+
+from fakes import fake_brevo
+from services.email import email_handler
+from services.email.outbox import EmailOutboxWorker, SENT_QUERY, RETRY_QUERY, DEAD_QUERY
+
+BODY = {'to': [{'email': 'a@example.org'}], 'subject': 'Test', 'htmlContent': '<p>Test</p>'}
+
+@pytest.fixture(autouse=True)
+def brevo(monkeypatch):
+    fake_brevo.sent_emails.clear()
+    fake_brevo.failures.clear()
+    monkeypatch.setattr(email_handler, 'get_http_client', lambda: httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_brevo.app)))
+    return fake_brevo
+
+def deliver(worker:EmailOutboxWorker, attempts:int):
+    return asyncio.run(worker.deliver({'id': 1, 'path': '/email', 'body': BODY, 'attempts': attempts}))
+
+def test_sent(brevo):
+    query, params = deliver(EmailOutboxWorker(), 1)
+
+    assert query is SENT_QUERY
+    assert params == {'id': 1}
+    assert [email['body'] for email in brevo.sent_emails] == [BODY]
+
+@pytest.mark.parametrize('status_code', [429, 500, 503])
+def test_retryable_failures_back_off(brevo, status_code):
+    brevo.failures.extend([status_code] * 3)
+    worker = EmailOutboxWorker(retry_delay=30, max_attempts=8)
+
+    delays = []
+    for attempts in (1, 2, 3):
+        query, params = deliver(worker, attempts)
+        assert query is RETRY_QUERY
+        assert params['error'].startswith(f'HTTP {status_code}')
+        delays.append(params['delay'])
+
+    assert delays == [30, 60, 120]
+    assert brevo.sent_emails == []
+
+def test_transport_errors_are_retried(monkeypatch):
+    def refuse(request):
+        raise httpx.ConnectError('Connection refused', request=request)
+    monkeypatch.setattr(email_handler, 'get_http_client', lambda: httpx.AsyncClient(transport=httpx.MockTransport(refuse)))
+
+    query, params = deliver(EmailOutboxWorker(retry_delay=30), 2)
+
+    assert query is RETRY_QUERY
+    assert params['delay'] == 60
+    assert params['error'].startswith('ConnectError')
+
+def test_permanent_failures_are_dead_lettered(brevo):
+    brevo.failures.append(400)
+
+    query, params = deliver(EmailOutboxWorker(), 1)
+
+    assert query is DEAD_QUERY
+    assert params['error'].startswith('HTTP 400')
+
+def test_dead_lettered_after_max_attempts(brevo):
+    brevo.failures.append(503)
+
+    query, params = deliver(EmailOutboxWorker(max_attempts=3), 3)
+
+    assert query is DEAD_QUERY
+    assert params['error'].startswith('HTTP 503')
+
+def test_backoff_is_capped_and_follows_retry_after():
+    worker = EmailOutboxWorker(retry_delay=30)
+
+    assert worker.backoff(20) == 3600
+    assert worker.backoff(1, '7') == 7
+    assert worker.backoff(1, 'soon') == 30
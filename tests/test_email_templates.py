@@ -0,0 +1,21 @@
+from services.email.template_registry import email_templates, brevo_literal_text
+
+def test_bulk_bodies_keep_user_text_literal():
+    html = email_templates.render_bulk('relief_update', title='Relief {{ x', update_title='{% if %}', update_message='Bring {# food #} & water')
+
+    # the greeting is the only Brevo tag left
+    assert html.count('{') == 2
+    assert 'Greetings, {{ params.name }}' in html
+    assert 'Relief &#123;&#123; x' in html
+    assert '&#123;% if %&#125;' in html
+    assert 'Bring &#123;# food #&#125; &amp; water' in html
+
+def test_bulk_bodies_are_escaped():
+    html = email_templates.render_bulk('relief_phase', title='<script>', phase='Deployment')
+
+    assert '<script>' not in html
+    assert '&lt;script&gt;' in html
+
+def test_subjects_keep_user_text_literal():
+    assert brevo_literal_text('Update on {{ relief }} {% x %} {# y') == 'Update on { { relief }} { % x %} { # y'
+    assert brevo_literal_text('Update on Relief {1}') == 'Update on Relief {1}'
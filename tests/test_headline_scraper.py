@@ -0,0 +1,105 @@
+import asyncio
+import httpx
+import pytest
+from fakes import fixture_server
+from util.headline_classifier import scrape_headline
+from util.headline_classifier.known_urls import KnownUrls
+from util.headline_classifier.scrape_headline import HeadlineScraper, get_article, scrape_headlines
+
+URL = 'http://fixture/'
+
+@pytest.fixture(autouse=True)
+def fixtures(monkeypatch):
+    asyncio.run(fixture_server.clear_requests())
+    scrape_headline.index_validators.clear()
+    monkeypatch.setenv('HEADLINE_SCRAPER_DELAY', '0')
+    # the model is not under test; every headline is classified the same
+    monkeypatch.setattr(scrape_headline, 'classify_headlines', lambda titles: [{'prediction': 'fire'} for _ in titles])
+    return fixture_server
+
+def transport():
+    return httpx.ASGITransport(app=fixture_server.app)
+
+def fetch_article(id:int, retries:int = 2):
+    async def fetch():
+        async with HeadlineScraper(delay=0, retries=retries, retry_delay=0, transport=transport()) as scraper:
+            return await get_article(scraper, f'{URL}headlines/{id}')
+    return asyncio.run(fetch())
+
+def scrape(known:KnownUrls = None):
+    return asyncio.run(scrape_headlines(URL, known, transport=transport()))
+
+def test_retryable_statuses_are_retried(fixtures):
+    fixtures.failures.extend([503, 429])
+
+    fetched, article = fetch_article(1)
+
+    assert fetched
+    assert article['link'] == f'{URL}headlines/1'
+    assert fixtures.requests_served == ['/headlines/1'] * 3
+
+def test_gives_up_after_retries(fixtures):
+    fixtures.failures.extend([500] * 3)
+
+    assert fetch_article(1, retries=2) == (False, None)
+    assert len(fixtures.requests_served) == 3
+
+def test_final_statuses_are_not_retried(fixtures):
+    fixtures.failures.append(404)
+
+    fetched, article = fetch_article(1)
+
+    assert fetched
+    assert article is None
+    assert fixtures.requests_served == ['/headlines/1']
+
+def test_missing_articles_do_not_reopen_the_front_page(fixtures):
+    fixtures.failures.append(404)
+
+    articles, fetched = scrape()
+    assert len(articles) == 19
+    assert len(fetched) == 21
+
+    fixtures.requests_served.clear()
+    assert scrape() == ([], [])
+    assert fixtures.requests_served == ['/']
+
+def test_transient_failures_are_retried_next_cycle(fixtures, monkeypatch):
+    monkeypatch.setenv('HEADLINE_SCRAPER_RETRIES', '0')
+    fixtures.failures.extend([500] * 3)
+    known = KnownUrls()
+
+    articles, fetched = scrape(known)
+    known.add(fetched)
+    assert len(fetched) == 18
+    failed = sorted(path for path in fixtures.requests_served if path != '/' and f'{URL}{path[1:]}' not in fetched)
+
+    fixtures.requests_served.clear()
+    articles, fetched = scrape(known)
+
+    # the front page is fetched in full again, and only the failed articles with it
+    assert len(articles) == 3
+    assert sorted(fixtures.requests_served) == ['/'] + failed
+
+def test_unchanged_front_page_is_not_scraped_again(fixtures):
+    articles, fetched = scrape()
+    assert len(articles) == 20
+    assert len(fetched) == 21 # the video link is fetched, but is no article
+
+    fixtures.requests_served.clear()
+    assert scrape() == ([], [])
+    # revalidated with If-None-Match and answered 304
+    assert fixtures.requests_served == ['/']
+
+def test_only_new_articles_are_fetched(fixtures):
+    known = KnownUrls()
+    articles, fetched = scrape(known)
+    known.add(fetched)
+
+    asyncio.run(fixture_server.publish(2))
+    fixtures.requests_served.clear()
+    articles, fetched = scrape(known)
+
+    assert [article['link'] for article in articles] == [f'{URL}headlines/20', f'{URL}headlines/21']
+    assert all(article['disaster_type'] == 'fire' for article in articles)
+    assert sorted(fixtures.requests_served) == ['/', '/headlines/20', '/headlines/21']
@@ -0,0 +1,33 @@
+import pytest
+from io import BytesIO
+from PIL import Image
+from services.storage import image_pipeline
+from services.storage.image_pipeline import InvalidImage, process_image
+
+def png(mode:str, size = (300, 200), color = 0):
+    out = BytesIO()
+    Image.new(mode, size, color).save(out, 'PNG')
+    return out.getvalue()
+
+@pytest.mark.parametrize('mode', ['I;16', 'I', 'I;16B'])
+def test_deep_greyscale_is_scaled_to_8_bits(mode):
+    variants = process_image(png(mode, color=40000))
+
+    image = Image.open(BytesIO(variants['full'][0]))
+    assert variants['full'][1] == 'png'
+    assert image.mode == 'L'
+    assert image.getpixel((0, 0)) == 40000 // 256
+
+def test_oversized_files_are_invalid(monkeypatch):
+    data = png('RGB')
+    monkeypatch.setattr(image_pipeline, 'MAX_IMAGE_BYTES', len(data) - 1)
+
+    with pytest.raises(InvalidImage):
+        process_image(data)
+
+def test_other_formats_are_invalid():
+    out = BytesIO()
+    Image.new('RGB', (10, 10)).save(out, 'GIF')
+
+    with pytest.raises(InvalidImage):
+        process_image(out.getvalue())
@@ -0,0 +1,51 @@
+import os
+import asyncio
+import pytest
+
+if not os.environ.get('DB_KEY'):
+    pytest.skip('needs the database (DB_KEY)', allow_module_level=True)
+
+from util.auth.principal_cache import PrincipalCache
+
+def loader(cache:PrincipalCache, principals:list, during_load = None):
+    loads = []
+
+    async def load(user_id:int):
+        loads.append(user_id)
+        principal = principals[min(len(loads), len(principals)) - 1]
+        if during_load is not None:
+            during_load()
+        return principal
+
+    cache.load = load
+    return loads
+
+def test_cached_until_invalidated():
+    cache = PrincipalCache()
+    loads = loader(cache, [('bob', 1, 0), ('bob', 2, 1)])
+
+    assert asyncio.run(cache.get(7)) == ('bob', 1, 0)
+    assert asyncio.run(cache.get(7)) == ('bob', 1, 0)
+    cache.invalidate(7)
+    assert asyncio.run(cache.get(7)) == ('bob', 2, 1)
+    assert loads == [7, 7]
+
+def test_newer_tokens_reload_the_principal():
+    cache = PrincipalCache()
+    loads = loader(cache, [('bob', 1, 0), ('bob', 2, 1)])
+
+    asyncio.run(cache.get(7))
+    # another worker changed the user and the token was issued after that
+    assert asyncio.run(cache.get(7, min_version=1)) == ('bob', 2, 1)
+    assert asyncio.run(cache.get(7, min_version=1)) == ('bob', 2, 1)
+    assert loads == [7, 7]
+
+def test_loads_racing_an_invalidation_are_not_cached():
+    cache = PrincipalCache()
+    # the row is read before the change commits, the invalidation lands before the load returns
+    loads = loader(cache, [('bob', 1, 0), ('bob', 2, 1)], during_load=lambda: cache.invalidate(7) if len(loads) == 1 else None)
+
+    assert asyncio.run(cache.get(7)) == ('bob', 1, 0)
+    assert asyncio.run(cache.get(7)) == ('bob', 2, 1)
+    assert asyncio.run(cache.get(7)) == ('bob', 2, 1)
+    assert loads == [7, 7]
@@ -0,0 +1,51 @@
+import time
+import asyncio
+import pytest
+from io import BytesIO
+from PIL import Image
+from services.storage.backends import LocalBackend
+from services.storage.file_handler import FileHandler
+from services.storage import url_cache as url_cache_module
+from services.storage.url_cache import url_cache
+
+@pytest.fixture
+def handler(tmp_path):
+    url_cache.entries.clear()
+    backend = LocalBackend(root=str(tmp_path))
+    lookups = []
+
+    resolve_many = backend.resolve_many
+    def counted(public_ids):
+        lookups.append(public_ids)
+        return resolve_many(public_ids)
+    backend.resolve_many = counted
+
+    yield (FileHandler(backend), lookups)
+    url_cache.entries.clear()
+
+def png():
+    out = BytesIO()
+    Image.new('RGB', (400, 300)).save(out, 'PNG')
+    return out.getvalue()
+
+def test_missing_profiles_are_looked_up_once(handler, monkeypatch):
+    handler, lookups = handler
+
+    first = asyncio.run(handler.get_user_profiles([1, 2], 'thumbnail'))
+    # misses are kept as long as anything else
+    now = time.monotonic()
+    monkeypatch.setattr(url_cache_module.time, 'monotonic', lambda: now + url_cache.ttl - 1)
+    second = asyncio.run(handler.get_user_profiles([1, 2], 'thumbnail'))
+
+    assert first == second == {1: '/files/relieph/users/default_profile', 2: '/files/relieph/users/default_profile'}
+    assert len(lookups) == 1
+
+def test_uploads_replace_cached_misses(handler):
+    handler, lookups = handler
+    asyncio.run(handler.get_user_profiles([1], 'thumbnail'))
+
+    asyncio.run(handler.store_image(png(), 'relieph/users/1'))
+    profiles = asyncio.run(handler.get_user_profiles([1], 'thumbnail'))
+
+    assert profiles[1].startswith('/files/relieph/variants/thumbnail/users/1.')
+    assert len(lookups) == 1
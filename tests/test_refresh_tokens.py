@@ -0,0 +1,98 @@
+import os
+import pytest
+from uuid import uuid4
+
+if not os.environ.get('DB_KEY'):
+    pytest.skip('needs the database (DB_KEY)', allow_module_level=True)
+
+from sqlalchemy import text
+from services.db.database import Session
+from services.db.models import RefreshToken, User
+from util.auth.refresh_tokens import RefreshTokenStore, InvalidRefreshToken
+
+@pytest.fixture
+def db():
+    with Session() as db:
+        yield db
+
+@pytest.fixture
+def user(db):
+    user = User(username=f'refresh-{uuid4().hex[:12]}', password='-', level=1)
+    db.add(user)
+    db.commit()
+
+    yield user
+
+    db.rollback()
+    db.execute(text('DELETE FROM refresh_tokens WHERE user_id = :id'), {'id': user.id})
+    db.delete(user)
+    db.commit()
+
+def issue(db, store:RefreshTokenStore, user:User, family:str = None):
+    token = store.issue(db, user.id, user.username, user.level, family)
+    db.commit()
+    return token
+
+def live_tokens(db, user:User):
+    return db.query(RefreshToken).filter(RefreshToken.user_id == user.id, RefreshToken.revoked_at == None).count()
+
+def test_rotation_consumes_the_token(db, user):
+    store = RefreshTokenStore()
+    token = issue(db, store, user)
+
+    user_id, family = store.rotate(db, token)
+    rotated = issue(db, store, user, family)
+
+    assert user_id == user.id
+    assert store.rotate(db, rotated) == (user.id, family)
+
+def test_reuse_revokes_the_family(db, user):
+    store = RefreshTokenStore()
+    token = issue(db, store, user)
+    _, family = store.rotate(db, token)
+    rotated = issue(db, store, user, family)
+
+    with pytest.raises(InvalidRefreshToken):
+        store.rotate(db, token)
+
+    # the token rotated from it is revoked too, so whoever holds it has to sign in again
+    with pytest.raises(InvalidRefreshToken):
+        store.rotate(db, rotated)
+    assert live_tokens(db, user) == 0
+
+def test_reuse_is_detected_by_other_workers(db, user):
+    token = issue(db, RefreshTokenStore(), user)
+    RefreshTokenStore().rotate(db, token)
+
+    # a worker that never saw the token used finds it consumed in the table
+    other = RefreshTokenStore()
+    with pytest.raises(InvalidRefreshToken):
+        other.rotate(db, token)
+    assert live_tokens(db, user) == 0
+
+def test_logout_revokes_the_family(db, user):
+    store = RefreshTokenStore()
+    token = issue(db, store, user)
+    other_login = issue(db, store, user)
+
+    store.revoke(db, token)
+
+    with pytest.raises(InvalidRefreshToken):
+        store.rotate(db, token)
+    assert store.rotate(db, other_login)[0] == user.id
+
+def test_invalid_tokens_are_refused(db):
+    with pytest.raises(InvalidRefreshToken):
+        RefreshTokenStore().rotate(db, 'not-a-token')
+
+def test_revoking_the_user_ends_every_login(db, user):
+    store = RefreshTokenStore()
+    tokens = [issue(db, store, user) for _ in range(2)]
+
+    store.revoke_user(db, user.id)
+    db.commit()
+
+    for token in tokens:
+        with pytest.raises(InvalidRefreshToken):
+            RefreshTokenStore().rotate(db, token)
+    assert live_tokens(db, user) == 0
@@ -0,0 +1,80 @@
+import os
+import asyncio
+import datetime
+import pytest
+from uuid import uuid4
+
+if not os.environ.get('DB_KEY'):
+    pytest.skip('needs the database (DB_KEY)', allow_module_level=True)
+
+from services.db.database import Session, AsyncSession, async_engine
+from services.db.models import Address, ReliefEffort
+from services.search.relief_search import build_tsquery
+from routers.relief import get_relief_effort_info
+
+@pytest.fixture
+def reliefs():
+    # a word no other relief contains, so results can be checked exactly
+    tag = f'zq{uuid4().hex[:10]}'
+    today = datetime.date.today()
+    texts = {
+        'flood' : ('flood', f'Flood relief {tag}', f'Families displaced by flooding {tag}'),
+        'typhoon' : ('flood', f'Typhoon Odette {tag}', f'Rebuilding homes {tag}'),
+        'stopwords' : ('fire', f'Help us {tag}', f'Anything will do {tag}')
+    }
+
+    with Session() as db:
+        rows = {}
+        for key, (disaster_type, name, description) in texts.items():
+            rows[key] = ReliefEffort(owner_id=1, owner_type='USER', disaster_type=disaster_type, name=name, description=description,
+                                     is_active=True, start_date=today, end_date=today)
+            db.add(rows[key])
+        db.flush()
+        db.add_all([Address(owner_id=relief.id, owner_type='RELIEF', region='NCR', city='Manila', brgy='1', street='-', zipcode=1000)
+                    for relief in rows.values()])
+        db.commit()
+
+        yield (tag, {key : relief.id for key, relief in rows.items()})
+
+        db.query(Address).filter(Address.owner_type == 'RELIEF', Address.owner_id.in_([relief.id for relief in rows.values()])).delete()
+        for relief in rows.values():
+            db.delete(relief)
+        db.commit()
+
+def search(keyword:str):
+    async def run():
+        try:
+            async with AsyncSession() as db:
+                return await get_relief_effort_info(db, keyword=keyword, c=1000)
+        finally:
+            # the pool's connections belong to this event loop
+            await async_engine.dispose()
+
+    return [relief['relief_id'] for relief in asyncio.run(run())]
+
+def test_build_tsquery_matches_every_word_by_prefix():
+    assert build_tsquery('Typhoon  Ode!') == 'typhoon:* & ode:*'
+
+@pytest.mark.parametrize('keyword', [None, '', '  ', '!?'])
+def test_build_tsquery_without_words(keyword):
+    assert build_tsquery(keyword) is None
+
+def test_keywords_match_stemmed_words(reliefs):
+    tag, ids = reliefs
+
+    assert search(f'home {tag}') == [ids['typhoon']]
+    assert search(f'typh {tag}') == [ids['typhoon']]
+
+def test_results_are_ranked_by_relevance(reliefs):
+    tag, ids = reliefs
+
+    # named and described as a flood relief, not only typed as one
+    assert search(f'flood {tag}') == [ids['flood'], ids['typhoon']]
+
+def test_stopword_keywords_still_match(reliefs):
+    tag, ids = reliefs
+
+    # both are stopwords, which the english configuration drops
+    found = search('will do')
+    assert ids['stopwords'] in found
+    assert ids['flood'] not in found and ids['typhoon'] not in found
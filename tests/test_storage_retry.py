@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+import cloudinary.uploader
+from cloudinary.exceptions import Error, NotFound
+from services.storage import file_handler
+from services.storage.backends import CloudinaryBackend, UploaderConnectionError
+from services.storage.file_handler import FileHandler, STORAGE_RETRIES
+
+@pytest.fixture(autouse=True)
+def offline_cloudinary(monkeypatch):
+    monkeypatch.setenv('CLOUDINARY_CLOUD_NAME', 'relieph-test')
+
+    async def sleep(seconds):
+        pass
+    monkeypatch.setattr(file_handler.asyncio, 'sleep', sleep)
+
+def failing(failures:int, error:Exception, result = None):
+    calls = []
+
+    def fn(*args, **kwargs):
+        calls.append(args)
+        if len(calls) <= failures:
+            raise error
+        return result
+
+    return (fn, calls)
+
+def test_upload_retries_uploader_errors(monkeypatch):
+    upload, calls = failing(2, Error('Socket error: timeout'), {'version': 1, 'format': 'webp'})
+    monkeypatch.setattr(cloudinary.uploader, 'upload', upload)
+    handler = FileHandler(CloudinaryBackend())
+
+    url = asyncio.run(handler.call(handler.backend.upload, file_handler.BytesIO(b'data'), 'relieph/users/1', 'webp', idempotent=True))
+
+    assert len(calls) == 3
+    assert url.endswith('/v1/relieph/users/1.webp')
+
+def test_uploads_are_retried_only_when_idempotent(monkeypatch):
+    upload, calls = failing(1, Error('Socket error: timeout'))
+    monkeypatch.setattr(cloudinary.uploader, 'upload', upload)
+    handler = FileHandler(CloudinaryBackend())
+
+    with pytest.raises(UploaderConnectionError):
+        asyncio.run(handler.call(handler.backend.upload, file_handler.BytesIO(b'data'), 'relieph/users/1', 'webp'))
+
+    assert len(calls) == 1
+
+def test_upload_does_not_retry_errors_the_api_reports(monkeypatch):
+    upload, calls = failing(1, Error('Invalid image file'))
+    monkeypatch.setattr(cloudinary.uploader, 'upload', upload)
+    handler = FileHandler(CloudinaryBackend())
+
+    with pytest.raises(Error):
+        asyncio.run(handler.call(handler.backend.upload, file_handler.BytesIO(b'data'), 'relieph/users/1', 'webp', idempotent=True))
+
+    assert len(calls) == 1
+
+def test_delete_gives_up_after_retries(monkeypatch):
+    destroy, calls = failing(STORAGE_RETRIES + 1, Error('Unexpected error - ReadTimeoutError()'))
+    monkeypatch.setattr(cloudinary.uploader, 'destroy', destroy)
+    handler = FileHandler(CloudinaryBackend())
+
+    with pytest.raises(Error):
+        asyncio.run(handler.call(handler.backend.delete, 'relieph/users/1', idempotent=True))
+
+    assert len(calls) == STORAGE_RETRIES + 1
+
+def test_lookups_do_not_retry_missing_files(monkeypatch):
+    backend = CloudinaryBackend()
+    resolve, calls = failing(1, NotFound('Resource not found'))
+    monkeypatch.setattr(backend, 'resolve', resolve)
+    handler = FileHandler(backend)
+
+    with pytest.raises(NotFound):
+        asyncio.run(handler.call(backend.resolve, 'relieph/users/1'))
+
+    assert len(calls) == 1